@@ -127,3 +127,40 @@ STATICFILES_DIRS = (
     os.path.join(BASE_DIR, 'static'),
 )
 
+# Job queue
+# getdxf jobs run on this many threads of the web process, 0 when `manage.py run_jobs` workers are used
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# seconds getdxf waits for its job before answering 202 with the job id, keep below the gunicorn worker timeout (30 s)
+JOB_WAIT_TIMEOUT = int(os.environ.get('JOB_WAIT_TIMEOUT', 20))
+
+
+# Blob storage
+# one pooled client per container, `memory://` runs against an in-process fake, an Azurite connection string against the emulator
+# no default, the account key is a secret: storage calls raise ImproperlyConfigured while it is unset
+
+AZURE_STORAGE_CONNECTION_STRING = os.environ.get('AZURE_STORAGE_CONNECTION_STRING')
+AZURE_STORAGE_CONTAINER = os.environ.get('AZURE_STORAGE_CONTAINER', 'files')
+BLOB_POOL_SIZE = int(os.environ.get('BLOB_POOL_SIZE', 32))
+# blobs larger than BLOB_SINGLE_SIZE move as BLOB_CHUNK_SIZE ranged GETs / staged blocks, BLOB_MAX_CONCURRENCY at a time
+BLOB_MAX_CONCURRENCY = int(os.environ.get('BLOB_MAX_CONCURRENCY', 4))
+BLOB_CHUNK_SIZE = int(os.environ.get('BLOB_CHUNK_SIZE', 4 * 1024 * 1024))
+BLOB_SINGLE_SIZE = int(os.environ.get('BLOB_SINGLE_SIZE', 8 * 1024 * 1024))
+
+
+# Result cache
+# getdxf results are kept in a per-process LRU and in the DrawingResult table, `manage.py purge_results` drops rows older than the TTL
+
+RESULT_STORE_TTL = int(os.environ.get('RESULT_STORE_TTL', 30 * 24 * 3600))
+# getdxf responses carry an ETag of the source version and options, caches revalidate with If-None-Match
+GETDXF_CACHE_CONTROL = os.environ.get('GETDXF_CACHE_CONTROL', 'public, max-age=0, must-revalidate')
+
+
+# CloudConvert
+# .ai sources are converted once per content and cached in the blob container; while a conversion runs its job goes back
+# to the queue, CloudConvert calls CLOUDCONVERT_CALLBACK_BASE/cloudconvert/callback/<job> when done (unset: polling only)
+# no default for the key, converting raises ImproperlyConfigured while it is unset
+
+CLOUDCONVERT_API_KEY = os.environ.get('CLOUDCONVERT_API_KEY')
+CLOUDCONVERT_ENDPOINT = os.environ.get('CLOUDCONVERT_ENDPOINT')
+CLOUDCONVERT_CALLBACK_BASE = os.environ.get('CLOUDCONVERT_CALLBACK_BASE')
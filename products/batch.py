@@ -0,0 +1,83 @@
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .raster import RASTER_WORKERS, _get_pool
+from .readFile import getSource, processSource, publishResult
+
+BATCH_IO_WORKERS = 8 # download / upload threads per batch
+BATCH_MAX_URLS = 1000
+BATCH_SOURCES_PER_WORKER = 2 # downloaded sources held per process pool worker, bounds the batch memory
+
+#============ Batch pipeline part ==============
+
+def process_batch(urls, tiles = None, io_workers = BATCH_IO_WORKERS, workers = None) :
+    """
+    Run init for many urls as a pipeline: downloads and uploads on I/O
+    threads, parsing and metrics in the process pool. Each url moves to
+    the next stage as soon as its previous one is done. At most
+    BATCH_SOURCES_PER_WORKER sources per pool worker are downloaded and
+    not yet parsed, the next download starts when one is.
+
+    :returns: generator of init data sets with the extra Source_Url, in
+        completion order; a failed url yields Source_Url and Error only
+    """
+    results = queue.Queue()
+    io = ThreadPoolExecutor(max_workers = io_workers)
+    workers = workers or RASTER_WORKERS or os.cpu_count()
+    cpu = _get_pool(workers)
+    pending = iter(urls)
+    lock = threading.Lock()
+    closed = threading.Event()
+
+    def fail(url, exc) :
+        results.put({"Source_Url" : url, "Error" : "%s: %s" % (type(exc).__name__, exc)})
+
+    def then(future, url, next_stage, holds_source = False) :
+        try :
+            next_stage(future.result())
+        except Exception as exc :
+            if holds_source :
+                start_next()
+            fail(url, exc)
+
+    def start_next() :
+        with lock :
+            url = None if closed.is_set() else next(pending, None)
+        if url is not None :
+            io.submit(fetch, url).add_done_callback(lambda f : then(f, url, lambda source : downloaded(url, source), True))
+
+    def fetch(url) :
+        # bytes cross into the process pool, a spooled file does not pickle
+        name, src = getSource(url)
+        with src :
+            return name, src.read()
+
+    def downloaded(url, source) :
+        cpu.submit(processSource, source, tiles).add_done_callback(lambda f : then(f, url, lambda result : computed(url, result), True))
+
+    def computed(url, result) :
+        # the source is parsed, its slot goes to the next download
+        start_next()
+        io.submit(publishResult, result, url).add_done_callback(lambda f : then(f, url, lambda data_set : published(url, data_set)))
+
+    def published(url, data_set) :
+        data_set["Source_Url"] = url
+        results.put(data_set)
+
+    for _ in range(BATCH_SOURCES_PER_WORKER * workers) :
+        start_next()
+
+    try :
+        for _ in urls :
+            yield results.get()
+    finally :
+        # a client that hung up does not block the response, running stages finish on their own
+        closed.set()
+        io.shutdown(wait = False)
+
+def ndjson_batch(urls, tiles = None) :
+    for data_set in process_batch(urls, tiles) :
+        yield json.dumps(data_set) + '\n'
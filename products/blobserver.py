@@ -0,0 +1,219 @@
+import base64
+import hashlib
+import re
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+ACCOUNT = 'devstoreaccount1'
+# well known development storage key of the Azurite emulator, requests are not checked against it
+ACCOUNT_KEY = 'Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=='
+
+# x-ms-blob-* request headers kept with the blob and answered as plain headers
+CONTENT_HEADERS = {
+    'x-ms-blob-content-type' : 'Content-Type',
+    'x-ms-blob-content-md5' : 'Content-MD5',
+    'x-ms-blob-content-encoding' : 'Content-Encoding',
+    'x-ms-blob-content-language' : 'Content-Language',
+    'x-ms-blob-content-disposition' : 'Content-Disposition',
+    'x-ms-blob-cache-control' : 'Cache-Control',
+}
+
+#============ Stored blob part ==============
+
+class StoredBlob(object) :
+    def __init__(self, data, headers) :
+        self.data = data
+        self.headers = headers
+        self.etag = '"0x%s"' % hashlib.md5(data).hexdigest()[:16].upper()
+        self.modified = formatdate(usegmt = True)
+
+#============ Request handler part ==============
+
+class BlobHandler(BaseHTTPRequestHandler) :
+    """
+    The block blob calls of the storage SDK: put blob, put block, put block
+    list, get blob with ranges, get properties and delete. Containers are
+    created on first use, authentication is ignored.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args) :
+        pass
+
+    def _target(self) :
+        parts = urlsplit(self.path)
+        names = unquote(parts.path).lstrip('/').split('/', 2)
+        # /<account>/<container>/<blob>
+        container = names[1] if len(names) > 1 else ''
+        blob = names[2] if len(names) > 2 else ''
+        return (container, blob), {k : v[0] for k, v in parse_qs(parts.query).items()}
+
+    def _throttle(self, size) :
+        server = self.server
+        delay = server.latency
+        if server.bandwidth :
+            delay += size / server.bandwidth
+        if delay :
+            time.sleep(delay)
+
+    def _body(self) :
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+        self._throttle(len(data))
+        return data
+
+    def _send(self, status, headers = None, body = b'', error = None) :
+        self.send_response(status)
+        self.send_header('x-ms-version', self.headers.get('x-ms-version', '2019-12-12'))
+        self.send_header('x-ms-request-id', self.headers.get('x-ms-client-request-id', ''))
+        if error :
+            self.send_header('x-ms-error-code', error)
+        for name, value in (headers or {}).items() :
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body and self.command != 'HEAD' :
+            self.wfile.write(body)
+
+    def _blob_headers(self, blob) :
+        headers = {
+            'ETag' : blob.etag,
+            'Last-Modified' : blob.modified,
+            'x-ms-blob-type' : 'BlockBlob',
+            'x-ms-server-encrypted' : 'false',
+            'Accept-Ranges' : 'bytes',
+        }
+        for name, value in blob.headers.items() :
+            headers[CONTENT_HEADERS.get(name, name)] = value
+        headers.setdefault('Content-Type', 'application/octet-stream')
+        return headers
+
+    def do_PUT(self) :
+        key, query = self._target()
+        data = self._body()
+        server = self.server
+
+        if query.get('restype') == 'container' :
+            return self._send(201)
+        if query.get('comp') == 'block' :
+            with server.lock :
+                server.staged.setdefault(key, {})[query['blockid']] = data
+            return self._send(201, {'Content-MD5' : base64.b64encode(hashlib.md5(data).digest()).decode()})
+        if query.get('comp') == 'blocklist' :
+            ids = re.findall(r'<(?:Latest|Uncommitted|Committed)>([^<]*)</', data.decode('utf-8'))
+            with server.lock :
+                staged = server.staged.get(key, {})
+                if any(i not in staged for i in ids) :
+                    return self._send(400, error = 'InvalidBlockList')
+                data = b''.join(staged[i] for i in ids)
+                server.staged.pop(key, None)
+        elif query :
+            return self._send(400, error = 'UnsupportedQueryParameter')
+        else :
+            # like the service, a single put gets the md5 of its body as content md5
+            md5 = self.headers.get('x-ms-blob-content-md5') or base64.b64encode(hashlib.md5(data).digest()).decode()
+
+        with server.lock :
+            if self.headers.get('If-None-Match') == '*' and key in server.blobs :
+                return self._send(409, error = 'BlobAlreadyExists')
+            headers = {name : self.headers[name] for name in CONTENT_HEADERS if self.headers.get(name)}
+            headers.update((name.lower(), value) for name, value in self.headers.items() if name.lower().startswith('x-ms-meta-'))
+            if not query :
+                headers['x-ms-blob-content-md5'] = md5
+            blob = server.blobs[key] = StoredBlob(data, headers)
+        return self._send(201, {'ETag' : blob.etag, 'Last-Modified' : blob.modified,
+            'Content-MD5' : base64.b64encode(hashlib.md5(data).digest()).decode(),
+            'x-ms-request-server-encrypted' : 'false'})
+
+    def do_GET(self) :
+        key, query = self._target()
+        blob = self.server.blobs.get(key)
+        if blob is None :
+            return self._send(404, error = 'BlobNotFound')
+
+        headers = self._blob_headers(blob)
+        size = len(blob.data)
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('x-ms-range') or self.headers.get('Range') or '')
+        if not match :
+            self._throttle(size)
+            return self._send(200, headers, blob.data)
+
+        start = int(match.group(1))
+        if start >= size :
+            headers['Content-Range'] = 'bytes */%d' % size
+            return self._send(416, headers, error = 'InvalidRange')
+        end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+        chunk = blob.data[start:end + 1]
+        headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+        self._throttle(len(chunk))
+        return self._send(206, headers, chunk)
+
+    def do_HEAD(self) :
+        key, query = self._target()
+        blob = self.server.blobs.get(key)
+        if blob is None :
+            return self._send(404, error = 'BlobNotFound')
+        headers = self._blob_headers(blob)
+        self.send_response(200)
+        for name, value in headers.items() :
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(blob.data)))
+        self.end_headers()
+
+    def do_DELETE(self) :
+        key, query = self._target()
+        with self.server.lock :
+            if self.server.blobs.pop(key, None) is None :
+                return self._send(404, error = 'BlobNotFound')
+        return self._send(202)
+
+#============ Server part ==============
+
+class BlobServer(ThreadingHTTPServer) :
+    """
+    Local stand-in for the blob endpoint, for benchmarks and tests without
+    an account. `latency` seconds are added to every request and each
+    connection is held to `bandwidth` bytes per second, so the effect of
+    parallel streams shows like against a remote account.
+
+        with BlobServer(latency = 0.02, bandwidth = 20e6) as server :
+            settings.AZURE_STORAGE_CONNECTION_STRING = server.connection_string
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host = '127.0.0.1', port = 0, latency = 0.0, bandwidth = None) :
+        super(BlobServer, self).__init__((host, port), BlobHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.blobs = {}
+        self.staged = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def connection_string(self) :
+        host, port = self.server_address[:2]
+        return ('DefaultEndpointsProtocol=http;AccountName=%s;AccountKey=%s;BlobEndpoint=http://%s:%d/%s;'
+            % (ACCOUNT, ACCOUNT_KEY, host, port, ACCOUNT))
+
+    def start(self) :
+        self.thread = threading.Thread(target = self.serve_forever, name = 'blob-server', daemon = True)
+        self.thread.start()
+        return self
+
+    def stop(self) :
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None :
+            self.thread.join()
+
+    def __enter__(self) :
+        return self.start()
+
+    def __exit__(self, *exc) :
+        self.stop()
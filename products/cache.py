@@ -0,0 +1,171 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+from django.utils import timezone
+
+RESULT_CACHE_ENTRIES = 1024
+RESULT_CACHE_BYTES = 32 * 1024 * 1024
+RESULT_CACHE_AGE = 24 * 3600 # seconds a result is served after it was computed
+RESULT_STORE_TTL = 30 * 24 * 3600 # seconds a DrawingResult row is served, `manage.py purge_results` removes older ones
+
+_db_stats = {"hits" : 0, "misses" : 0, "errors" : 0}
+_db_lock = threading.Lock()
+
+#============ Key part ==============
+
+def result_key(*parts) :
+    """ Stable hex key of JSON serializable parts, dict keys are sorted. """
+    return hashlib.sha256(json.dumps(parts, sort_keys = True, separators = (',', ':')).encode('utf-8')).hexdigest()
+
+def result_etag(key) :
+    """ Strong HTTP ETag of the result of key (url, source version, options hash). """
+    return '"%s"' % result_key(*key)[:32]
+
+#============ LRU part ==============
+
+class LruCache(object) :
+    """
+    Thread safe in-process LRU of str or bytes values. Least recently used
+    entries go first once there are more than `max_entries` or their total
+    length passes `max_bytes`, entries older than `max_age` seconds are
+    dropped when read.
+    """
+
+    def __init__(self, max_entries = RESULT_CACHE_ENTRIES, max_bytes = RESULT_CACHE_BYTES, max_age = RESULT_CACHE_AGE) :
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._entries = OrderedDict() # key : (value, stored at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key) :
+        """ Cached value or None, a hit makes the entry the most recently used. """
+        with self._lock :
+            entry = self._entries.get(key)
+            if entry is not None and self.max_age is not None and time.monotonic() - entry[1] > self.max_age :
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None :
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value) :
+        with self._lock :
+            if key in self._entries :
+                self._remove(key)
+            if len(value) > self.max_bytes :
+                return
+            self._entries[key] = (value, time.monotonic())
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes :
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key) :
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def clear(self) :
+        with self._lock :
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) :
+        with self._lock :
+            lookups = self.hits + self.misses
+            return {
+                "entries" : len(self._entries),
+                "bytes" : self._bytes,
+                "hits" : self.hits,
+                "misses" : self.misses,
+                "hit_rate" : self.hits / lookups if lookups else 0.0,
+                "evictions" : self.evictions,
+                "expirations" : self.expirations,
+            }
+
+    def __len__(self) :
+        return len(self._entries)
+
+# init results of this process, see readFile.cachedInit
+results = LruCache()
+
+#============ Shared store part ==============
+
+def store_ttl() :
+    return getattr(settings, 'RESULT_STORE_TTL', RESULT_STORE_TTL)
+
+def _count(name) :
+    with _db_lock :
+        _db_stats[name] += 1
+
+def stored_result(key) :
+    """ Result JSON of the DrawingResult table, None when missing, expired or the database fails. """
+    # imported late, the LRU part works without the app registry
+    from .models import DrawingResult
+
+    url, version, options_hash = key
+    try :
+        result = DrawingResult.objects.filter(url = url, version = version, options_hash = options_hash,
+            created__gte = timezone.now() - timedelta(seconds = store_ttl())).values_list('result', flat = True).first()
+    except DatabaseError :
+        _count("errors")
+        return None
+    _count("hits" if result is not None else "misses")
+    return result
+
+def store_result(key, value) :
+    from .models import DrawingResult
+
+    url, version, options_hash = key
+    data = json.loads(value)
+    fields = {
+        "result" : value,
+        "uploaded_url" : data.get("Uploaded_Url") or '',
+        "tiles_url" : data.get("Tiles_Url") or '',
+        "width" : data.get("Width"),
+        "height" : data.get("Height"),
+        "total_length" : data.get("Total_Length"),
+        "hatch_area" : data.get("Hatch_area"),
+        "created" : timezone.now(), # a recomputed expired row is served again
+    }
+    try :
+        DrawingResult.objects.update_or_create(url = url, version = version, options_hash = options_hash, defaults = fields)
+    except IntegrityError :
+        pass # stored by another worker meanwhile
+    except DatabaseError :
+        _count("errors")
+
+def get_result(key) :
+    """
+    Cached result of key (url, source version, options hash): this
+    process' LRU first, then the DrawingResult table shared by the workers.
+    A table hit is kept in the LRU.
+    """
+    key = tuple(key)
+    value = results.get(key)
+    if value is None :
+        value = stored_result(key)
+        if value is not None :
+            results.put(key, value)
+    return value
+
+def put_result(key, value) :
+    key = tuple(key)
+    results.put(key, value)
+    store_result(key, value)
+
+def stats() :
+    with _db_lock :
+        return {"memory" : results.stats(), "database" : dict(_db_stats)}
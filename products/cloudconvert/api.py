@@ -119,8 +119,8 @@ class Api(object):
             for key, value in content.items():
                 if key == 'file':
                     x= ""
-                if isinstance(value, fileInstance):
-                    ## if it is file: remove from content dict and add it to files dict
+                if isinstance(value, fileInstance) or hasattr(value, 'read') or (isinstance(value, tuple) and hasattr(value[-1], 'read')):
+                    ## if it is file, stream or (filename, stream): remove from content dict and add it to files dict
                     isupload = True
                     files = {key: value}
                     del content[key]
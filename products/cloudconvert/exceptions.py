@@ -23,3 +23,6 @@ class InvalidResponse(APIError):
 class InvalidParameterException(APIError):
     """Raised when request contains bad parameters."""
 
+
+class ConversionTimeout(APIError):
+    """Raised when a Process did not finish before the wait deadline."""
@@ -3,7 +3,8 @@ import shutil
 import time
 
 from .exceptions import (
-    APIError, HTTPError, BadRequest, ConversionFailed, TemporaryUnavailable, InvalidResponse, InvalidParameterException
+    APIError, HTTPError, BadRequest, ConversionFailed, TemporaryUnavailable, InvalidResponse, InvalidParameterException,
+    ConversionTimeout
 )
 
 
@@ -61,19 +62,38 @@ class Process(object):
 
 
 
-    def wait(self, interval = 1):
+    def wait(self, interval = 1, backoff = 1, max_interval = None, timeout = None):
         """
         Waits for the Process to finish (or end with an error). Checks the conversion status every interval seconds.
-        :param int interval: Interval in seconds
+        :param int interval: Interval in seconds before the first check
+        :param float backoff: Factor the interval grows by after every check, 1 keeps it fixed
+        :param int max_interval: Upper bound of the interval in seconds
+        :param int timeout: Seconds after which ConversionTimeout is raised, None waits as long as it takes
         :raises APIError: if the CloudConvert API returns an error
         """
-        while self['step']!='finished' and self['step'] !='error':
-            self.refresh()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self.finished():
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ConversionTimeout("Process did not finish within %s seconds" % timeout)
+                interval = min(interval, remaining)
             time.sleep(interval)
+            self.refresh()
+            interval = interval * backoff
+            if max_interval is not None:
+                interval = min(interval, max_interval)
 
         return self
 
 
+    def finished(self):
+        """
+        True once the Process finished or ended with an error
+        """
+        return self.data.get('step') in ('finished', 'error')
+
+
 
     def download(self, localfile = None, remotefile = None):
         """
@@ -105,6 +125,23 @@ class Process(object):
         return self
 
 
+    def downloadStream(self, stream, remotefile = None):
+        """
+        Download process file from API into a writable binary stream
+        :param stream: file object the file is written to
+        :param str remotefile: Remote file name which should be downloaded (if there are multiple output files available)
+        :raises APIError: if the CloudConvert API returns an error
+        """
+        if 'url' not in self.data.get('output', {}):
+            raise APIError("There is no output file available (yet)")
+
+        r = self.api.rawCall("GET", self['output']['url'] + ("/" + remotefile if remotefile else ""), stream=True)
+        r.raw.decode_content = True
+        shutil.copyfileobj(r.raw, stream)
+
+        return self
+
+
     def downloadAll(self, directory = None):
         """
         Download all output process files from API
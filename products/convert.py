@@ -1,315 +1,300 @@
+import codecs
+import io
 import os
-import sys
-from math import sqrt, sin, cos, pi, fabs, radians
+import re
 
 import ezdxf
-import svgwrite
+import numpy as np
+
+from .metrics import measure
+from .spatial import FrameIndex
+from .svgstream import SvgStream, CompactSvgStream, SvgTee, ByteCounter, CompressedWriter, write_empty_svg, arc_segments, ellipse_segments, spline_segments
+
+BINARY_DXF_SENTINEL = b'AutoCAD Binary DXF\r\n\x1a\x00'
 
 LAYER = 'svgframe'
 SVG_MAXSIZE = 512
-SCALE = 1.0
+SVG_SIMPLIFY = 0.5 # polyline tolerance in svg pixels, None keeps every vertex
 
 #============= Initializing part ==============
 
 def get_dxf_dwg_from_file(dxffilepath) :
+    if isinstance(dxffilepath, DrawingContext) :
+        return dxffilepath.dxf
+    if is_stream(dxffilepath) :
+        return read_dxf_stream(dxffilepath)
+    if not isinstance(dxffilepath, str) :
+        # already loaded ezdxf document
+        return dxffilepath
     return ezdxf.readfile(dxffilepath)
 
-def get_clear_svg(minx = -50, miny = -50, width = 100, height = 100) :
-    svg = svgwrite.Drawing(size = (SVG_MAXSIZE, SVG_MAXSIZE), viewBox = "%s %s %s %s"%(minx, miny, width, height))
-    return svg
+def is_stream(obj) :
+    # an ezdxf Drawing has a `read` classmethod too, a seekable file object is what read_dxf_stream needs
+    return hasattr(obj, 'read') and hasattr(obj, 'seek')
+
+def read_dxf_stream(stream, errors = 'surrogateescape') :
+    """
+    Load a DXF document from a binary stream like ezdxf.readfile does from
+    a file: binary DXF is detected, the text encoding is read from the header.
+    """
+    from ezdxf.document import Drawing
+    from ezdxf.filemanagement import dxf_stream_info
+    from ezdxf.lldxf.tagger import binary_tags_loader
+
+    stream.seek(0)
+    if stream.read(len(BINARY_DXF_SENTINEL)) == BINARY_DXF_SENTINEL :
+        stream.seek(0)
+        return Drawing.load(binary_tags_loader(stream.read(), errors = errors))
+
+    stream.seek(0)
+    info = dxf_stream_info(codecs.getreader('utf-8')(stream, errors = 'ignore'))
+    stream.seek(0)
+    return ezdxf.read(codecs.getreader(info.encoding)(stream, errors = errors))
+
+def get_drawing_context(dxffilepath) :
+    if isinstance(dxffilepath, DrawingContext) :
+        return dxffilepath
+    return DrawingContext(dxffilepath)
 
-def get_empty_svg(alerttext = '! nothing to display !') :
-    svg = svgwrite.Drawing(size = (SVG_MAXSIZE, SVG_MAXSIZE), viewBox = "0 0 %s %s"%(SVG_MAXSIZE, SVG_MAXSIZE))
-    svg.add(svgwrite.Drawing().text(alerttext, insert = [50, 50], font_size = 20))
-    return svg
-    
 #========== Drawing Part ==============
 
-def trans_line(dxf_entity) :
-    line_start = dxf_entity.dxf.start[:2]
-    line_end = dxf_entity.dxf.end[:2]
-    svg_entity = svgwrite.Drawing().line(start = line_start, end = line_end, stroke = "black", stroke_width = 1.0/SCALE )
-    svg_entity.scale(SCALE, -SCALE)
-    return svg_entity
-
-def trans_circle(dxf_entity) :
-    circle_center = dxf_entity.dxf.center[:2]
-    circle_radius = dxf_entity.dxf.radius
-    svg_entity = svgwrite.Drawing().circle(center = circle_center, r = circle_radius, stroke = "black", fill = "none", stroke_width = 1.0/SCALE )
-    svg_entity.scale(SCALE, -SCALE)
-    return svg_entity
-
-def trans_arc(dxf_entity, dwg) :
-    start_x = dxf_entity.dxf.center[0]
-    start_y = dxf_entity.dxf.center[1]
-    radius = dxf_entity.dxf.radius
-    
-    degree0 = dxf_entity.dxf.end_angle
-    degree1 = dxf_entity.dxf.start_angle
-    radians0 = radians(degree0)
-    radians1 = radians(degree1)
-    dx0 = radius*(sin(radians0))
-    dy0 = radius*(cos(radians0))
-    dx1 = radius*(sin(radians1))
-    dy1 = radius*(cos(radians1))
-
-    m0 = dy0 + start_x
-    n0 = dx0 + start_y
-    m1 = -dy0 + dy1
-    n1 = -dx0 + dx1
-    
-    svg_entity = dwg.path(d = "M {0},{1} a {2},{2} 0 0,0 {3},{4}".format(m0, n0, radius, m1, n1),
-            fill = "none", 
-            stroke = "black",
-            stroke_width = 1.0 / SCALE
-        )
-
-    svg_entity.scale(SCALE,-SCALE)
-    return svg_entity
-
-def trans_spline(dxf_entity, dwg) :
-    ctrlPoints = dxf_entity.control_points
-    ctrlCnt = dxf_entity.control_point_count
-
-    strPath = ""
-    for i in range(ctrlCnt) :
-        if i == 0 :
-            strPath += "M " + str(ctrlPoints[i][0]) + " " + str(ctrlPoints[i][1]) + " C "
-        else :
-            strPath += str(ctrlPoints[i][0]) + " " + str(ctrlPoints[i][1]) + ", "
-        
-    svg_entity = dwg.path(d = strPath, fill = "none", stroke = "black", stroke_width = 1.0 / SCALE)
-
-    svg_entity.scale(SCALE, -SCALE)
-    return svg_entity
-
-def trans_ellipse(dxf_entity, dwg) :
-    tmp = dxf_entity.to_spline(False)
-    ctrlPoints = tmp.control_points
-    ctrlCnt = tmp.control_point_count
-
-    strPath = ""
-    for i in range(ctrlCnt) :
-        if i == 0 :
-            strPath += "M " + str(ctrlPoints[i][0]) + " " + str(ctrlPoints[i][1]) + " C "
-        else :
-            strPath += str(ctrlPoints[i][0]) + " " + str(ctrlPoints[i][1]) + ", "
-        
-    svg_entity = dwg.path(d = strPath, fill = "none", stroke = "black", stroke_width = 1.0 / SCALE)
-
-    svg_entity.scale(SCALE, -SCALE)
-    del tmp
-    return svg_entity
-
-def trans_text(dxf_entity) :
-    text_text = dxf_entity.dxf.text
-    text_insert = dxf_entity.dxf.insert[:2]
-    text_height = dxf_entity.dxf.height * 1.4 # hotfix - 1.4 to fit svg and dvg
-    svg_entity = svgwrite.Drawing().text(text_text, insert = [0, 0], font_size = text_height * SCALE)
-    svg_entity.translate(text_insert[0]*(SCALE), -text_insert[1]*(SCALE))
-    return svg_entity
-
-def trans_polyline(dxf_entity) :
-    points = [(vert.dxf.location[0], vert.dxf.location[1]) for vert in dxf_entity.vertices]
-    
-    svg_entity = svgwrite.Drawing().polyline(points = points, stroke = 'black', fill = 'none', stroke_width = 1.0/SCALE)
-    svg_entity.scale(SCALE, -SCALE)
-    return svg_entity
+def write_line(svg, dxf_entity) :
+    start, end = dxf_entity.dxf.start, dxf_entity.dxf.end
+    svg.line(start[0], start[1], end[0], end[1])
 
-def trans_lwpolyline(dxf_entity) :
-    points = [(pt[0], pt[1]) for pt in dxf_entity.get_points("xy")]
-    
-    svg_entity = svgwrite.Drawing().polyline(points = points, stroke = 'black', fill = 'none', stroke_width = 1.0/SCALE)
-    svg_entity.scale(SCALE, -SCALE)
-    return svg_entity
+def write_circle(svg, dxf_entity) :
+    center = dxf_entity.dxf.center
+    svg.circle(center[0], center[1], dxf_entity.dxf.radius)
+
+def write_arc(svg, dxf_entity) :
+    center = dxf_entity.dxf.center
+    svg.arcs(*arc_segments(center[0], center[1], dxf_entity.dxf.radius, dxf_entity.dxf.start_angle, dxf_entity.dxf.end_angle))
+
+def write_spline(svg, dxf_entity) :
+    segments = spline_segments(dxf_entity)
+    if segments :
+        svg.curves(*segments)
+
+def write_ellipse(svg, dxf_entity) :
+    svg.arcs(*ellipse_segments(dxf_entity))
+
+def write_text(svg, dxf_entity) :
+    insert = dxf_entity.dxf.insert
+    svg.text(dxf_entity.dxf.text, insert[0], insert[1], dxf_entity.dxf.height * 1.4) # hotfix - 1.4 to fit svg and dvg
+
+def write_polyline(svg, dxf_entity) :
+    svg.polyline([vert.dxf.location[:2] for vert in dxf_entity.vertices])
+
+def write_lwpolyline(svg, dxf_entity) :
+    # packed as x, y, start width, end width, bulge
+    svg.polyline(np.array(dxf_entity.lwpoints.values, dtype = np.float64).reshape(-1, 5)[:, :2])
+
+SVG_WRITERS = {
+    'LINE' : write_line,
+    'POLYLINE' : write_polyline,
+    'LWPOLYLINE' : write_lwpolyline,
+    'CIRCLE' : write_circle,
+    'TEXT' : write_text,
+    'ARC' : write_arc,
+    'SPLINE' : write_spline,
+    'ELLIPSE' : write_ellipse,
+}
+
+#============ Drawing context part ===============
+
+class DrawingContext(object) :
+    """
+    Request scoped drawing. The DXF file is parsed once, and the filtered
+    entities and frame bbox are computed once per frame name, then shared by
+    the svg, hatch and metrics stages.
+    """
+
+    def __init__(self, dxf, filepath = None) :
+        """
+        :param dxf: DXF file path, binary stream or an already loaded ezdxf document
+        :param str filepath: file name used to derive output names, defaults to the document file name
+        """
+        if isinstance(dxf, str) :
+            filepath = dxf
+            dxf = ezdxf.readfile(dxf)
+        elif is_stream(dxf) :
+            dxf = read_dxf_stream(dxf)
+        dxf.header['$INSUNITS'] = 1
+
+        self.dxf = dxf
+        self.filepath = filepath if filepath is not None else dxf.filename
+        self.msp = dxf.modelspace()
+        self._filtered = {}
+        self._metrics = None
+        self._frames = None
+
+    @property
+    def metrics(self) :
+        # one walk over the modelspace for extents, length, counts and filter bbox
+        if self._metrics is None :
+            self._metrics = measure(self.msp, LAYER)
+        return self._metrics
+
+    @property
+    def frames(self) :
+        # spatial index of the named frames and entity anchors, built on first frame lookup
+        if self._frames is None :
+            self._frames = FrameIndex(self.metrics.geometry)
+        return self._frames
+
+    def filter_frames(self) :
+        # every named frame at once, each entity is assigned to its frames in a single sweep
+        rects = self.frames.frame_rects()
+        for frame_name, entities in self.frames.assign(rects).items() :
+            self._filtered[frame_name] = (entities, rects[frame_name])
+        self.frame_names = list(rects)
+        return self.frame_names
+
+    def filter(self, frame_name = None) :
+        if frame_name not in self._filtered :
+            frames = self.frames if frame_name else None
+            self._filtered[frame_name] = filter_entities(self.dxf, frame_name, self.metrics, frames)
+        return self._filtered[frame_name]
 
 #============ Dxf Entity Filtering part ===============
 
 def entity_filter(dxffilepath, frame_name = None) :
-    dxf = get_dxf_dwg_from_file(dxffilepath)
-    
-    frame_rect_entity = None
-    name_text_entity = None
-    
-    if frame_name:
-        for e in dxf.modelspace():
-            if e.dxftype() == 'TEXT' and e.dxf.layer == LAYER:
-                if e.dxf.text == frame_name:
-                    name_text_entity = e
-    if name_text_entity:
-        text_point = name_text_entity.dxf.insert[:2]
-        text_height = name_text_entity.dxf.height
-        for e in dxf.modelspace():
-            if e.dxftype() == 'LWPOLYLINE' and e.dxf.layer == LAYER:
-                points = list(e.get_rstrip_points())
-                for p in points:
-                    dist = sqrt((p[0] - text_point[0])**2+(p[1] - text_point[1])**2)
-                    if dist < 1.0 * text_height:
-                        frame_rect_entity = e
-    
-    if frame_rect_entity and name_text_entity:
-        frame_points = list(frame_rect_entity.get_rstrip_points())
-        entitys_in_frame = []
-        xmin = min([i[0] for i in frame_points])
-        xmax = max([i[0] for i in frame_points])
-        ymin = min([i[1] for i in frame_points])
-        ymax = max([i[1] for i in frame_points])
-        for e in dxf.modelspace():
-            point = None 
-            if e.dxftype() == 'LINE': point = e.dxf.start[:2]
-            if e.dxftype() == 'CIRCLE': point = e.dxf.center[:2]
-            if e.dxftype() == 'TEXT': point = e.dxf.insert[:2]
-            if e.dxftype() == 'ARC':
-                center = e.dxf.center[:2]
-                radius = e.dxf.radius
-                start_angle = radians(e.dxf.start_angle)
-                delta_x = radius * cos(start_angle)
-                delta_y = radius * sin(start_angle)
-                point = (center[0] + delta_x, center[1] + delta_y)
-            if point:
-                if (xmin <= point[0] <= xmax) and (ymin <= point[1] <= ymax):
-                    if not e.dxf.layer == LAYER:
-                        entitys_in_frame.append(e)
-        return entitys_in_frame, [xmin, xmax, ymin, ymax]
-    elif frame_name:
-        return [], [300, 600, 300, 600]
-    elif not frame_name:
-        entitys = []
-        xmin = 99999
-        xmax = 0
-        ymin = 99999
-        ymax = 0
-        for e in dxf.modelspace():
-            if not e.dxf.layer == LAYER :
-                entitys.append(e)
-                if e.dxftype() == 'LINE' : 
-                    xmin = min(xmin, e.dxf.start[0], e.dxf.end[0])
-                    xmax = max(xmax, e.dxf.start[0], e.dxf.end[0])
-                    ymin = min(ymin, e.dxf.start[1], e.dxf.end[1])
-                    ymax = max(ymax,  e.dxf.start[1], e.dxf.end[1])
-                if e.dxftype() == 'CIRCLE' :
-                    xmin = min(xmin, e.dxf.center[0] - e.dxf.radius)
-                    xmax = max(xmax, e.dxf.center[0] + e.dxf.radius)
-                    ymin = min(ymin, e.dxf.center[1] - e.dxf.radius)
-                    ymax = max(ymax,  e.dxf.center[1] + e.dxf.radius)              
-                if e.dxftype() == 'TEXT':
-                    xmin = min(xmin, e.dxf.insert[0])
-                    xmax = max(xmax, e.dxf.insert[0])
-                    ymin = min(ymin, e.dxf.insert[1])
-                    ymax = max(ymax, e.dxf.insert[1])
-                if e.dxftype() == 'ARC' :
-                    sx = e.dxf.center[0] + cos(radians(e.dxf.start_angle)) * e.dxf.radius
-                    ex = e.dxf.center[0] + cos(radians(e.dxf.end_angle)) * e.dxf.radius
-                    sy = e.dxf.center[1] + sin(radians(e.dxf.start_angle)) * e.dxf.radius
-                    ey = e.dxf.center[1] + sin(radians(e.dxf.end_angle)) * e.dxf.radius
-                    
-                    xmin = min(xmin, sx, ex)
-                    xmax = max(xmax, sx, ex)
-                    if e.dxf.start_angle <= 360 and e.dxf.end_angle >= 0 :
-                        pt = e.dxf.center[0] + e.dxf.radius
-                        xmax = max(xmax, pt)
-                    if e.dxf.start_angle <=180 and e.dxf.end_angle >= 180 :
-                        pt = e.dxf.center[0] - e.dxf.radius
-                        xmin = min(xmin, pt)
-
-                    ymin = min(ymin, sy, ey)
-                    ymax = max(ymax, sy, ey)
-                    if e.dxf.start_angle <= 90 and e.dxf.end_angle >= 90 :
-                        pt = e.dxf.center[1] + e.dxf.radius
-                        ymax = max(ymax, pt)
-                    if e.dxf.start_angle <=270 and e.dxf.end_angle >= 270 :
-                        pt = e.dxf.center[1] - e.dxf.radius
-                        ymin = min(ymin, pt)
-                    
-                if e.dxftype() == 'POLYLINE':
-                    x = [p.dxf.location[0] for p in e.vertices]
-                    y = [p.dxf.location[1] for p in e.vertices]
-                    xmin = min(xmin, min(x))
-                    xmax = max(xmax, max(x))
-                    ymin = min(ymin, min(y))
-                    ymax = max(ymax, max(y))
-                if e.dxftype() == 'LWPOLYLINE':
-                    x = [p[0] for p in e.get_points("xy")]
-                    y = [p[1] for p in e.get_points("xy")]
-                    xmin = min(xmin, min(x))
-                    xmax = max(xmax, max(x))
-                    ymin = min(ymin, min(y))
-                    ymax = max(ymax, max(y))
-                if e.dxftype() == 'SPLINE' :
-                    fts = e.fit_points
-                    for i in range(fts.__len__()) :
-                        v = fts.__getitem__(i)
-                        xmin = min(xmin, v[0])
-                        xmax = max(xmax, v[0])
-                        ymin = min(ymin, v[1])
-                        ymax = max(ymax, v[1])
-                if e.dxftype() == 'ELLIPSE' :
-                    tmp = e.to_spline(False)
-                    fts = tmp.fit_points
-                    for i in range(fts.__len__()) :
-                        v = fts.__getitem__(i)
-                        xmin = min(xmin, v[0])
-                        xmax = max(xmax, v[0])
-                        ymin = min(ymin, v[1])
-                        ymax = max(ymax, v[1])
-                    del tmp
-                
-        xmargin = 0.05 * fabs(xmax - xmin)
-        ymargin = 0.05 * fabs(ymax - ymin)
-        return entitys, [xmin - xmargin, xmax + xmargin, ymin - ymargin, ymax + ymargin]
+    return get_drawing_context(dxffilepath).filter(frame_name)
+
+def filter_entities(dxf, frame_name = None, metrics = None, frames = None) :
+    if metrics is None :
+        metrics = measure(dxf.modelspace(), LAYER)
+
+    if frame_name :
+        if frames is None :
+            frames = FrameIndex(metrics.geometry)
+        rect = frames.frame_rect(frame_name)
+        if rect is None :
+            return [], [300, 600, 300, 600]
+        return frames.entities_in(rect), rect
+
+    return metrics.entities, metrics.filter_bbox()
 
 #============ Extract Svg part =============
 
-def get_svg_form_dxf(dxffilepath, frame_name = None) :
-    global SCALE
-    
-    entites_filter = entity_filter(dxffilepath, frame_name)
-    entites = entites_filter[0]
-    frame_coord = entites_filter[1]
-    
-    if not entites:
-        return get_empty_svg()
-    
+def write_svg_from_dxf(dxffilepath, out, frame_name = None, compact = False, size = None, plain_out = None) :
+    """
+    Stream the svg of the drawing or one of its frames to `out`, entity by
+    entity, memory use does not grow with the entity count. Size and scale
+    stay local, job, pipeline and batch threads write svgs concurrently.
+
+    :param out: binary or text file object
+    :param bool compact: merged relative paths on an integer grid derived from the scale
+    :param int size: svg width and height in pixels, defaults to SVG_MAXSIZE
+    :param plain_out: also gets the plain, unsimplified svg in the same pass, e.g. a ByteCounter
+    :returns: the closed stream with its polyline vertex counts, None for an empty svg
+    """
+    if size is None :
+        size = SVG_MAXSIZE
+
+    entites, frame_coord = entity_filter(dxffilepath, frame_name)
+    if not entites :
+        write_empty_svg(out, size)
+        return None
+
     minx = frame_coord[0]
     miny = -frame_coord[3]
     width = abs(frame_coord[0] - frame_coord[1])
     height = abs(frame_coord[2] - frame_coord[3])
-    SCALE = 1.0 * SVG_MAXSIZE / max(width, height)
-    
-    svg = get_clear_svg(minx * SCALE, miny * SCALE, width * SCALE, height * SCALE)
-    for e in entites:
-        if e.dxftype() == 'LINE': svg.add(trans_line(e))
-        if e.dxftype() == 'POLYLINE': svg.add(trans_polyline(e))
-        if e.dxftype() == 'LWPOLYLINE': svg.add(trans_lwpolyline(e))
-        if e.dxftype() == 'CIRCLE': svg.add(trans_circle(e))
-        if e.dxftype() == 'TEXT': svg.add(trans_text(e))
-        if e.dxftype() == 'ARC': svg.add(trans_arc(e, svg))
-        if e.dxftype() == 'SPLINE': svg.add(trans_spline(e, svg))
-        if e.dxftype() == 'ELLIPSE': svg.add(trans_ellipse(e, svg))
+    scale = 1.0 * size / max(width, height)
+
+    stream = CompactSvgStream if compact else SvgStream
+    viewbox = (minx * scale, miny * scale, width * scale, height * scale)
+    svg = stream(out, size, viewbox, scale, simplify = SVG_SIMPLIFY)
+    target = svg if plain_out is None else SvgTee(svg, SvgStream(plain_out, size, viewbox, scale))
+    try :
+        for e in entites :
+            writer = SVG_WRITERS.get(e.dxftype())
+            if writer is not None :
+                writer(target, e)
+    finally :
+        target.close()
     return svg
 
 #============ Saving Svg file ==============
 
-def save_svg_from_dxf(dxffilepath, svgfilepath = None, frame_name = None, size = 512) :
-    global SVG_MAXSIZE
-    _oldsize = SVG_MAXSIZE
-    SVG_MAXSIZE = size
+def export_svg(dxffilepath, out, frame_name = None, size = 512, compact = False, encoding = None) :
+    """
+    write_svg_from_dxf with the progress, vertex and size report, a compact
+    svg is compared with the plain one counted in the same pass.
+
+    :param out: binary file object
+    :param str encoding: 'gzip' or 'br' to compress while writing, None for plain svg
+    :returns: (svg size, bytes written to out)
+    """
+    context = get_drawing_context(dxffilepath)
+    name = os.path.basename(context.filepath or 'drawing')
     
     if frame_name :
-        print('>>making %s svgframe for %s ...'%(frame_name, os.path.basename(dxffilepath)))
+        print('>>making %s svgframe for %s ...'%(frame_name, name))
     else :
-        print('making svg for %s ...'%(os.path.basename(dxffilepath)))
+        print('making svg for %s ...'%(name))
         pass
     
-    svg = get_svg_form_dxf(dxffilepath, frame_name)
+    start = out.tell()
+    sink = CompressedWriter(out, encoding) if encoding else out
+    plain = ByteCounter() if compact else None
+    svg = write_svg_from_dxf(context, sink, frame_name, compact, size, plain)
+    if encoding :
+        sink.close()
+
+    if svg is not None and svg.vertices_in :
+        print('  polyline vertices %d -> %d'%(svg.vertices_in, svg.vertices_out))
+
+    encoded = out.tell() - start
+    written = sink.size if encoding else encoded
+    if plain is not None and svg is not None :
+        print('  svg size %d -> %d bytes (%.1f%% smaller)'%(plain.size, written, 100.0 * (plain.size - written) / max(plain.size, 1)))
+    if encoding :
+        print('  %s %d -> %d bytes (%.1f%% smaller)'%(encoding, written, encoded, 100.0 * (written - encoded) / max(written, 1)))
+
+    return written, encoded
+
+def save_svg_from_dxf(dxffilepath, svgfilepath = None, frame_name = None, size = 512, compact = False) :
+    context = get_drawing_context(dxffilepath)
+    if svgfilepath is None :
+        svgfilepath = get_svg_file_path(context.filepath)
     
+    with open(svgfilepath, 'wb') as out :
+        export_svg(context, out, frame_name, size, compact)
+
+    return svgfilepath
+
+def svg_bytes_from_dxf(dxffilepath, frame_name = None, size = 512, compact = False, encoding = None) :
+    """ The svg of save_svg_from_dxf in memory, nothing is written to disk. Compressed with `encoding` when given. """
+    out = io.BytesIO()
+    export_svg(dxffilepath, out, frame_name, size, compact, encoding)
+    return out.getvalue()
+
+def get_svg_file_path(dxffilepath, suffix = '') :
     if '.dxf' in dxffilepath :
-        svgfilepath = dxffilepath.replace('.dxf', '.svg')
+        return dxffilepath.replace('.dxf', suffix + '.svg')
     elif '.DXF' in dxffilepath :
-        svgfilepath = dxffilepath.replace('.DXF', '.svg')
-    
-    svg.saveas(svgfilepath)
-    
-    SVG_MAXSIZE = _oldsize
+        return dxffilepath.replace('.DXF', suffix + '.svg')
+    return dxffilepath + suffix + '.svg'
 
-    return svgfilepath
+def get_frame_suffix(frame_name) :
+    return '_' + re.sub(r'[^A-Za-z0-9_.-]+', '_', frame_name)
+
+#============ Saving all frames ==============
+
+def save_svgs_from_frames(dxffilepath, size = 512, compact = False) :
+    """
+    Write one svg per named frame on LAYER. Frames and their entities are
+    found in one sweep over the drawing.
+
+    :returns: {frame name : svg file path}
+    """
+    context = get_drawing_context(dxffilepath)
+    context.filter_frames()
+
+    svgfilepaths = {}
+    for frame_name in context.frame_names :
+        svgfilepath = get_svg_file_path(context.filepath, get_frame_suffix(frame_name))
+        svgfilepaths[frame_name] = save_svg_from_dxf(context, svgfilepath, frame_name, size, compact)
+    return svgfilepaths
@@ -1,6 +1,11 @@
-from .readFile import init
+from .readFile import cachedInit, initFrames
 
-def getJsonData(path) :
-    jsonResult = init(path)
+def getJsonData(path, tiles = None, key = None) :
+    jsonResult = cachedInit(path, tiles, key)
+
+    return jsonResult
+
+def getFramesJsonData(path, with_metrics = False) :
+    jsonResult = initFrames(path, with_metrics)
 
     return jsonResult
@@ -0,0 +1,138 @@
+import json
+import threading
+import uuid
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+#============ Request handler part ==============
+
+class ConvertHandler(BaseHTTPRequestHandler) :
+    """
+    The CloudConvert v1 calls of cloudconvert.Api: create a process, start
+    it with an uploaded file, refresh its status and download the output.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args) :
+        pass
+
+    def _send(self, status, data) :
+        body = json.dumps(data).encode('utf-8') if not isinstance(data, bytes) else data
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json' if not isinstance(data, bytes) else 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _process(self, path) :
+        process = self.server.processes.get(path.rsplit('/', 1)[-1])
+        if process is None :
+            self._send(404, {"error" : "process not found"})
+        return process
+
+    def do_POST(self) :
+        parts = urlsplit(self.path)
+        server = self.server
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+
+        if parts.path == '/process' :
+            id = uuid.uuid4().hex
+            server.processes[id] = {"id" : id, "step" : "input", "message" : "Waiting for upload"}
+            return self._send(200, {"id" : id, "url" : '//%s:%d/process/%s' % (server.server_address[:2] + (id, ))})
+
+        process = self._process(parts.path)
+        if process is None :
+            return
+        params = {k : v[0] for k, v in parse_qs(parts.query).items()}
+        # multipart body of requests, read back as a mime message
+        message = BytesParser(policy = policy.default).parsebytes(
+            b'Content-Type: ' + self.headers.get('Content-Type', '').encode('latin-1') + b'\r\n\r\n' + body)
+        upload = b''
+        if message.is_multipart() :
+            upload = next((part.get_payload(decode = True) for part in message.iter_parts()
+                if part.get_param('name', header = 'content-disposition') == 'file'), b'')
+        with server.lock :
+            server.uploads.append(upload)
+        process.update(step = "convert", message = "Converting", callback = params.get('callback'))
+
+        timer = threading.Timer(server.delay, server.finish, (process, ))
+        timer.daemon = True
+        timer.start()
+        return self._send(200, process)
+
+    def do_GET(self) :
+        parts = urlsplit(self.path)
+        if parts.path.startswith('/download/') :
+            process = self._process(parts.path)
+            if process is not None :
+                self._send(200, self.server.output)
+            return
+        process = self._process(parts.path)
+        if process is not None :
+            self._send(200, {k : v for k, v in process.items() if k != 'callback'})
+
+#============ Server part ==============
+
+class FakeCloudConvert(ThreadingHTTPServer) :
+    """
+    Local stand-in for CloudConvert: every process finishes `delay` seconds
+    after its upload with `output` as result file, or with an error when
+    `fail` is set. The callback url given with the start is called like the
+    service does. `uploads` keeps the uploaded files.
+
+        with FakeCloudConvert(dxf_bytes, delay = 2) as fake :
+            settings.CLOUDCONVERT_ENDPOINT = fake.endpoint
+    """
+
+    daemon_threads = True
+
+    def __init__(self, output = b'', delay = 0.5, fail = False, host = '127.0.0.1', port = 0) :
+        super(FakeCloudConvert, self).__init__((host, port), ConvertHandler)
+        self.output = output
+        self.delay = delay
+        self.fail = fail
+        self.processes = {}
+        self.uploads = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def endpoint(self) :
+        return 'http://%s:%d' % self.server_address[:2]
+
+    def finish(self, process) :
+        host, port = self.server_address[:2]
+        if self.fail :
+            process.update(step = "error", message = "Conversion failed")
+        else :
+            process.update(step = "finished", message = "Conversion finished",
+                output = {"filename" : "output.dxf", "url" : '//%s:%d/download/%s' % (host, port, process["id"])})
+        if process.get('callback') :
+            try :
+                requests.get(process['callback'], params = {"id" : process["id"], "url" : '//%s:%d/process/%s' % (host, port, process["id"])}, timeout = 10)
+            except requests.RequestException :
+                pass
+
+    def start(self) :
+        self.thread = threading.Thread(target = self.serve_forever, name = 'fake-cloudconvert', daemon = True)
+        self.thread.start()
+        return self
+
+    def stop(self) :
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None :
+            self.thread.join()
+
+    def __enter__(self) :
+        return self.start()
+
+    def __exit__(self, *exc) :
+        self.stop()
@@ -0,0 +1,328 @@
+import numpy as np
+
+SPLINE_SEGMENTS = 32
+ELLIPSE_SEGMENTS = 32
+
+#============ Sampling part ==============
+
+def spline_points(e) :
+    if len(e.fit_points) :
+        return [p[:2] for p in e.fit_points]
+    # no fit points: flatten the control point curve
+    return [p[:2] for p in e.construction_tool().approximate(SPLINE_SEGMENTS)]
+
+def ellipse_points(e) :
+    # sampled directly, ELLIPSE.to_spline() would add a SPLINE to the layout
+    return [p[:2] for p in e.vertices(e.params(ELLIPSE_SEGMENTS + 1))]
+
+def arc_points(cx, cy, r, start, end, samples = 16) :
+    """ Counter clockwise arc from start to end angle (degrees) as (samples + 1, 2) points. """
+    sweep = np.radians((end - start) % 360 or 360)
+    t = np.radians(start) + np.linspace(0, sweep, samples + 1)
+    return np.column_stack((cx + r * np.cos(t), cy + r * np.sin(t)))
+
+def bulge_points(points, bulges, closed, samples = 8) :
+    """ Polyline vertices with the bulged (arc) segments flattened into `samples` chords. """
+    n = len(points)
+    if not n or not bulges.any() :
+        return points
+    out = []
+    for i in range(n) :
+        out.append(points[i:i + 1])
+        j = i + 1 if i + 1 < n else (0 if closed else None)
+        if j is None or bulges[i] == 0 :
+            continue
+        (x0, y0), (x1, y1) = points[i], points[j]
+        theta = 4 * np.arctan(bulges[i])
+        chord = np.hypot(x1 - x0, y1 - y0)
+        if chord == 0 :
+            continue
+        r = chord / (2 * np.sin(theta / 2))
+        # center lies on the chord normal, left of the chord for positive bulges
+        mx, my = (x0 + x1) / 2, (y0 + y1) / 2
+        d = r * np.cos(theta / 2)
+        cx, cy = mx - d * (y1 - y0) / chord, my + d * (x1 - x0) / chord
+        a0 = np.arctan2(y0 - cy, x0 - cx)
+        t = a0 + theta * np.arange(1, samples) / samples
+        out.append(np.column_stack((cx + abs(r) * np.cos(t), cy + abs(r) * np.sin(t))))
+    return np.concatenate(out)
+
+#============ Simplifying part ==============
+
+def simplify_mask(points, tolerance) :
+    """
+    Douglas-Peucker: vertices to keep so that no dropped vertex is farther
+    than `tolerance` from the simplified line. All open ranges of one
+    recursion level are handled in a single vectorized pass.
+
+    :param points: (n, 2) array
+    :returns: (n, ) bool array, first and last vertex are always kept
+    """
+    n = len(points)
+    keep = np.zeros(n, dtype = bool)
+    if n :
+        keep[[0, -1]] = True
+    starts, ends = np.array([0]), np.array([n - 1])
+    while len(starts) :
+        counts = ends - starts - 1
+        inner = counts > 0
+        starts, ends, counts = starts[inner], ends[inner], counts[inner]
+        if not len(starts) :
+            break
+        first = np.cumsum(counts) - counts
+        ranges = np.repeat(np.arange(len(starts)), counts)
+        ids = np.repeat(starts + 1, counts) + np.arange(counts.sum()) - np.repeat(first, counts)
+
+        # distance to the segment, clamped to its ends so closed loops work too
+        a, b, p = points[starts[ranges]], points[ends[ranges]], points[ids]
+        ab = b - a
+        length2 = (ab * ab).sum(axis = 1)
+        t = np.clip(((p - a) * ab).sum(axis = 1) / np.where(length2 > 0, length2, 1), 0, 1)
+        d = np.hypot(*(a + ab * t[:, None] - p).T)
+
+        dmax = np.maximum.reduceat(d, first)
+        # first vertex at the maximum distance of every range
+        hits = np.nonzero(d == dmax[ranges])[0]
+        _, at = np.unique(ranges[hits], return_index = True)
+        split = dmax > tolerance
+        mids = ids[hits[at]][split]
+        keep[mids] = True
+        starts, ends = np.concatenate((starts[split], mids)), np.concatenate((mids, ends[split]))
+    return keep
+
+def simplify(points, tolerance) :
+    points = np.asarray(points, dtype = np.float64).reshape(-1, 2)
+    if len(points) < 3 :
+        return points
+    return points[simplify_mask(points, tolerance)]
+
+#============ Polyline batch part ==============
+
+class PolylineBatch(object) :
+    """
+    Flat vertex buffer of many polylines: polyline k owns
+    vertices[offsets[k]:offsets[k + 1]].
+    """
+
+    def __init__(self, chunks, bulges, closed, ids) :
+        counts = np.array([len(c) for c in chunks], dtype = np.int64)
+        self.offsets = np.zeros(len(chunks) + 1, dtype = np.int64)
+        np.cumsum(counts, out = self.offsets[1:])
+        self.vertices = np.concatenate(chunks) if chunks else np.zeros((0, 2))
+        self.bulges = np.concatenate(bulges) if bulges else np.zeros(0)
+        self.closed = np.array(closed, dtype = bool)
+        self.ids = np.array(ids, dtype = np.int64)
+
+    def __len__(self) :
+        return len(self.ids)
+
+    def counts(self) :
+        return np.diff(self.offsets)
+
+    def vertex_ids(self) :
+        return np.repeat(self.ids, self.counts())
+
+    def lengths(self) :
+        """ Length of every polyline, straight segments. """
+        v = self.vertices
+        seg = np.hypot(v[1:, 0] - v[:-1, 0], v[1:, 1] - v[:-1, 1])
+        # polyline k sums seg[offsets[k]:offsets[k + 1] - 1], which skips the
+        # segment joining it to the next polyline in the buffer
+        cumulative = np.concatenate(([0.0], np.cumsum(seg)))
+        lengths = cumulative[self.offsets[1:] - 1] - cumulative[self.offsets[:-1]]
+        closing = self.closed & (self.counts() > 1)
+        first, last = self.offsets[:-1][closing], self.offsets[1:][closing] - 1
+        lengths[closing] += np.hypot(v[first, 0] - v[last, 0], v[first, 1] - v[last, 1])
+        return lengths
+
+#============ Extraction part ==============
+
+class _Buffers(object) :
+    def __init__(self) :
+        self.lines, self.line_ids = [], []
+        self.arcs, self.arc_ids = [], []
+        self.circles, self.circle_ids = [], []
+        self.texts, self.text_ids = [], []
+        self.poly_chunks, self.poly_bulges, self.poly_closed, self.poly_ids = [], [], [], []
+        self.curve_chunks, self.curve_ids = [], []
+
+def extract_line(e, i, buf) :
+    s, t = e.dxf.start, e.dxf.end
+    buf.lines.extend((s[0], s[1], t[0], t[1]))
+    buf.line_ids.append(i)
+
+def extract_arc(e, i, buf) :
+    c = e.dxf.center
+    buf.arcs.extend((c[0], c[1], e.dxf.radius, e.dxf.start_angle, e.dxf.end_angle))
+    buf.arc_ids.append(i)
+
+def extract_circle(e, i, buf) :
+    c = e.dxf.center
+    buf.circles.extend((c[0], c[1], e.dxf.radius))
+    buf.circle_ids.append(i)
+
+def extract_text(e, i, buf) :
+    p = e.dxf.insert
+    buf.texts.extend((p[0], p[1]))
+    buf.text_ids.append(i)
+
+def extract_lwpolyline(e, i, buf) :
+    # LWPOLYLINE keeps its points packed as x, y, start width, end width, bulge
+    values = np.array(e.lwpoints.values, dtype = np.float64).reshape(-1, 5)
+    if not len(values) :
+        return
+    buf.poly_chunks.append(values[:, :2])
+    buf.poly_bulges.append(values[:, 4])
+    buf.poly_closed.append(bool(e.closed))
+    buf.poly_ids.append(i)
+
+def extract_polyline(e, i, buf) :
+    points = np.array([v.dxf.location[:2] for v in e.vertices], dtype = np.float64).reshape(-1, 2)
+    if not len(points) :
+        return
+    buf.poly_chunks.append(points)
+    buf.poly_bulges.append(np.array([v.dxf.bulge for v in e.vertices], dtype = np.float64))
+    buf.poly_closed.append(bool(e.is_closed))
+    buf.poly_ids.append(i)
+
+def extract_curve(sampler) :
+    def extract(e, i, buf) :
+        points = np.array(sampler(e), dtype = np.float64).reshape(-1, 2)
+        if not len(points) :
+            return
+        buf.curve_chunks.append(points)
+        buf.curve_ids.append(i)
+    return extract
+
+EXTRACTORS = {
+    'LINE' : extract_line,
+    'ARC' : extract_arc,
+    'CIRCLE' : extract_circle,
+    'TEXT' : extract_text,
+    'LWPOLYLINE' : extract_lwpolyline,
+    'POLYLINE' : extract_polyline,
+    'SPLINE' : extract_curve(spline_points),
+    'ELLIPSE' : extract_curve(ellipse_points),
+}
+
+def extract(shes, layer = None) :
+    """
+    Turn the entities into typed NumPy arrays, one batch per entity type.
+
+    :param shes: iterable of DXF entities, usually the modelspace
+    :param str layer: entities on this layer are marked as not `filtered`
+    :rtype: Geometry
+    """
+    buf = _Buffers()
+    entities, filtered, counts = [], [], {}
+
+    for e in shes :
+        i = len(entities)
+        entities.append(e)
+        filtered.append(e.dxf.layer != layer)
+        dxftype = e.dxftype()
+        counts[dxftype] = counts.get(dxftype, 0) + 1
+        fn = EXTRACTORS.get(dxftype)
+        if fn is not None :
+            fn(e, i, buf)
+
+    return Geometry(entities, filtered, counts, buf)
+
+#============ Geometry part ==============
+
+def _rows(values, width) :
+    return np.array(values, dtype = np.float64).reshape(-1, width)
+
+def _ids(values) :
+    return np.array(values, dtype = np.int64)
+
+class Geometry(object) :
+    """
+    Struct-of-arrays view of a modelspace:
+
+    - lines: (n, 4) sx, sy, ex, ey
+    - arcs: (n, 5) cx, cy, radius, start angle, end angle (degrees)
+    - circles: (n, 3) cx, cy, radius
+    - texts: (n, 2) insert x, y
+    - polylines: LWPOLYLINE / POLYLINE vertex buffer with bulges
+    - curves: SPLINE / ELLIPSE sampled as open polylines
+
+    Each batch has a matching `*_ids` array indexing `entities`.
+    """
+
+    def __init__(self, entities, filtered, counts, buf) :
+        self.entities = entities
+        self.filtered = np.array(filtered, dtype = bool)
+        self.counts = counts
+        self.lines, self.line_ids = _rows(buf.lines, 4), _ids(buf.line_ids)
+        self.arcs, self.arc_ids = _rows(buf.arcs, 5), _ids(buf.arc_ids)
+        self.circles, self.circle_ids = _rows(buf.circles, 3), _ids(buf.circle_ids)
+        self.texts, self.text_ids = _rows(buf.texts, 2), _ids(buf.text_ids)
+        self.polylines = PolylineBatch(buf.poly_chunks, buf.poly_bulges, buf.poly_closed, buf.poly_ids)
+        self.curves = PolylineBatch(buf.curve_chunks, [np.zeros(len(c)) for c in buf.curve_chunks],
+            [False] * len(buf.curve_chunks), buf.curve_ids)
+
+    def filtered_entities(self) :
+        return [e for e, f in zip(self.entities, self.filtered) if f]
+
+    def arc_extents(self) :
+        """ Per arc xmin, xmax, ymin, ymax, with the quadrant rules of the former getWidth/getHeight. """
+        cx, cy, r = self.arcs[:, 0], self.arcs[:, 1], self.arcs[:, 2]
+        start, end = self.arcs[:, 3], self.arcs[:, 4]
+        a0, a1 = np.radians(start), np.radians(end)
+        sx, ex = cx + np.cos(a0) * r, cx + np.cos(a1) * r
+        sy, ey = cy + np.sin(a0) * r, cy + np.sin(a1) * r
+
+        xmin = np.minimum(sx, ex)
+        xmin = np.where((start <= 180) & (end >= 180), np.minimum(xmin, cx - r), xmin)
+        xmax = np.maximum(np.maximum(sx, ex), cx + r)
+        ymin = np.minimum(sy, ey)
+        ymin = np.where((start <= 270) & (end >= 270), np.minimum(ymin, cy - r), ymin)
+        ymax = np.maximum(sy, ey)
+        ymax = np.where((start <= 90) & (end >= 90), np.maximum(ymax, cy + r), ymax)
+        return xmin, xmax, ymin, ymax
+
+    def arc_lengths(self) :
+        r, start, end = self.arcs[:, 2], self.arcs[:, 3], self.arcs[:, 4]
+        sweep = np.where(start > end, end + 360 - start, end - start)
+        return np.radians(sweep) * r
+
+    def extents(self, only_filtered = False) :
+        """ [xmin, xmax, ymin, ymax] over all batches, inf / -inf when empty. """
+        xlo, xhi, ylo, yhi = [], [], [], []
+
+        def add(ids, lo_x, hi_x, lo_y, hi_y) :
+            if only_filtered :
+                mask = self.filtered[ids]
+                lo_x, hi_x, lo_y, hi_y = lo_x[mask], hi_x[mask], lo_y[mask], hi_y[mask]
+            xlo.append(lo_x)
+            xhi.append(hi_x)
+            ylo.append(lo_y)
+            yhi.append(hi_y)
+
+        lines = self.lines
+        add(self.line_ids, np.minimum(lines[:, 0], lines[:, 2]), np.maximum(lines[:, 0], lines[:, 2]),
+            np.minimum(lines[:, 1], lines[:, 3]), np.maximum(lines[:, 1], lines[:, 3]))
+        add(self.arc_ids, *self.arc_extents())
+        cx, cy, r = self.circles[:, 0], self.circles[:, 1], self.circles[:, 2]
+        add(self.circle_ids, cx - r, cx + r, cy - r, cy + r)
+        add(self.text_ids, self.texts[:, 0], self.texts[:, 0], self.texts[:, 1], self.texts[:, 1])
+        for batch in (self.polylines, self.curves) :
+            x, y = batch.vertices[:, 0], batch.vertices[:, 1]
+            add(batch.vertex_ids(), x, x, y, y)
+
+        def reduce(parts, fn, empty) :
+            values = np.concatenate(parts)
+            return float(fn(values)) if len(values) else empty
+
+        return [reduce(xlo, np.min, np.inf), reduce(xhi, np.max, -np.inf),
+                reduce(ylo, np.min, np.inf), reduce(yhi, np.max, -np.inf)]
+
+    def total_length(self) :
+        lines = self.lines
+        total = np.hypot(lines[:, 0] - lines[:, 2], lines[:, 1] - lines[:, 3]).sum()
+        total += self.arc_lengths().sum()
+        total += (2 * np.pi * self.circles[:, 2]).sum()
+        total += self.polylines.lengths().sum()
+        total += self.curves.lengths().sum()
+        return float(total)
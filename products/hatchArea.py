@@ -1,183 +1,207 @@
-import os
-import sys
-from math import sqrt, sin, cos, pi, fabs, radians
-from .convert import entity_filter
-
-import ezdxf
-import svgwrite
-
-LAYER = 'svgframe'
-SVG_MAXSIZE = 512
-SCALE = 1.0
-
-#============= Initializing part ==============
-
-def get_dxf_dwg_from_file(dxffilepath) :
-    return ezdxf.readfile(dxffilepath)
-
-def get_clear_hatch_svg(minx = -50, miny = -50, width = 100, height = 100) :
-    svg = svgwrite.Drawing(size = (SVG_MAXSIZE, SVG_MAXSIZE), viewBox = "%s %s %s %s"%(minx, miny, width, height))
-    svg.add(svg.rect(insert = (minx, miny), size = ('100%', '100%'), rx = None, ry = None, fill = 'rgb(0, 0, 0)'))
-    return svg
-
-def get_empty_hatch_svg(alerttext = '! nothing to display !') :
-    svg = svgwrite.Drawing(size = (SVG_MAXSIZE, SVG_MAXSIZE), viewBox = "0 0 %s %s"%(SVG_MAXSIZE, SVG_MAXSIZE))
-    svg.add(svgwrite.Drawing().text(alerttext, insert = [50, 50], font_size = 20))
-    return svg
-    
-#========== Drawing Part ==============
-
-def trans_hatch_line(dxf_entity) :
-    line_start = dxf_entity.dxf.start[:2]
-    line_end = dxf_entity.dxf.end[:2]
-    svg_entity = svgwrite.Drawing().line(start = line_start, end = line_end, stroke = "green", stroke_width = 1.0/SCALE )
-    svg_entity.scale(SCALE,-SCALE)
-    return svg_entity
-
-def trans_hatch_circle(dxf_entity) :
-    circle_center = dxf_entity.dxf.center[:2]
-    circle_radius = dxf_entity.dxf.radius
-    svg_entity = svgwrite.Drawing().circle(center = circle_center, r = circle_radius, stroke = "green", fill = "blue", stroke_width = 1.0/SCALE )
-    svg_entity.scale(SCALE, -SCALE)
-    return svg_entity
-
-def trans_hatch_arc(dxf_entity, dwg) :
-    start_x = dxf_entity.dxf.center[0]
-    start_y = dxf_entity.dxf.center[1]
-    radius = dxf_entity.dxf.radius
-    
-    degree0 = dxf_entity.dxf.end_angle
-    degree1 = dxf_entity.dxf.start_angle
-    radians0 = radians(degree0)
-    radians1 = radians(degree1)
-    dx0 = radius*(sin(radians0))
-    dy0 = radius*(cos(radians0))
-    dx1 = radius*(sin(radians1))
-    dy1 = radius*(cos(radians1))
-
-    m0 = dy0 + start_x
-    n0 = dx0 + start_y
-    m1 = -dy0 + dy1
-    n1 = -dx0 + dx1
-    
-
-    svg_entity = dwg.path(d = "M {0},{1} a {2},{2} 0 0,0 {3},{4}".format(m0, n0, radius, m1, n1),
-            fill = "blue", 
-            stroke = "green",
-            stroke_width = 1.0 / SCALE
-        )
-
-    svg_entity.scale(SCALE, -SCALE)
-    return svg_entity
-
-def trans_hatch_spline(dxf_entity, dwg) :
-    ctrlPoints = dxf_entity.control_points
-    ctrlCnt = dxf_entity.control_point_count
-
-    strPath = ""
-    for i in range(ctrlCnt) :
-        if i == 0 :
-            strPath += "M " + str(ctrlPoints[i][0]) + " " + str(ctrlPoints[i][1]) + " C "
-        else :
-            strPath += str(ctrlPoints[i][0]) + " " + str(ctrlPoints[i][1]) + ", "
-        
-    svg_entity = dwg.path(d = strPath, fill = "blue", stroke = "green", stroke_width = 1.0 / SCALE)
-
-    svg_entity.scale(SCALE, -SCALE)
-    return svg_entity
-
-def trans_hatch_ellipse(dxf_entity, dwg) :
-    tmp = dxf_entity.to_spline(False)
-    ctrlPoints = tmp.control_points
-    ctrlCnt = tmp.control_point_count
-
-    strPath = ""
-    for i in range(ctrlCnt) :
-        if i == 0 :
-            strPath += "M " + str(ctrlPoints[i][0]) + " " + str(ctrlPoints[i][1]) + " C "
-        else :
-            strPath += str(ctrlPoints[i][0]) + " " + str(ctrlPoints[i][1]) + ", "
-        
-    svg_entity = dwg.path(d = strPath, fill = "blue", stroke = "green", stroke_width = 1.0 / SCALE)
-
-    svg_entity.scale(SCALE, -SCALE)
-    del tmp
-    return svg_entity
-
-def trans_hatch_text(dxf_entity) :
-    text_text = dxf_entity.dxf.text
-    text_insert = dxf_entity.dxf.insert[:2]
-    text_height = dxf_entity.dxf.height * 1.4 # hotfix - 1.4 to fit svg and dvg
-    svg_entity = svgwrite.Drawing().text(text_text, insert = [0, 0], font_size = text_height * SCALE)
-    svg_entity.translate(text_insert[0]*(SCALE), -text_insert[1]*(SCALE))
-    return svg_entity
-
-def trans_hatch_polyline(dxf_entity) :
-    points = [(vert.dxf.location[0], vert.dxf.location[1]) for vert in dxf_entity.vertices]
-    
-    svg_entity = svgwrite.Drawing().polyline(points = points, stroke = 'green', fill = 'blue', stroke_width = 1.0/SCALE)
-    svg_entity.scale(SCALE, -SCALE)
-    return svg_entity
-
-def trans_hatch_lwpolyline(dxf_entity) :
-    points = [(pt[0], pt[1]) for pt in dxf_entity.get_points("xy")]
-    
-    svg_entity = svgwrite.Drawing().polyline(points = points, stroke = 'green', fill = 'blue', stroke_width = 1.0/SCALE)
-    svg_entity.scale(SCALE, -SCALE)
-    return svg_entity
-
-#============ Extract Svg part =============
-
-def get_svg_from_hatch_dxf(dxffilepath, frame_name = None) :
-    global SCALE
-    
-    entites_filter = entity_filter(dxffilepath, frame_name)
-    entites = entites_filter[0]
-    frame_coord = entites_filter[1]
-    
-    if not entites:
-        return get_empty_hatch_svg()
-    
-    minx = frame_coord[0]
-    miny = -frame_coord[3]
-    width = abs(frame_coord[0] - frame_coord[1])
-    height = abs(frame_coord[2] - frame_coord[3])
-    SCALE = 1.0 * SVG_MAXSIZE / max(width, height)
-    
-    svg = get_clear_hatch_svg(minx * SCALE, miny * SCALE, width * SCALE, height * SCALE)
-    for e in entites:
-        if e.dxftype() == 'LINE': svg.add(trans_hatch_line(e))
-        if e.dxftype() == 'POLYLINE': svg.add(trans_hatch_polyline(e))
-        if e.dxftype() == 'LWPOLYLINE': svg.add(trans_hatch_lwpolyline(e))
-        if e.dxftype() == 'CIRCLE': svg.add(trans_hatch_circle(e))
-        if e.dxftype() == 'TEXT': svg.add(trans_hatch_text(e))
-        if e.dxftype() == 'ARC': svg.add(trans_hatch_arc(e, svg))
-        if e.dxftype() == 'SPLINE': svg.add(trans_hatch_spline(e, svg))
-        if e.dxftype() == 'ELLIPSE': svg.add(trans_hatch_ellipse(e, svg))
-    return svg
-
-#============ Saving Svg file ==============
-
-def save_svg_from_hatch_dxf(dxffilepath, svgfilepath = None, frame_name = None, size = 512) :
-    global SVG_MAXSIZE
-    _oldsize = SVG_MAXSIZE
-    SVG_MAXSIZE = size
-    
+import numpy as np
+
+from .convert import get_drawing_context
+from .geometry import extract
+
+#============ Analytic area part =============
+
+CHAIN_TOLERANCE = 1e-6
+ARC_SAMPLES = 8
+CIRCLE_SAMPLES = 32
+
+def bulge_areas(chords, bulges) :
+    # signed area between a chord and its arc, positive for counter clockwise arcs
+    theta = 4 * np.arctan(bulges)
+    half = np.sin(theta / 2)
+    half = np.where(half == 0, 1.0, half)
+    radius2 = (chords / (2 * half)) ** 2
+    return np.where(bulges == 0, 0.0, radius2 / 2 * (theta - np.sin(theta)))
+
+def polyline_areas(batch) :
+    """
+    Per vertex shoelace + bulge terms of a PolylineBatch. Segment i goes from
+    vertex i to the next vertex of the same polyline, wrapping to the first.
+    """
+    v = batch.vertices
+    nxt = np.arange(1, len(v) + 1)
+    nxt[batch.offsets[1:] - 1] = batch.offsets[:-1]
+    x0, y0, x1, y1 = v[:, 0], v[:, 1], v[nxt, 0], v[nxt, 1]
+    chords = np.hypot(x1 - x0, y1 - y0)
+    return (x0 * y1 - x1 * y0) / 2 + bulge_areas(chords, batch.bulges)
+
+def is_full_ellipse(e) :
+    if e.dxftype() != 'ELLIPSE' :
+        return False
+    return abs(abs(e.dxf.end_param - e.dxf.start_param) - 2 * np.pi) < 1e-9
+
+def ellipse_edge_area(e, p0, p1) :
+    # like an arc: chord term + elliptical segment, the affine image of a circular one of the same sweep
+    major, minor = e.dxf.major_axis, e.minor_axis
+    sweep = (e.dxf.end_param - e.dxf.start_param) % (2 * np.pi) or 2 * np.pi
+    return (p0[0] * p1[1] - p1[0] * p0[1]) / 2 + (major[0] * minor[1] - major[1] * minor[0]) / 2 * (sweep - np.sin(sweep))
+
+def get_hatch_loops(geometry, mask = None, tolerance = None) :
+    """
+    Closed boundary loops of the geometry as (signed area, polygon) pairs.
+    Closed polylines, circles and full ellipses are loops on their own, lines,
+    arcs and open polylines / curves are chained by their end points. Areas
+    are exact except for splines, which are sampled.
+    """
+    if mask is None :
+        mask = np.ones(len(geometry.entities), dtype = bool)
+    if tolerance is None :
+        ext = geometry.extents()
+        size = max(ext[1] - ext[0], ext[3] - ext[2], 1.0) if ext[0] < ext[1] else 1.0
+        tolerance = CHAIN_TOLERANCE * size
+
+    loops, edges = [], []
+
+    # ---- polylines: closed ones are loops, open ones become edges
+    for batch in (geometry.polylines, geometry.curves) :
+        if not len(batch) :
+            continue
+        terms = polyline_areas(batch)
+        cumulative = np.concatenate(([0.0], np.cumsum(terms)))
+        starts, ends = batch.offsets[:-1], batch.offsets[1:]
+        closed_area = cumulative[ends] - cumulative[starts]
+        open_area = cumulative[ends - 1] - cumulative[starts]
+        for k in np.nonzero(mask[batch.ids])[0] :
+            points = batch.vertices[starts[k]:ends[k]]
+            if batch.closed[k] :
+                loops.append((closed_area[k], points))
+            elif batch is geometry.curves and is_full_ellipse(geometry.entities[batch.ids[k]]) :
+                # exact area, the samples are only used for nesting
+                e = geometry.entities[batch.ids[k]]
+                major = e.dxf.major_axis
+                loops.append((np.pi * (major[0] ** 2 + major[1] ** 2) * abs(e.dxf.ratio), points))
+            elif len(points) > 1 :
+                e = geometry.entities[batch.ids[k]]
+                if batch is geometry.curves and e.dxftype() == 'ELLIPSE' :
+                    area = ellipse_edge_area(e, points[0], points[-1])
+                else :
+                    area = open_area[k]
+                edges.append((points[0], points[-1], area, points))
+
+    # ---- circles
+    angles = np.linspace(0, 2 * np.pi, CIRCLE_SAMPLES, endpoint = False)
+    for cx, cy, r in geometry.circles[mask[geometry.circle_ids]] :
+        polygon = np.column_stack((cx + r * np.cos(angles), cy + r * np.sin(angles)))
+        loops.append((np.pi * r * r, polygon))
+
+    # ---- lines
+    for sx, sy, ex, ey in geometry.lines[mask[geometry.line_ids]] :
+        edges.append(((sx, sy), (ex, ey), (sx * ey - ex * sy) / 2, np.array(((sx, sy), (ex, ey)))))
+
+    # ---- arcs, counter clockwise from start to end angle
+    for cx, cy, r, start, end in geometry.arcs[mask[geometry.arc_ids]] :
+        sweep = np.radians((end - start) % 360 or 360)
+        t = np.radians(start) + np.linspace(0, sweep, ARC_SAMPLES + 1)
+        polygon = np.column_stack((cx + r * np.cos(t), cy + r * np.sin(t)))
+        (sx, sy), (ex, ey) = polygon[0], polygon[-1]
+        area = (sx * ey - ex * sy) / 2 + r * r / 2 * (sweep - np.sin(sweep))
+        edges.append((polygon[0], polygon[-1], area, polygon))
+
+    return loops + chain_edges(edges, tolerance)
+
+def chain_edges(edges, tolerance) :
+    def key(p) :
+        return (round(p[0] / tolerance), round(p[1] / tolerance))
+
+    ends = {}
+    for k, (p0, p1, area, points) in enumerate(edges) :
+        ends.setdefault(key(p0), []).append((k, 0))
+        ends.setdefault(key(p1), []).append((k, 1))
+
+    used = [False] * len(edges)
+    loops = []
+    for k, (p0, p1, area, points) in enumerate(edges) :
+        if used[k] :
+            continue
+        used[k] = True
+        start, cur = key(p0), key(p1)
+        parts = [points]
+        while cur != start :
+            nxt = None
+            for j, side in ends.get(cur, ()) :
+                if not used[j] :
+                    nxt = j, side
+                    break
+            if nxt is None :
+                break
+            j, side = nxt
+            used[j] = True
+            if side == 0 :
+                area += edges[j][2]
+                cur = key(edges[j][1])
+                parts.append(edges[j][3])
+            else :
+                area -= edges[j][2]
+                cur = key(edges[j][0])
+                parts.append(edges[j][3][::-1])
+        if cur == start :
+            loops.append((area, np.concatenate(parts)))
+    return loops
+
+def points_in_polygon(points, polygon) :
+    # even-odd ray casting of many points against one polygon
+    x, y = points[:, 0:1], points[:, 1:2]
+    x0, y0 = polygon[:, 0], polygon[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    crosses = (y0 > y) != (y1 > y)
+    with np.errstate(divide = 'ignore', invalid = 'ignore') :
+        xcross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    return np.count_nonzero(crosses & (x < xcross), axis = 1) % 2 == 1
+
+def unique_loops(loops) :
+    """
+    The loops without their exact copies. A boundary drawn twice is one
+    loop, not a loop and its hole: the first vertex of a copy lies on the
+    other one and would count as inside it.
+    """
+    points = np.concatenate([polygon for _, polygon in loops])
+    tolerance = CHAIN_TOLERANCE * max(np.ptp(points[:, 0]), np.ptp(points[:, 1]), 1.0)
+
+    seen, unique = {}, []
+    for area, polygon in loops :
+        key = (len(polygon), ) + tuple(int(round(v / tolerance)) for v in
+            (polygon[:, 0].min(), polygon[:, 0].max(), polygon[:, 1].min(), polygon[:, 1].max()))
+        # any start vertex, any direction
+        ordered = polygon[np.lexsort((polygon[:, 1], polygon[:, 0]))]
+        if any(np.isclose(abs(area), abs(a)) and np.allclose(ordered, other, rtol = 0, atol = tolerance) for a, other in seen.get(key, ())) :
+            continue
+        seen.setdefault(key, []).append((area, ordered))
+        unique.append((area, polygon))
+    return unique
+
+def even_odd_area(loops) :
+    """ Area of the loops with even-odd nesting: a loop inside an odd number of loops is a hole. """
+    if not loops :
+        return 0.0
+    loops = sorted(unique_loops(loops), key = lambda loop : -abs(loop[0]))
+    areas = np.array([abs(loop[0]) for loop in loops])
+    probes = np.array([loop[1][0] for loop in loops])
+    bbox = np.array([(p[:, 0].min(), p[:, 0].max(), p[:, 1].min(), p[:, 1].max()) for _, p in loops])
+    depth = np.zeros(len(loops), dtype = np.int64)
+
+    for j, (_, polygon) in enumerate(loops) :
+        # only smaller loops can lie inside loop j
+        inside = np.nonzero((bbox[j + 1:, 0] >= bbox[j, 0]) & (bbox[j + 1:, 1] <= bbox[j, 1]) &
+            (bbox[j + 1:, 2] >= bbox[j, 2]) & (bbox[j + 1:, 3] <= bbox[j, 3]))[0] + j + 1
+        if len(inside) :
+            depth[inside[points_in_polygon(probes[inside], polygon)]] += 1
+
+    return float(np.where(depth % 2 == 0, areas, -areas).sum())
+
+def get_hatch_area(dxffilepath, frame_name = None) :
+    """
+    Exact hatch area of the filtered entities in drawing units, no svg or png
+    round trip.
+    """
+    context = get_drawing_context(dxffilepath)
     if frame_name :
-        print('>>making %s svgframe for %s ...'%(frame_name, os.path.basename(dxffilepath)))
-    else :
-        print('making svg for %s ...'%(os.path.basename(dxffilepath)))
-        pass
-    
-    svg = get_svg_from_hatch_dxf(dxffilepath, frame_name)
-        
-    if '.dxf' in dxffilepath :
-        svgfilepath = dxffilepath.replace('.dxf', '_hatch.svg')
-    elif '.DXF' in dxffilepath :
-        svgfilepath = dxffilepath.replace('.DXF', '_hatch.svg')
-    
-    svg.saveas(svgfilepath)
-    
-    SVG_MAXSIZE = _oldsize
-
-    return svgfilepath, SCALE
+        return get_geometry_hatch_area(extract(context.filter(frame_name)[0]))
+    geometry = context.metrics.geometry
+    return get_geometry_hatch_area(geometry, geometry.filtered)
+
+def get_geometry_hatch_area(geometry, mask = None) :
+    return even_odd_area(get_hatch_loops(geometry, mask))
@@ -0,0 +1,208 @@
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from .dxfapi import getJsonData, getFramesJsonData
+from .models import Job
+from .readFile import isAi, convertAi
+
+JOB_POLL = 1.0 # seconds an idle worker sleeps between queue checks
+JOB_TIMEOUT = 30 * 60 # running jobs older than this are taken as lost
+JOB_MAX_ATTEMPTS = 3
+JOB_WAIT_TIMEOUT = 20 # getdxf gives up waiting after this and answers 202 with the job id, stay below the gunicorn worker timeout
+
+_wakeup = threading.Event()
+_pool = None
+_pool_lock = threading.Lock()
+
+#============ Runners part ==============
+
+def run_dxf(job) :
+    if isAi(job.url) :
+        # the worker is released while CloudConvert runs, see run
+        convertAi(job.url, wait = False, callback = callback_url(job))
+    return getJsonData(job.url, job.params.get('tiles'), job.params.get('key'))
+
+def run_frames(job) :
+    return getFramesJsonData(job.url, job.params.get('metrics', False))
+
+RUNNERS = {
+    'dxf' : run_dxf,
+    'frames' : run_frames,
+}
+
+#============ Queue part ==============
+
+def submit(kind, url, **params) :
+    """ Queue a job and wake the local workers. """
+    if kind not in RUNNERS :
+        raise ValueError('unknown job kind %s' % kind)
+    job = Job.objects.create(kind = kind, url = url, params = params)
+    ensure_workers()
+    _wakeup.set()
+    return job
+
+def submit_once(kind, url, **params) :
+    """
+    The unfinished job of the same kind, url and params if there is one,
+    else a new one. Jobs of dead workers are requeued first, a retry never
+    waits on them.
+    """
+    requeue_lost()
+    for job in Job.objects.filter(kind = kind, url = url, status__in = (Job.QUEUED, Job.RUNNING)) :
+        if job.params == params :
+            # a requeued job needs a worker, this process may be a fresh one
+            ensure_workers()
+            _wakeup.set()
+            return job
+    return submit(kind, url, **params)
+
+def worker_alive(worker) :
+    """ False for a worker of this host whose process is gone, e.g. killed by gunicorn, True when unknown. """
+    host, _, rest = worker.partition(':')
+    pid = rest.partition(':')[0]
+    if host != socket.gethostname() or not pid.isdigit() :
+        return True
+    try :
+        os.kill(int(pid), 0)
+    except ProcessLookupError :
+        return False
+    except PermissionError :
+        pass
+    return True
+
+def requeue_lost() :
+    """
+    Running jobs whose worker went away go back to the queue, or fail after
+    JOB_MAX_ATTEMPTS. Workers of this host are checked by pid, the others
+    are lost after JOB_TIMEOUT.
+    """
+    now = timezone.now()
+    running = Job.objects.filter(status = Job.RUNNING, worker__startswith = socket.gethostname() + ':')
+    dead = [pk for pk, worker in running.values_list('pk', 'worker') if not worker_alive(worker)]
+    lost = Job.objects.filter(Q(started__lt = now - timedelta(seconds = JOB_TIMEOUT)) | Q(pk__in = dead), status = Job.RUNNING)
+    lost.filter(attempts__lt = JOB_MAX_ATTEMPTS).update(status = Job.QUEUED, worker = '')
+    lost.update(status = Job.FAILED, error = 'worker lost', finished = now)
+
+def claim(worker) :
+    """
+    Take the oldest queued job, deferred jobs once their wake time passed.
+    The status change is a conditional update, so two workers, threads or
+    processes, never get the same job.
+    """
+    requeue_lost()
+    ready = Job.objects.filter(Q(wake_at__isnull = True) | Q(wake_at__lte = timezone.now()), status = Job.QUEUED)
+    for pk in ready.order_by('created').values_list('pk', flat = True)[:10] :
+        claimed = Job.objects.filter(pk = pk, status = Job.QUEUED).update(
+            status = Job.RUNNING, worker = worker, started = timezone.now(), attempts = F('attempts') + 1, wake_at = None)
+        if claimed :
+            return Job.objects.get(pk = pk)
+    return None
+
+def run(job) :
+    try :
+        result, status, error = RUNNERS[job.kind](job), Job.DONE, ''
+    except Exception as exc :
+        if getattr(exc, 'retry_after', None) is not None :
+            # waits on an outside service: back to the queue, the worker takes other jobs meanwhile
+            return defer(job, exc.retry_after)
+        result, status, error = '', Job.FAILED, traceback.format_exc()
+        print(error)
+    # a job requeued meanwhile belongs to its new worker
+    Job.objects.filter(pk = job.pk, worker = job.worker).update(
+        status = status, result = result, error = error, finished = timezone.now())
+
+def defer(job, delay) :
+    """ Requeue the job for `delay` seconds from now, a deferred run does not count as an attempt. """
+    Job.objects.filter(pk = job.pk, worker = job.worker).update(status = Job.QUEUED, worker = '',
+        wake_at = timezone.now() + timedelta(seconds = delay), attempts = F('attempts') - 1)
+
+def wake(job_id) :
+    """ Make a deferred job ready now, e.g. on a CloudConvert callback. """
+    woken = Job.objects.filter(pk = job_id, status = Job.QUEUED).update(wake_at = None)
+    if woken :
+        _wakeup.set()
+    return bool(woken)
+
+def callback_url(job) :
+    """ Url of the callback view resuming the job, None without a public CLOUDCONVERT_CALLBACK_BASE. """
+    base = getattr(settings, 'CLOUDCONVERT_CALLBACK_BASE', None)
+    if not base :
+        return None
+    return base.rstrip('/') + reverse('cloudconvert_callback', args = [job.pk])
+
+def wait(job_id, timeout = None) :
+    """ Poll the job until it is finished or `timeout` seconds passed, JOB_WAIT_TIMEOUT setting by default, returns the last seen Job. """
+    if timeout is None :
+        timeout = getattr(settings, 'JOB_WAIT_TIMEOUT', JOB_WAIT_TIMEOUT)
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True :
+        job = Job.objects.get(pk = job_id)
+        if job.is_finished or time.monotonic() >= deadline :
+            return job
+        time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        delay = min(delay * 2, 1.0)
+
+def job_data(job) :
+    return {
+        "id" : str(job.pk),
+        "kind" : job.kind,
+        "status" : job.status,
+        "result" : json.loads(job.result) if job.result else None,
+        "error" : job.error.strip().split('\n')[-1] if job.error else None,
+    }
+
+#============ Worker pool part ==============
+
+class WorkerPool(object) :
+    """ Threads that take jobs from the database queue until stopped. """
+
+    def __init__(self, workers) :
+        self.workers = workers
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self) :
+        for k in range(self.workers) :
+            thread = threading.Thread(target = self.work, name = 'job-worker-%d' % k, daemon = True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def work(self) :
+        worker = '%s:%d:%s' % (socket.gethostname(), os.getpid(), threading.current_thread().name)
+        while not self.stopping.is_set() :
+            close_old_connections()
+            job = claim(worker)
+            if job is not None :
+                run(job)
+                continue
+            _wakeup.wait(JOB_POLL)
+            _wakeup.clear()
+        close_old_connections()
+
+    def stop(self) :
+        self.stopping.set()
+        _wakeup.set()
+        for thread in self.threads :
+            thread.join()
+
+def ensure_workers() :
+    """ In-process workers, JOB_WORKERS setting, 0 when jobs are run by `manage.py run_jobs`. """
+    global _pool
+    with _pool_lock :
+        workers = getattr(settings, 'JOB_WORKERS', 2)
+        if _pool is None and workers > 0 :
+            _pool = WorkerPool(workers).start()
+    return _pool
@@ -0,0 +1,109 @@
+import io
+import os
+import time
+import uuid
+
+from azure.storage.blob import BlobClient
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from products import storage
+from products.blobserver import BlobServer
+
+
+def per_call_upload(connection_string, container_name, blob_name, payload) :
+    """ Former readFile.uploadSrc: connection string parsed and a new client per call. """
+    BlobClient.from_connection_string(conn_str = connection_string, container_name = container_name,
+        blob_name = blob_name).upload_blob(payload, overwrite = True)
+
+
+def per_call_download(connection_string, container_name, blob_name) :
+    BlobClient.from_connection_string(conn_str = connection_string, container_name = container_name,
+        blob_name = blob_name).download_blob().readinto(io.BytesIO())
+
+
+def pooled_upload(connection_string, container_name, blob_name, payload) :
+    storage.upload_blob(blob_name, payload, container_name, overwrite = True)
+
+
+def pooled_download(connection_string, container_name, blob_name) :
+    storage.download_blob(blob_name, io.BytesIO(), container_name)
+
+
+def parallel_upload(concurrency) :
+    def upload(connection_string, container_name, blob_name, payload) :
+        storage.upload_blob(blob_name, payload, container_name, overwrite = True, concurrency = concurrency)
+    return upload
+
+
+def parallel_download(concurrency) :
+    def download(connection_string, container_name, blob_name) :
+        storage.download_blob(blob_name, io.BytesIO(), container_name, concurrency = concurrency)
+    return download
+
+
+def percentile(values, q) :
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Command(BaseCommand) :
+    help = ('Time blob uploads and downloads with a new client per call and with the pooled storage clients, '
+        'or with --concurrency the throughput of parallel chunked transfers.')
+
+    def add_arguments(self, parser) :
+        parser.add_argument('--size', type = int, default = 256, help = 'payload size in KB')
+        parser.add_argument('--repeat', type = int, default = 10)
+        parser.add_argument('--container', default = None)
+        parser.add_argument('--concurrency', default = None, help = 'comma separated parallel stream counts, e.g. 1,2,4,8')
+        parser.add_argument('--chunk', type = int, default = None, help = 'ranged GET and block size in KB')
+        parser.add_argument('--local', action = 'store_true', help = 'run against a local stand-in blob server')
+        parser.add_argument('--latency', type = float, default = 0.02, help = 'local server seconds per request')
+        parser.add_argument('--bandwidth', type = float, default = 20.0, help = 'local server MB/s per connection')
+
+    def handle(self, *args, **options) :
+        server = None
+        if options['local'] :
+            server = BlobServer(latency = options['latency'], bandwidth = options['bandwidth'] * 1e6).start()
+            settings.AZURE_STORAGE_CONNECTION_STRING = server.connection_string
+        if options['chunk'] :
+            settings.BLOB_CHUNK_SIZE = settings.BLOB_SINGLE_SIZE = options['chunk'] * 1024
+        storage.reset()
+
+        try :
+            self.run(options)
+        finally :
+            if server is not None :
+                server.stop()
+
+    def run(self, options) :
+        connection_string = storage.get_connection_string()
+        container_name = options['container'] or storage.setting('AZURE_STORAGE_CONTAINER', storage.BLOB_CONTAINER)
+        payload = os.urandom(options['size'] * 1024)
+        blob_name = 'bench/%s.bin' % uuid.uuid4().hex
+
+        if options['concurrency'] :
+            modes = [('x%s' % n, parallel_upload(int(n)), parallel_download(int(n))) for n in options['concurrency'].split(',')]
+        else :
+            modes = [('pooled', pooled_upload, pooled_download)]
+            if connection_string != storage.MEMORY :
+                modes.insert(0, ('per-call', per_call_upload, per_call_download))
+
+        self.stdout.write('%d x %d KB against container %s, %d KB chunks' % (options['repeat'], options['size'],
+            container_name, int(storage.setting('BLOB_CHUNK_SIZE', storage.BLOB_CHUNK_SIZE)) // 1024))
+        for mode, upload, download in modes :
+            timings = {'upload' : [], 'download' : []}
+            for _ in range(options['repeat']) :
+                t0 = time.perf_counter()
+                upload(connection_string, container_name, blob_name, payload)
+                t1 = time.perf_counter()
+                download(connection_string, container_name, blob_name)
+                t2 = time.perf_counter()
+                timings['upload'].append(t1 - t0)
+                timings['download'].append(t2 - t1)
+            for step, values in timings.items() :
+                mean = sum(values) / len(values)
+                self.stdout.write('%-8s %-8s mean %7.1f ms  p50 %7.1f ms  max %7.1f ms  %7.1f MB/s' % (mode, step,
+                    1000 * mean, 1000 * percentile(values, 0.5), 1000 * max(values), len(payload) / mean / 1e6))
+
+        storage.get_container(container_name).delete_blob(blob_name)
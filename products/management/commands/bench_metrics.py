@@ -0,0 +1,140 @@
+import random
+import time
+from math import sqrt, sin, cos, pi, radians
+
+import ezdxf
+from django.core.management.base import BaseCommand
+
+from products.convert import LAYER
+from products.metrics import measure
+
+
+def build_sample_drawing(count, seed = 0) :
+    """ Synthetic drawing with `count` mixed LINE/ARC/CIRCLE/LWPOLYLINE/TEXT entities. """
+    rnd = random.Random(seed)
+    dxf = ezdxf.new('R2010')
+    msp = dxf.modelspace()
+    for i in range(count) :
+        x, y = rnd.uniform(0, 3000), rnd.uniform(0, 1500)
+        kind = i % 5
+        if kind == 0 :
+            msp.add_line((x, y), (x + rnd.uniform(-50, 50), y + rnd.uniform(-50, 50)))
+        elif kind == 1 :
+            start = rnd.uniform(0, 360)
+            msp.add_arc((x, y), rnd.uniform(1, 40), start, (start + rnd.uniform(10, 340)) % 360)
+        elif kind == 2 :
+            msp.add_circle((x, y), rnd.uniform(1, 40))
+        elif kind == 3 :
+            points = [(x + rnd.uniform(-30, 30), y + rnd.uniform(-30, 30)) for _ in range(8)]
+            msp.add_lwpolyline(points, dxfattribs = {'closed' : True})
+        else :
+            msp.add_text('P%d' % i, dxfattribs = {'height' : 2.5}).set_pos((x, y))
+    return dxf
+
+
+def build_nest_drawing(segments, vertices = 200, seed = 0) :
+    """ Laser-cut style nest: closed LWPOLYLINE parts with `segments` segments in total. """
+    rnd = random.Random(seed)
+    dxf = ezdxf.new('R2010')
+    msp = dxf.modelspace()
+    for _ in range(max(1, segments // vertices)) :
+        cx, cy, r = rnd.uniform(0, 3000), rnd.uniform(0, 1500), rnd.uniform(5, 60)
+        points = [(cx + r * cos(2 * pi * k / vertices), cy + r * sin(2 * pi * k / vertices)) for k in range(vertices)]
+        msp.add_lwpolyline(points, dxfattribs = {'closed' : True})
+    return dxf
+
+
+def legacy_walks(msp) :
+    """ Former getWidth / getHeight / getTotalLength / entity_filter bbox: one full walk each. """
+    for axis in (0, 1) :
+        lo, hi = 999999, 0
+        for e in msp :
+            if e.dxftype() == 'LINE' :
+                lo = min(lo, e.dxf.start[axis], e.dxf.end[axis])
+                hi = max(hi, e.dxf.start[axis], e.dxf.end[axis])
+            if e.dxftype() == 'ARC' :
+                trig = cos if axis == 0 else sin
+                s = e.dxf.center[axis] + trig(radians(e.dxf.start_angle)) * e.dxf.radius
+                t = e.dxf.center[axis] + trig(radians(e.dxf.end_angle)) * e.dxf.radius
+                lo, hi = min(lo, s, t), max(hi, s, t, e.dxf.center[axis] + e.dxf.radius)
+            if e.dxftype() == 'CIRCLE' :
+                lo = min(lo, e.dxf.center[axis] - e.dxf.radius)
+                hi = max(hi, e.dxf.center[axis] + e.dxf.radius)
+            if e.dxftype() == 'LWPOLYLINE' :
+                pt = [p[axis] for p in e.get_points("xy")]
+                lo, hi = min(lo, min(pt)), max(hi, max(pt))
+            if e.dxftype() == 'TEXT' :
+                lo, hi = min(lo, e.dxf.insert[axis]), max(hi, e.dxf.insert[axis])
+
+    total = 0
+    for e in msp :
+        if e.dxftype() == 'LINE' :
+            total += sqrt(pow(e.dxf.start[0] - e.dxf.end[0], 2) + pow(e.dxf.start[1] - e.dxf.end[1], 2))
+        if e.dxftype() == 'ARC' :
+            total += radians((e.dxf.end_angle - e.dxf.start_angle) % 360) * e.dxf.radius
+        if e.dxftype() == 'CIRCLE' :
+            total += 2 * pi * e.dxf.radius
+        if e.dxftype() == 'LWPOLYLINE' :
+            pt = e.get_points("xy")
+            for i in range(len(pt) - 1) :
+                total += sqrt((pt[i][0] - pt[i + 1][0]) ** 2 + (pt[i][1] - pt[i + 1][1]) ** 2)
+
+    entitys = []
+    xmin, xmax, ymin, ymax = 99999, 0, 99999, 0
+    for e in msp :
+        if not e.dxf.layer == LAYER :
+            entitys.append(e)
+            if e.dxftype() == 'LINE' :
+                xmin, xmax = min(xmin, e.dxf.start[0], e.dxf.end[0]), max(xmax, e.dxf.start[0], e.dxf.end[0])
+                ymin, ymax = min(ymin, e.dxf.start[1], e.dxf.end[1]), max(ymax, e.dxf.start[1], e.dxf.end[1])
+            if e.dxftype() == 'CIRCLE' :
+                xmin, xmax = min(xmin, e.dxf.center[0] - e.dxf.radius), max(xmax, e.dxf.center[0] + e.dxf.radius)
+                ymin, ymax = min(ymin, e.dxf.center[1] - e.dxf.radius), max(ymax, e.dxf.center[1] + e.dxf.radius)
+            if e.dxftype() == 'ARC' :
+                sx = e.dxf.center[0] + cos(radians(e.dxf.start_angle)) * e.dxf.radius
+                sy = e.dxf.center[1] + sin(radians(e.dxf.start_angle)) * e.dxf.radius
+                xmin, xmax = min(xmin, sx), max(xmax, sx)
+                ymin, ymax = min(ymin, sy), max(ymax, sy)
+            if e.dxftype() == 'LWPOLYLINE' :
+                x = [p[0] for p in e.get_points("xy")]
+                y = [p[1] for p in e.get_points("xy")]
+                xmin, xmax = min(xmin, min(x)), max(xmax, max(x))
+                ymin, ymax = min(ymin, min(y)), max(ymax, max(y))
+    return total
+
+
+class Command(BaseCommand) :
+    help = 'Compare the fused metrics walk with the former one-walk-per-metric functions.'
+
+    def add_arguments(self, parser) :
+        parser.add_argument('--entities', type = int, default = 100000)
+        parser.add_argument('--repeat', type = int, default = 3)
+        parser.add_argument('--segments', type = int, default = 0,
+            help = 'also time measure() on a LWPOLYLINE nest with this many segments')
+
+    def handle(self, *args, **options) :
+        self.stdout.write('building drawing with %d entities ...' % options['entities'])
+        msp = build_sample_drawing(options['entities']).modelspace()
+
+        legacy = fused = float('inf')
+        for _ in range(options['repeat']) :
+            t0 = time.perf_counter()
+            legacy_walks(msp)
+            t1 = time.perf_counter()
+            measure(msp, LAYER)
+            t2 = time.perf_counter()
+            legacy, fused = min(legacy, t1 - t0), min(fused, t2 - t1)
+
+        self.stdout.write('legacy 4 walks : %.3f s' % legacy)
+        self.stdout.write('fused 1 walk   : %.3f s' % fused)
+        self.stdout.write('speedup        : %.2fx' % (legacy / fused))
+
+        if options['segments'] :
+            self.stdout.write('building nest with %d segments ...' % options['segments'])
+            msp = build_nest_drawing(options['segments']).modelspace()
+            best = float('inf')
+            for _ in range(options['repeat']) :
+                t0 = time.perf_counter()
+                measure(msp, LAYER)
+                best = min(best, time.perf_counter() - t0)
+            self.stdout.write('nest measure   : %.3f s' % best)
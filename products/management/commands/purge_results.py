@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products.cache import store_ttl
+from products.models import DrawingResult
+
+
+class Command(BaseCommand) :
+    help = 'Delete stored getdxf results older than RESULT_STORE_TTL.'
+
+    def add_arguments(self, parser) :
+        parser.add_argument('--ttl', type = int, default = None, help = 'age in seconds, defaults to RESULT_STORE_TTL')
+        parser.add_argument('--all', action = 'store_true', help = 'delete every stored result')
+
+    def handle(self, *args, **options) :
+        results = DrawingResult.objects.all()
+        if not options['all'] :
+            ttl = options['ttl'] if options['ttl'] is not None else store_ttl()
+            results = results.filter(created__lt = timezone.now() - timedelta(seconds = ttl))
+        count, _ = results.delete()
+        self.stdout.write('%d stored results deleted, %d left' % (count, DrawingResult.objects.count()))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.jobs import WorkerPool, claim, run
+from products.models import Job
+
+
+class Command(BaseCommand) :
+    help = 'Run queued getdxf / getframes jobs from the database queue.'
+
+    def add_arguments(self, parser) :
+        parser.add_argument('--workers', type = int, default = 2)
+        parser.add_argument('--once', action = 'store_true',
+            help = 'run the jobs queued now in this thread and exit')
+
+    def handle(self, *args, **options) :
+        if options['once'] :
+            count = 0
+            job = claim('run_jobs')
+            while job is not None :
+                run(job)
+                count += 1
+                job = claim('run_jobs')
+            self.stdout.write('%d jobs run' % count)
+            return
+
+        pool = WorkerPool(options['workers']).start()
+        self.stdout.write('%d job workers started, %d jobs queued' % (options['workers'], Job.objects.filter(status = Job.QUEUED).count()))
+        try :
+            while True :
+                time.sleep(60)
+        except KeyboardInterrupt :
+            self.stdout.write('stopping after the running jobs ...')
+            pool.stop()
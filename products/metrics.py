@@ -0,0 +1,45 @@
+from .geometry import extract
+
+#============ Metrics part ==============
+
+class Metrics(object) :
+    """
+    Geometry metrics of one extraction: extents and length of all entities,
+    per type counts and the entities / bbox used by entity_filter.
+    """
+
+    def __init__(self, geometry) :
+        self.geometry = geometry
+        self.counts = geometry.counts
+        self.entities = geometry.filtered_entities()
+        self.extents = geometry.extents()
+        self.bbox = geometry.extents(only_filtered = True)
+        self.total_length = geometry.total_length()
+
+    @property
+    def width(self) :
+        # 999999 / 0 start values kept from the former getWidth
+        return max(self.extents[1], 0) - min(self.extents[0], 999999)
+
+    @property
+    def height(self) :
+        return max(self.extents[3], 0) - min(self.extents[2], 999999)
+
+    def filter_bbox(self, margin = 0.05) :
+        # 99999 / 0 start values kept from the former entity_filter
+        xmin, xmax = min(self.bbox[0], 99999), max(self.bbox[1], 0)
+        ymin, ymax = min(self.bbox[2], 99999), max(self.bbox[3], 0)
+        xmargin = margin * abs(xmax - xmin)
+        ymargin = margin * abs(ymax - ymin)
+        return [xmin - xmargin, xmax + xmargin, ymin - ymargin, ymax + ymargin]
+
+def measure(shes, layer = None) :
+    """
+    Extract the entities once into NumPy batches and compute all geometry
+    metrics as array operations.
+
+    :param shes: iterable of DXF entities, usually the modelspace
+    :param str layer: entities on this layer are kept out of `entities` and `bbox`
+    :rtype: Metrics
+    """
+    return Metrics(extract(shes, layer))
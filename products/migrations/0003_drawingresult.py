@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DrawingResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(max_length=1024, verbose_name='Source url')),
+                ('version', models.CharField(max_length=100, verbose_name='Source version')),
+                ('options_hash', models.CharField(max_length=64, verbose_name='Options hash')),
+                ('result', models.TextField(verbose_name='Result')),
+                ('uploaded_url', models.TextField(blank=True, verbose_name='Uploaded url')),
+                ('tiles_url', models.TextField(blank=True, verbose_name='Tiles url')),
+                ('width', models.FloatField(blank=True, null=True, verbose_name='Width')),
+                ('height', models.FloatField(blank=True, null=True, verbose_name='Height')),
+                ('total_length', models.FloatField(blank=True, null=True, verbose_name='Total length')),
+                ('hatch_area', models.FloatField(blank=True, null=True, verbose_name='Hatch area')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='drawingresult',
+            constraint=models.UniqueConstraint(fields=('url', 'version', 'options_hash'), name='unique_drawing_result'),
+        ),
+    ]
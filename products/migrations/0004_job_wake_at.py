@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_drawingresult'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='wake_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Wake at'),
+        ),
+    ]
@@ -1,2 +1,67 @@
 # -*- coding: utf-8 -*-
+import uuid
+
 from django.db import models
+
+
+class Job(models.Model):
+    """ One getdxf / getframes run, queued in the database and picked up by a worker. """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=20, default='dxf', verbose_name='Kind')
+    url = models.TextField(verbose_name='Source url')
+    params = models.JSONField(default=dict, blank=True, verbose_name='Parameters')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True, verbose_name='Status')
+    result = models.TextField(blank=True, verbose_name='Result')
+    error = models.TextField(blank=True, verbose_name='Error')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Attempts')
+    worker = models.CharField(max_length=100, blank=True, verbose_name='Worker')
+    created = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created')
+    started = models.DateTimeField(null=True, blank=True, verbose_name='Started')
+    finished = models.DateTimeField(null=True, blank=True, verbose_name='Finished')
+    wake_at = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name='Wake at')
+
+    class Meta:
+        ordering = ['created']
+
+    def __str__(self):
+        return '%s %s %s' % (self.kind, self.id, self.status)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+
+class DrawingResult(models.Model):
+    """ getdxf result of one source blob version and option set, shared by every worker. """
+
+    url = models.CharField(max_length=1024, verbose_name='Source url')
+    version = models.CharField(max_length=100, verbose_name='Source version')
+    options_hash = models.CharField(max_length=64, verbose_name='Options hash')
+    result = models.TextField(verbose_name='Result')
+    uploaded_url = models.TextField(blank=True, verbose_name='Uploaded url')
+    tiles_url = models.TextField(blank=True, verbose_name='Tiles url')
+    width = models.FloatField(null=True, blank=True, verbose_name='Width')
+    height = models.FloatField(null=True, blank=True, verbose_name='Height')
+    total_length = models.FloatField(null=True, blank=True, verbose_name='Total length')
+    hatch_area = models.FloatField(null=True, blank=True, verbose_name='Hatch area')
+    created = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Created')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['url', 'version', 'options_hash'], name='unique_drawing_result'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.url, self.version)
@@ -0,0 +1,117 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+PIPELINE_IO_WORKERS = 8 # upload / download threads shared by every pipeline of the process
+
+_pool = None
+_pool_lock = threading.Lock()
+_stats = {}
+
+#============ Stage graph part ==============
+
+class Stage(object) :
+    def __init__(self, name, fn, deps = (), io = False) :
+        """
+        :param fn: called with the results of `deps`, in that order
+        :param bool io: run on the I/O threads instead of the calling thread
+        """
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.io = io
+
+class Pipeline(object) :
+    """
+    Stage graph run as soon as dependencies allow: I/O stages go to a
+    thread pool the moment their inputs are ready, compute stages run on
+    the calling thread in the order they were added, meanwhile. `run`
+    returns once every stage finished, with the wall time of each stage
+    in `timings`.
+
+        pipeline = Pipeline()
+        pipeline.stage('svg', make_svg, ['context'])
+        pipeline.stage('upload', upload, ['svg'], io = True)
+    """
+
+    def __init__(self, io_workers = None) :
+        self.stages = {}
+        self.io_workers = io_workers or PIPELINE_IO_WORKERS
+        self.timings = {}
+        self.elapsed = None
+
+    def stage(self, name, fn, deps = (), io = False) :
+        if name in self.stages :
+            raise ValueError('duplicate stage %s' % name)
+        self.stages[name] = Stage(name, fn, deps, io)
+        return self
+
+    def _call(self, stage, results) :
+        start = time.perf_counter()
+        try :
+            return stage.fn(*[results[dep] for dep in stage.deps])
+        finally :
+            self.timings[stage.name] = time.perf_counter() - start
+
+    def run(self) :
+        """ :returns: {stage name : result} """
+        start = time.perf_counter()
+        results = {}
+        running = {}
+        pending = list(self.stages.values())
+        io = _get_pool(self.io_workers)
+
+        try :
+            while pending or running :
+                ready = [stage for stage in pending if all(dep in results for dep in stage.deps)]
+                for stage in ready :
+                    if stage.io :
+                        pending.remove(stage)
+                        running[io.submit(self._call, stage, dict(results))] = stage.name
+
+                stage = next((stage for stage in ready if not stage.io), None)
+                if stage is not None :
+                    pending.remove(stage)
+                    results[stage.name] = self._call(stage, results)
+                elif running :
+                    done, _ = wait(running, return_when = FIRST_COMPLETED)
+                    for future in done :
+                        results[running.pop(future)] = future.result()
+                else :
+                    raise ValueError('stages %s wait on missing stages' % ', '.join(stage.name for stage in pending))
+        finally :
+            # a failed stage does not leave I/O stages behind
+            if running :
+                wait(running)
+            self.elapsed = time.perf_counter() - start
+            record(self.timings)
+
+        return results
+
+#============ Thread pool part ==============
+
+def _get_pool(workers) :
+    global _pool
+    with _pool_lock :
+        if _pool is None or _pool._max_workers < workers :
+            _pool = ThreadPoolExecutor(max_workers = workers, thread_name_prefix = 'pipeline-io')
+        return _pool
+
+#============ Timings part ==============
+
+def record(timings) :
+    with _pool_lock :
+        for name, elapsed in timings.items() :
+            stats = _stats.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+def stage_stats() :
+    """ {stage : {count, mean, max}} in seconds since the process started or the last reset. """
+    with _pool_lock :
+        return {name : {"count" : n, "mean" : total / n, "max" : peak} for name, (n, total, peak) in _stats.items()}
+
+def reset_stats() :
+    with _pool_lock :
+        _stats.clear()
@@ -0,0 +1,167 @@
+import json
+import os
+from math import ceil, log2
+
+import cv2
+import numpy as np
+
+from .convert import get_drawing_context, get_svg_file_path, get_frame_suffix
+from .geometry import extract, arc_points, bulge_points
+from .raster import HatchPrimitives, RASTER_WORKERS, SHIFT, pool_map
+from .spatial import GridIndex
+
+TILE_PIXELS = 256
+ARC_SAMPLES = 64
+PYRAMID_MAX_ZOOM = 6
+PYRAMID_MIN_PIXEL = 0.5 # drawing units per pixel at which zooming in stops
+
+#============ Primitive part ==============
+
+def preview_primitives(geometry, mask = None) :
+    """
+    Stroked outlines of the entities: polylines (closed ones repeat their
+    first vertex), flattened curves and arcs, circles and line segments.
+    """
+    if mask is None :
+        mask = np.ones(len(geometry.entities), dtype = bool)
+
+    paths = []
+    for batch in (geometry.polylines, geometry.curves) :
+        for k in np.nonzero(mask[batch.ids])[0] :
+            start, end = batch.offsets[k], batch.offsets[k + 1]
+            points = bulge_points(batch.vertices[start:end], batch.bulges[start:end], batch.closed[k])
+            paths.append(np.vstack((points, points[:1])) if batch.closed[k] else points)
+    for cx, cy, r, start, end in geometry.arcs[mask[geometry.arc_ids]] :
+        paths.append(arc_points(cx, cy, r, start, end, ARC_SAMPLES))
+
+    circles = geometry.circles[mask[geometry.circle_ids]]
+    segments = geometry.lines[mask[geometry.line_ids]].reshape(-1, 2, 2)
+    return HatchPrimitives(paths, circles, segments)
+
+#============ Tile rendering part ==============
+
+def render_tile(primitives, frame, scale, size = TILE_PIXELS) :
+    """
+    Black antialiased strokes on white, pixel (0, 0) at (frame xmin, frame ymax).
+
+    :returns: png bytes
+    """
+    img = np.full((size, size), 255, dtype = np.uint8)
+    one = 1 << SHIFT
+
+    def fixed(points) :
+        px = (points[..., 0] - frame[0]) * scale * one
+        py = (frame[3] - points[..., 1]) * scale * one
+        return np.stack((px, py), axis = -1).round().astype(np.int32)
+
+    if primitives.polygons :
+        cv2.polylines(img, [fixed(p) for p in primitives.polygons], False, 0, 1, cv2.LINE_AA, SHIFT)
+    for cx, cy, r in primitives.circles :
+        center = fixed(np.array((cx, cy)))
+        cv2.circle(img, (int(center[0]), int(center[1])), int(round(r * scale * one)), 0, 1, cv2.LINE_AA, SHIFT)
+    if len(primitives.segments) :
+        cv2.polylines(img, list(fixed(primitives.segments)), False, 0, 1, cv2.LINE_AA, SHIFT)
+
+    return cv2.imencode('.png', img)[1].tobytes()
+
+def _render_job(job) :
+    key, primitives, frame, scale, size = job
+    return key, render_tile(primitives, frame, scale, size)
+
+#============ Pyramid part ==============
+
+class TilePyramid(object) :
+    """
+    z/x/y tiles over the square of side max(width, height) anchored at the
+    top left of the frame. Zoom z has 2^z tiles per side, y counts down
+    from the top like web map tiles.
+    """
+
+    def __init__(self, primitives, frame, max_zoom = None, size = TILE_PIXELS) :
+        self.primitives = primitives
+        self.frame = frame
+        self.size = size
+        self.side = max(frame[1] - frame[0], frame[3] - frame[2])
+        if max_zoom is None :
+            max_zoom = int(ceil(log2(max(self.side / (size * PYRAMID_MIN_PIXEL), 1))))
+        self.max_zoom = min(max_zoom, PYRAMID_MAX_ZOOM)
+        self.index = GridIndex(primitives.bboxes())
+
+    def tile_frame(self, z, x, y) :
+        step = self.side / 2 ** z
+        x0, y1 = self.frame[0] + x * step, self.frame[3] - y * step
+        return [x0, x0 + step, y1 - step, y1]
+
+    def jobs(self, z) :
+        """ Render jobs of zoom z, tiles without any primitive are left out. """
+        step = self.side / 2 ** z
+        scale = self.size / step
+        pad = 1.0 / scale # one pixel for the stroke width
+        cols = max(1, int(ceil((self.frame[1] - self.frame[0]) / step)))
+        rows = max(1, int(ceil((self.frame[3] - self.frame[2]) / step)))
+        for y in range(rows) :
+            for x in range(cols) :
+                frame = self.tile_frame(z, x, y)
+                ids = self.index.query(frame[0] - pad, frame[1] + pad, frame[2] - pad, frame[3] + pad)
+                if len(ids) :
+                    yield (z, x, y), self.primitives.take(ids), frame, scale, self.size
+
+    def render(self, workers = None) :
+        """ Yields ((z, x, y), png bytes), zoom level by zoom level. """
+        workers = workers or RASTER_WORKERS or os.cpu_count()
+        for z in range(self.max_zoom + 1) :
+            for result in pool_map(_render_job, list(self.jobs(z)), workers) :
+                yield result
+
+    def metadata(self) :
+        return {
+            "tile_size" : self.size,
+            "min_zoom" : 0,
+            "max_zoom" : self.max_zoom,
+            "bounds" : [float(v) for v in self.frame],
+            "side" : float(self.side),
+        }
+
+def build_pyramid(dxffilepath, frame_name = None, max_zoom = None, size = TILE_PIXELS) :
+    context = get_drawing_context(dxffilepath)
+    entities, frame = context.filter(frame_name)
+    if frame_name :
+        geometry, mask = extract(entities), None
+    else :
+        geometry = context.metrics.geometry
+        mask = geometry.filtered
+    return TilePyramid(preview_primitives(geometry, mask), frame, max_zoom, size)
+
+def get_tile_dir(dxffilepath, suffix = '') :
+    return get_svg_file_path(dxffilepath, suffix)[:-len('.svg')] + '_tiles'
+
+def pyramid_files(dxffilepath, frame_name = None, max_zoom = None, workers = None) :
+    """ Yields (relative path, bytes) of every tile, z/x/y.png, and lastly of tiles.json. """
+    context = get_drawing_context(dxffilepath)
+    print('making tiles for %s ...'%(os.path.basename(context.filepath or 'drawing')))
+
+    pyramid = build_pyramid(context, frame_name, max_zoom)
+    count = 0
+    for (z, x, y), png in pyramid.render(workers) :
+        yield '%d/%d/%d.png' % (z, x, y), png
+        count += 1
+    print('  %d tiles, zoom 0-%d'%(count, pyramid.max_zoom))
+    yield 'tiles.json', json.dumps(pyramid.metadata()).encode('utf-8')
+
+def save_pyramid(dxffilepath, tiledir = None, frame_name = None, max_zoom = None, workers = None) :
+    """
+    Write the tile pyramid of the drawing as <tiledir>/z/x/y.png with a
+    tiles.json describing the zoom range and bounds.
+
+    :returns: tile directory
+    """
+    context = get_drawing_context(dxffilepath)
+    if tiledir is None :
+        tiledir = get_tile_dir(context.filepath, get_frame_suffix(frame_name) if frame_name else '')
+
+    for name, data in pyramid_files(context, frame_name, max_zoom, workers) :
+        path = os.path.join(tiledir, name)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, 'wb') as f :
+            f.write(data)
+    return tiledir
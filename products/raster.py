@@ -0,0 +1,208 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil, sqrt
+
+import cv2
+import numpy as np
+
+from .convert import get_drawing_context
+from .geometry import extract, arc_points, bulge_points
+from .spatial import GridIndex
+
+RASTER_SIZE = 512
+SHIFT = 4 # fractional bits of the fixed point vertices given to OpenCV
+ARC_SAMPLES = 16
+TILE_SIZE = 2048
+RASTER_WORKERS = None # None : one per cpu
+MAX_RASTER_PIXELS = 4 * 10 ** 9
+
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+_in_pool = False
+
+#============ Primitive part ==============
+
+class HatchPrimitives(object) :
+    """
+    What the hatch svg draws, in drawing units: filled and outlined
+    polygons, filled circles and stroked lines.
+    """
+
+    def __init__(self, polygons, circles, segments) :
+        self.polygons = polygons
+        self.circles = circles
+        self.segments = segments
+
+    def __len__(self) :
+        return len(self.polygons) + len(self.circles) + len(self.segments)
+
+    def bboxes(self) :
+        """ (n, 4) xmin, xmax, ymin, ymax of polygons, then circles, then segments. """
+        boxes = [(p[:, 0].min(), p[:, 0].max(), p[:, 1].min(), p[:, 1].max()) for p in self.polygons]
+        cx, cy, r = self.circles[:, 0], self.circles[:, 1], self.circles[:, 2]
+        x, y = self.segments[:, :, 0], self.segments[:, :, 1]
+        return np.concatenate((np.array(boxes).reshape(-1, 4),
+            np.column_stack((cx - r, cx + r, cy - r, cy + r)),
+            np.column_stack((x.min(axis = 1), x.max(axis = 1), y.min(axis = 1), y.max(axis = 1)))))
+
+    def take(self, ids) :
+        """ Primitives with the given ids, numbered like bboxes(). """
+        npoly, ncircle = len(self.polygons), len(self.circles)
+        ids = np.asarray(ids)
+        return HatchPrimitives([self.polygons[i] for i in ids[ids < npoly]],
+            self.circles[ids[(ids >= npoly) & (ids < npoly + ncircle)] - npoly],
+            self.segments[ids[ids >= npoly + ncircle] - npoly - ncircle])
+
+    def perimeter(self) :
+        total = sum(np.hypot(*np.diff(np.vstack((p, p[:1])), axis = 0).T).sum() for p in self.polygons)
+        total += (2 * np.pi * self.circles[:, 2]).sum()
+        total += np.hypot(*(self.segments[:, 1] - self.segments[:, 0]).T).sum()
+        return float(total)
+
+def hatch_primitives(geometry, mask = None) :
+    if mask is None :
+        mask = np.ones(len(geometry.entities), dtype = bool)
+
+    polygons = []
+    for batch in (geometry.polylines, geometry.curves) :
+        for k in np.nonzero(mask[batch.ids])[0] :
+            start, end = batch.offsets[k], batch.offsets[k + 1]
+            # svg fills open polylines as if they were closed
+            polygons.append(bulge_points(batch.vertices[start:end], batch.bulges[start:end], batch.closed[k]))
+    for cx, cy, r, start, end in geometry.arcs[mask[geometry.arc_ids]] :
+        polygons.append(arc_points(cx, cy, r, start, end, ARC_SAMPLES))
+
+    circles = geometry.circles[mask[geometry.circle_ids]]
+    segments = geometry.lines[mask[geometry.line_ids]].reshape(-1, 2, 2)
+    return HatchPrimitives(polygons, circles, segments)
+
+#============ Rasterizing part ==============
+
+def raster_scale(frame, size = RASTER_SIZE) :
+    return 1.0 * size / max(frame[1] - frame[0], frame[3] - frame[2])
+
+def rasterize(primitives, frame, scale, shape = None) :
+    """
+    Draw the primitives into a uint8 mask, pixel (0, 0) at (frame xmin, frame ymax).
+
+    :param frame: [xmin, xmax, ymin, ymax] in drawing units
+    :param float scale: pixels per drawing unit
+    :param shape: (rows, cols) of the buffer, defaults to the whole frame
+    """
+    if shape is None :
+        shape = (int(ceil((frame[3] - frame[2]) * scale)), int(ceil((frame[1] - frame[0]) * scale)))
+    img = np.zeros(shape, dtype = np.uint8)
+    one = 1 << SHIFT
+
+    def fixed(points) :
+        px = (points[..., 0] - frame[0]) * scale * one
+        py = (frame[3] - points[..., 1]) * scale * one
+        return np.stack((px, py), axis = -1).round().astype(np.int32)
+
+    # one call per polygon: overlapping shapes add up like the svg fills
+    for polygon in primitives.polygons :
+        pts = fixed(polygon)
+        cv2.fillPoly(img, [pts], 255, cv2.LINE_8, SHIFT)
+        cv2.polylines(img, [pts], False, 255, 1, cv2.LINE_8, SHIFT)
+
+    for cx, cy, r in primitives.circles :
+        center = fixed(np.array((cx, cy)))
+        cv2.circle(img, (int(center[0]), int(center[1])), int(round(r * scale * one)), 255, -1, cv2.LINE_8, SHIFT)
+
+    if len(primitives.segments) :
+        cv2.polylines(img, list(fixed(primitives.segments)), False, 255, 1, cv2.LINE_8, SHIFT)
+
+    return img
+
+#============ Tiled rasterizing part ==============
+
+def _count_tile(job) :
+    primitives, frame, scale, shape = job
+    return cv2.countNonZero(rasterize(primitives, frame, scale, shape))
+
+def _pool_initializer() :
+    # a forked worker inherits the parent's executor, using it from the child hangs: its own tiles are rendered serially
+    global _pool, _pool_workers, _pool_lock, _in_pool
+    _pool, _pool_workers, _pool_lock = None, None, threading.Lock()
+    _in_pool = True
+
+def _get_pool(workers) :
+    global _pool, _pool_workers
+    with _pool_lock :
+        if _pool is None or _pool_workers != workers :
+            if _pool is not None :
+                _pool.shutdown(wait = False)
+            _pool = ProcessPoolExecutor(max_workers = workers, initializer = _pool_initializer)
+            _pool_workers = workers
+        return _pool
+
+def pool_map(fn, jobs, workers) :
+    """ fn over the jobs in the shared process pool, in this process for one worker or job and inside a pool worker. """
+    if workers <= 1 or len(jobs) <= 1 or _in_pool :
+        return map(fn, jobs)
+    return _get_pool(workers).map(fn, jobs, chunksize = max(1, len(jobs) // (4 * workers)))
+
+def rasterize_tiled(primitives, frame, scale, tile = TILE_SIZE, workers = None) :
+    """
+    Pixel count of the primitives over the whole frame, rendered tile by tile.
+    Each tile only gets the primitives whose bbox touches it, tiles are
+    counted in a process pool.
+    """
+    rows = int(ceil((frame[3] - frame[2]) * scale))
+    cols = int(ceil((frame[1] - frame[0]) * scale))
+    index = GridIndex(primitives.bboxes())
+
+    jobs = []
+    for ty in range(0, rows, tile) :
+        for tx in range(0, cols, tile) :
+            shape = (min(tile, rows - ty), min(tile, cols - tx))
+            # tile frame, pixel edges stay on the same grid as the whole frame
+            x0, y1 = frame[0] + tx / scale, frame[3] - ty / scale
+            tile_frame = [x0, x0 + shape[1] / scale, y1 - shape[0] / scale, y1]
+            ids = index.query(*tile_frame)
+            if len(ids) :
+                jobs.append((primitives.take(ids), tile_frame, scale, shape))
+
+    return sum(pool_map(_count_tile, jobs, workers or RASTER_WORKERS or os.cpu_count()))
+
+def tolerance_scale(primitives, tolerance) :
+    """
+    Pixels per drawing unit so that the area error stays below `tolerance`.
+    Only boundary pixels can be wrong, about perimeter * pixel size of area.
+    """
+    return primitives.perimeter() / tolerance
+
+def rasterize_hatch(dxffilepath, frame_name = None, size = RASTER_SIZE, tolerance = None, workers = None) :
+    """
+    Rasterize the filtered entities of the drawing in memory.
+
+    :param int size: pixels along the longer frame side
+    :param float tolerance: target area error in drawing units, raises the
+        resolution above `size` when needed and renders in parallel tiles
+    :returns: (pixel count, scale in pixels per drawing unit)
+    """
+    context = get_drawing_context(dxffilepath)
+    entities, frame = context.filter(frame_name)
+    if not entities :
+        return 0, 1.0
+
+    if frame_name :
+        geometry, mask = extract(entities), None
+    else :
+        geometry = context.metrics.geometry
+        mask = geometry.filtered
+
+    primitives = hatch_primitives(geometry, mask)
+    scale = raster_scale(frame, size)
+    if tolerance :
+        scale = max(scale, tolerance_scale(primitives, tolerance))
+        pixels = (frame[1] - frame[0]) * (frame[3] - frame[2]) * scale * scale
+        if pixels > MAX_RASTER_PIXELS :
+            print("Hatch raster capped at %d pixels, area tolerance %s not reached" % (MAX_RASTER_PIXELS, tolerance))
+            scale *= sqrt(MAX_RASTER_PIXELS / pixels)
+
+    if max(frame[1] - frame[0], frame[3] - frame[2]) * scale <= TILE_SIZE :
+        return cv2.countNonZero(rasterize(primitives, frame, scale)), scale
+    return rasterize_tiled(primitives, frame, scale, workers = workers), scale
@@ -1,326 +1,480 @@
-import ezdxf
-import sys
-import math
 import os
-import cv2
 import datetime
 import json
+import tempfile
+import io
+import hashlib
+import time
 
-from .cloudconvert.api import Api
+from django.core.exceptions import ImproperlyConfigured
 
-from svglib.svglib import svg2rlg
-from reportlab.graphics import renderPM
-from .hatchArea import save_svg_from_hatch_dxf
-from .convert import save_svg_from_dxf
-from azure.storage.blob import BlobServiceClient, ContainerClient, BlobClient
+from .cloudconvert.api import Api
+from .cloudconvert.process import Process
+from .cloudconvert.exceptions import ConversionFailed, ConversionTimeout
+
+from .hatchArea import get_hatch_area, get_geometry_hatch_area
+from .raster import rasterize_hatch
+from .convert import export_svg, get_frame_suffix, DrawingContext
+from .metrics import measure
+from .pyramid import pyramid_files
+from .pipeline import Pipeline
+from . import storage
+from . import cache
+from .singleflight import flights, file_lock
+
+PIPELINE_VERSION = 1 # part of the result cache key, bump when the output of init changes
+
+# 'analytic' : exact loop areas, 'raster' : in-memory pixel count
+HATCH_AREA_METHOD = 'analytic'
+HATCH_RASTER_SIZE = 512
+HATCH_AREA_TOLERANCE = None # drawing units^2, picks the raster resolution when set
+SVG_COMPACT = True # uploaded previews use merged paths on a quantized grid
+PREVIEW_TILES = False # also upload a z/x/y png pyramid next to the svg
+SVG_ENCODING = 'gzip' # Content-Encoding of the uploaded svgs, 'gzip', 'br' (brotli package) or None for plain svg
+SVG_IMMUTABLE = False # upload svgs as <name>.<content hash>.svg with long cache headers, for a CDN
+SVG_CACHE_CONTROL = 'no-cache' # svgs under their plain name, caches revalidate against the ETag
+CONVERT_POLL = 1 # seconds before the first CloudConvert status check, doubled after each one
+CONVERT_POLL_MAX = 30
+CONVERT_TIMEOUT = 600 # seconds a conversion may take, a pending one older than this is started again
+CONVERTED_PREFIX = 'converted/' # conversion cache: converted/<md5 of the .ai file>.dxf
+SPOOL_MAX_SIZE = 32 * 1024 * 1024 # sources up to this size stay in memory, larger ones spill to SPOOL_DIR
+SPOOL_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None # tmpfs, None : system temp dir
 
 # ============== Get Height ==============
 
 def getHeight(shes) :
-    minY, maxY = 999999, 0
-    for sh in shes :
-        if sh.dxftype() == 'LINE' :
-            sy, ey = sh.dxf.start[1], sh.dxf.end[1]
-            minY = min(minY, sy, ey)
-            maxY = max(maxY, sy, ey)
-        if sh.dxftype() == 'ARC' :
-            sy = sh.dxf.center[1] + math.sin(math.radians(sh.dxf.start_angle)) * sh.dxf.radius
-            ey = sh.dxf.center[1] + math.sin(math.radians(sh.dxf.end_angle)) * sh.dxf.radius
-            minY = min(minY, sy, ey)
-            maxY = max(maxY, sy, ey)
-            if sh.dxf.start_angle <= 90 and sh.dxf.end_angle >= 90 :
-                pt = sh.dxf.center[1] + sh.dxf.radius
-                maxY = max(maxY, pt)
-            if sh.dxf.start_angle <=270 and sh.dxf.end_angle >= 270 :
-                pt = sh.dxf.center[1] - sh.dxf.radius
-                minY = min(minY, pt)
-        if sh.dxftype() == 'CIRCLE' :
-            sy = sh.dxf.center[1] - sh.dxf.radius
-            ey = sh.dxf.center[1] + sh.dxf.radius
-            minY = min(minY, sy, ey)
-            maxY = max(maxY, sy, ey)
-        if sh.dxftype() == 'SPLINE' :
-            fts = sh.fit_points
-            for i in range(fts.__len__()) :
-                v = fts.__getitem__(i)
-                minY = min(minY, v[1])
-                maxY = max(maxY, v[1])
-        if sh.dxftype() == 'ELLIPSE' :
-            tmp = sh.to_spline(False)
-            fts = tmp.fit_points
-            for i in range(fts.__len__()) :
-                v = fts.__getitem__(i)
-                minY = min(minY, v[1])
-                maxY = max(maxY, v[1])
-            del tmp
-        if sh.dxftype() == 'LWPOLYLINE' :
-            pt = [p[1] for p in sh.get_points("xy")]
-            minY = min(minY, min(pt))
-            maxY = max(maxY, max(pt))
-        if sh.dxftype() == 'POLYLINE' :
-            pt = [p.dxf.location[1] for p in sh.vertices]
-            minY = min(minY, min(pt))
-            maxY = max(maxY, max(pt))
-        if sh.dxftype() == 'TEXT':
-            minY = min(minY, sh.dxf.insert[1])
-            maxY = max(maxY, sh.dxf.insert[1])
-    
-    return maxY - minY
+    return measure(shes).height
 
 # ============== Get Width ==============
 
 def getWidth(shes) :
-    minX, maxX = 999999, 0
-    for sh in shes :
-        if sh.dxftype() == 'LINE' :
-            sx, ex = sh.dxf.start[0], sh.dxf.end[0]
-            minX = min(minX, sx, ex)
-            maxX = max(maxX, sx, ex)
-        if sh.dxftype() == 'ARC' :
-            sx = sh.dxf.center[0] + math.cos(math.radians(sh.dxf.start_angle)) * sh.dxf.radius
-            ex = sh.dxf.center[0] + math.cos(math.radians(sh.dxf.end_angle)) * sh.dxf.radius
-            minX = min(minX, sx, ex)
-            maxX = max(maxX, sx, ex)
-            if sh.dxf.start_angle <= 360 and sh.dxf.end_angle >= 0 :
-                pt = sh.dxf.center[0] + sh.dxf.radius
-                maxX = max(maxX, pt)
-            if sh.dxf.start_angle <=180 and sh.dxf.end_angle >= 180 :
-                pt = sh.dxf.center[0] - sh.dxf.radius
-                minX = min(minX, pt)
-        if sh.dxftype() == 'CIRCLE' :
-            sx = sh.dxf.center[0] - sh.dxf.radius
-            ex = sh.dxf.center[0] + sh.dxf.radius
-            minX = min(minX, sx, ex)
-            maxX = max(maxX, sx, ex)
-        if sh.dxftype() == 'SPLINE' :
-            fts = sh.fit_points
-            for i in range(fts.__len__()) :
-                v = fts.__getitem__(i)
-                minX = min(minX, v[0])
-                maxX = max(maxX, v[0])
-        if sh.dxftype() == 'ELLIPSE' :
-            tmp = sh.to_spline(False)
-            fts = tmp.fit_points
-            for i in range(fts.__len__()) :
-                v = fts.__getitem__(i)
-                minX = min(minX, v[0])
-                maxX = max(maxX, v[0])
-            del tmp
-        if sh.dxftype() == 'LWPOLYLINE' :
-            pt = [p[0] for p in sh.get_points("xy")]
-            minX = min(minX, min(pt))
-            maxX = max(maxX, max(pt))
-        if sh.dxftype() == 'POLYLINE' :
-            pt = [p.dxf.location[0] for p in sh.vertices]
-            minX = min(minX, min(pt))
-            maxX = max(maxX, max(pt))
-        if sh.dxftype() == 'TEXT':
-            minX = min(minX, sh.dxf.insert[0])
-            maxX = max(maxX, sh.dxf.insert[0])
-    
-    return maxX - minX
+    return measure(shes).width
 
 # ============== Get Length ==============
 
 def getTotalLength(shes) :
-    total = 0
-    for sh in shes :
-        if sh.dxftype() == 'LINE' :
-            total += math.sqrt(math.pow((sh.dxf.start[0] - sh.dxf.end[0]), 2) + math.pow((sh.dxf.start[1] - sh.dxf.end[1]), 2))
-        if sh.dxftype() == 'ARC' :
-            if sh.dxf.start_angle > sh.dxf.end_angle :
-                rad = math.radians(sh.dxf.end_angle + 360 - sh.dxf.start_angle)
-            else :
-                rad = math.radians(sh.dxf.end_angle - sh.dxf.start_angle)
-            total += rad * sh.dxf.radius
-        if sh.dxftype() == 'CIRCLE' :
-            total += 2 * math.pi * sh.dxf.radius
-        if sh.dxftype() == 'SPLINE' :
-            fts = sh.fit_points
-            for i in range(fts.__len__()) :
-                v1 = fts.__getitem__(i)
-                v2 = fts.__getitem__(i + 1)
-                ds = math.sqrt((v2[0] - v1[0]) ** 2 + (v2[1] - v1[1]) ** 2)
-                total += ds
-        if sh.dxftype() == 'ELLIPSE' :
-            tmp = sh.to_spline(False)
-            fts = tmp.fit_points
-            for i in range(fts.__len__()) :
-                v1 = fts.__getitem__(i)
-                v2 = fts.__getitem__(i + 1)
-                ds = math.sqrt((v2[0] - v1[0]) ** 2 + (v2[1] - v1[1]) ** 2)
-                total += ds
-            del tmp
-        if sh.dxftype() == 'LWPOLYLINE' :
-            pt = sh.get_points("xy")
-            for i in range(len(pt) - 1) :
-                ds = math.sqrt((pt[i][0] - pt[i + 1][0]) ** 2 + (pt[i][1] - pt[i + 1][1]) ** 2)
-                total += ds
-            if sh.closed is True :
-                lstId = len(pt) - 1
-                ds = math.sqrt((pt[lstId][0] - pt[0][0]) ** 2 + (pt[lstId][1] - pt[0][1]) ** 2)
-                total += ds
-        if sh.dxftype() == 'POLYLINE' :
-            pt = sh.vertices
-            for i in range(len(pt) - 1) :
-                ds = math.sqrt((pt[i].dxf.location[0] - pt[i + 1].dxf.location[0]) ** 2 + (pt[i].dxf.location[1] - pt[i + 1].dxf.location[1]) ** 2)
-                total += ds
-            if sh.is_closed is True :
-                lstId = len(pt) - 1
-                ds = math.sqrt((pt[lstId].dxf.location[0] - pt[0].dxf.location[0]) ** 2 + (pt[lstId].dxf.location[1] - pt[0].dxf.location[1]) ** 2)
-                total += ds
-
-    return total
+    return measure(shes).total_length
 
 # ============== Set dxf file path ==============
 
-def setDxfFilePath(filepath) :
-    dxf = ezdxf.readfile(filepath)
-    dxf.header['$INSUNITS'] = 1
+def setDxfFilePath(filepath, name = None) :
+    context = DrawingContext(filepath, name)
     global msp
-    msp = dxf.modelspace()
+    msp = context.msp
+
+    return context
 
 # ============== Get Hatch Area ===============
 
-def getArea(hatchpngfspath, scale) :
-    img = cv2.imread(hatchpngfspath)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    ret, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY)
-    area = cv2.countNonZero(thresh)
-    result = area * 2 / scale / scale
+def getPixelArea(pixels, scale) :
+    """ Drawing units^2 of a filled pixel count, `scale` in pixels per drawing unit of the raster over the drawing bounds. """
+    return pixels / scale / scale
 
-    return result
+def getRasterHatchArea(context, size = None, tolerance = None) :
+    pixels, scl = rasterize_hatch(context, size = size or HATCH_RASTER_SIZE,
+        tolerance = tolerance or HATCH_AREA_TOLERANCE)
+
+    return getPixelArea(pixels, scl)
+
+def getHatchArea(context, method = None) :
+    method = method or HATCH_AREA_METHOD
+    if method == 'raster' :
+        return getRasterHatchArea(context)
+    return get_hatch_area(context)
 
 # ============== Downloading part ==============
 
+def spooledFile() :
+    # unnamed, nothing is left on disk even when it spilled over
+    return tempfile.SpooledTemporaryFile(max_size = SPOOL_MAX_SIZE, dir = SPOOL_DIR)
+
 def downloadSrc(url) :
+    """ Blob of the url in a spooled buffer, rewound. """
     tmp = url
     res = tmp.split("/")
     filename = res[len(res) - 1]
-    downloads_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    
-    connection_string = "DefaultEndpointsProtocol=https;AccountName=mambamfgblob;AccountKey=chmmP6HA9Z8R1ZUyGg20tL/rCpjDt0qwxW8uYOxrm+KqCAQshGs8i8ItfzxyfE21TUtqR5ATIJjE3fNc+oneXQ==;EndpointSuffix=core.windows.net"
-    blob_service_client = BlobServiceClient.from_connection_string(conn_str = connection_string)
-    container_name = 'files'
-    container_client = blob_service_client.get_container_client(container_name)
 
-    fsdir = downloads_dir + "/" + container_name
-    fspath = fsdir + "/" + filename
+    return downloadBlob(filename)
 
-    if not(os.path.isdir(fsdir)):
-        os.makedirs(fsdir, exist_ok = True)
+def downloadBlob(filename) :
+    container_name = 'files'
 
+    my_blob = spooledFile()
     try :
-        blob_client = container_client.get_blob_client(filename)
-        with open(fspath, "wb") as my_blob :
-            blob_data = blob_client.download_blob()
-            blob_data.readinto(my_blob)
+        # pooled container client, no new connection per download
+        storage.download_blob(filename, my_blob, container_name)
     except :
         print("Can't download files or doesn't exist file!")
+        my_blob.close()
+        raise
+    my_blob.seek(0)
 
-    return fspath
+    return my_blob
 
 # ============ Uploading Part =============
 
-def uploadSrc(path, url) :
+def uploadSrc(src, url, suffix = '', immutable = None, encoding = None, size = None) :
+    """
+    Upload the svg unless the blob already has the same content (MD5), a
+    changed svg replaces the old one.
+
+    :param src: svg bytes, binary stream or file path
+    :param bool immutable: content hashed blob name, defaults to SVG_IMMUTABLE
+    :param str encoding: Content-Encoding src is compressed with
+    :param int size: uncompressed svg size, kept in the blob metadata
+    """
+    if immutable is None :
+        immutable = SVG_IMMUTABLE
+
     tmp = url
     res = tmp.split("/")
     filename = res[len(res) - 1]
 
-    if '.dxf' in filename :
-        blob_name = filename.replace('.dxf', '.svg')
-    elif '.DXF' in filename :
-        blob_name = filename.replace('.DXF', '.svg')
-    elif '.ai' in filename :
-        blob_name = filename.replace('.ai', '.svg')
-    elif '.AI' in filename :
-        blob_name = filename.replace('.AI', '.svg')
-    
-    connection_string = "DefaultEndpointsProtocol=https;AccountName=mambamfgblob;AccountKey=chmmP6HA9Z8R1ZUyGg20tL/rCpjDt0qwxW8uYOxrm+KqCAQshGs8i8ItfzxyfE21TUtqR5ATIJjE3fNc+oneXQ==;EndpointSuffix=core.windows.net"
+    if isinstance(src, str) :
+        with open(src, "rb") as data :
+            src = data.read()
+    elif hasattr(src, 'read') :
+        src = src.read()
+
+    blob_name = uploadName(filename, suffix)
+    cache_control = SVG_CACHE_CONTROL
+    if immutable :
+        blob_name = hashedName(blob_name, src)
+        cache_control = storage.IMMUTABLE_CACHE_CONTROL
     container_name = "files"
 
-    blob = BlobClient.from_connection_string(conn_str = connection_string, container_name = container_name, blob_name = blob_name)
+    metadata = {"svg_size" : str(size if size is not None else len(src))}
+    # a failed upload raises: the url of a blob that was never written must not be returned and cached
+    if not storage.upload_if_changed(blob_name, src, container_name, 'image/svg+xml', cache_control,
+            content_encoding = encoding, metadata = metadata) :
+        print("%s is unchanged, upload skipped"%(blob_name))
 
-    try :
-        with open("./test3.svg", "rb") as data :
-            blob.upload_blob(data)
-    except :
-        print("Can't upload file or already uploaded!")
-    
-    if '.dxf' in url :
-        rlt = url.replace('.dxf', '.svg')
-    elif '.DXF' in url :
-        rlt = url.replace('.DXF', '.svg')
-    elif '.ai' in url :
-        rlt = url.replace('.ai', '.svg')
-    elif '.AI' in url :
-        rlt = url.replace('.AI', '.svg')
+    rlt = tmp[:len(tmp) - len(filename)] + blob_name
 
     return rlt
 
-# ============ PDF to Dxf file convert part ==============
+def uploadTiles(tiles, url, suffix = '') :
+    """
+    Upload every tile as <svg blob name>_tiles/z/x/y.png, returns the tile url template.
+
+    :param tiles: {relative path : bytes} or a tile directory
+    """
+    svgUrl = uploadName(url, suffix)
+    blob_prefix = uploadName(url.split("/")[-1], suffix)[:-len('.svg')] + '_tiles/'
+
+    container_name = "files"
+
+    if isinstance(tiles, str) :
+        tiledir = tiles
+        tiles = {}
+        for root, dirs, files in os.walk(tiledir) :
+            for name in files :
+                path = os.path.join(root, name)
+                tiles[os.path.relpath(path, tiledir).replace(os.sep, '/')] = path
+
+    for name in sorted(tiles) :
+        blob_name = blob_prefix + name
+        content_type = 'application/json' if name.endswith('.json') else 'image/png'
+        if isinstance(tiles[name], str) :
+            with open(tiles[name], "rb") as data :
+                storage.upload_if_changed(blob_name, data, container_name, content_type, SVG_CACHE_CONTROL)
+        else :
+            storage.upload_if_changed(blob_name, tiles[name], container_name, content_type, SVG_CACHE_CONTROL)
+
+    return svgUrl[:-len('.svg')] + '_tiles/{z}/{x}/{y}.png'
+
+def uploadName(name, suffix = '') :
+    for ext in ('.dxf', '.DXF', '.ai', '.AI') :
+        if ext in name :
+            return name.replace(ext, suffix + '.svg')
+    return name + suffix + '.svg'
+
+def makeSvg(context, frame_name = None) :
+    """ (svg bytes in SVG_ENCODING, uncompressed svg size) of the drawing or one of its frames """
+    out = io.BytesIO()
+    size, encoded = export_svg(context, out, frame_name, compact = SVG_COMPACT, encoding = SVG_ENCODING)
+    return out.getvalue(), size
+
+def hashedName(blob_name, data) :
+    # <name>.<first 16 hex digits of the md5>.svg, a new content gets a new name
+    return blob_name[:-len('.svg')] + '.' + storage.content_hash(data)[:16] + '.svg'
 
-def pdf_to_dxf(path) :
-    api = Api('M8NhM50249eK0vCcAYDjpj0L3eesFWVdw1N6SnQ3rj9j3OLaBMu6VWMhPRqjCiO1')
-    resPath = path.replace(".pdf", ".dxf")
+# ============ PDF to Dxf file convert part ==============
 
-    process = api.convert({
+class ConversionPending(Exception) :
+    """ The CloudConvert conversion still runs, check again after `retry_after` seconds. """
+
+    def __init__(self, retry_after) :
+        super(ConversionPending, self).__init__('conversion running, retry after %.0f s' % retry_after)
+        self.retry_after = retry_after
+
+def cloudConvertApi() :
+    key = storage.setting('CLOUDCONVERT_API_KEY')
+    if not key :
+        raise ImproperlyConfigured('CLOUDCONVERT_API_KEY is not set, .ai files cannot be converted')
+    api = Api(key)
+    # e.g. the local fake, http://127.0.0.1:8001
+    endpoint = storage.setting('CLOUDCONVERT_ENDPOINT')
+    if endpoint :
+        api.protocol, api.endpoint = endpoint.split('://')
+    return api
+
+def startConversion(src, name = 'source.pdf', callback = None) :
+    parameters = {
         "inputformat": "pdf",
         "outputformat": "dxf",
         "input": "upload",
-        "file": open(path, 'rb')
-    })
-    process.wait()
-    process.download(resPath)
-
-    return resPath
+        "file": (name, src)
+    }
+    if callback :
+        parameters["callback"] = callback
+    return cloudConvertApi().convert(parameters)
+
+def downloadConversion(process) :
+    """ Output of the finished process in a spooled buffer, rewound. """
+    if process.data.get('step') == 'error' :
+        raise ConversionFailed(process.data.get('message'))
+
+    res = spooledFile()
+    process.downloadStream(res)
+    res.seek(0)
+
+    return res
+
+def pdf_to_dxf(src, name = 'source.pdf') :
+    """ Convert the pdf stream with CloudConvert, returns the dxf in a spooled buffer. """
+    process = startConversion(src, name)
+    process.wait(CONVERT_POLL, backoff = 2, max_interval = CONVERT_POLL_MAX, timeout = CONVERT_TIMEOUT)
+
+    return downloadConversion(process)
+
+def convertAi(url, wait = True, callback = None) :
+    """
+    DXF of the .ai blob through the conversion cache, converted/<md5>.dxf:
+    a file converted before, by any worker, is not sent to CloudConvert
+    again. A running conversion is kept in converted/<md5>.json, so it is
+    resumed instead of started twice. A failed, timed out or lost
+    conversion drops the marker, the next call starts it again.
+
+    :param bool wait: poll until done, else raise ConversionPending while it runs
+    :param str callback: url CloudConvert calls when done, for wait False
+    :returns: blob name of the converted dxf
+    """
+    filename = url.split("/")[-1]
+    src = None
+    version = storage.blob_version(filename, "files")
+    if version.startswith('md5:') :
+        digest = version[len('md5:'):]
+    else :
+        # no stored md5, e.g. a chunked upload
+        src = downloadSrc(url)
+        digest = hashlib.md5(src.read()).hexdigest()
+        src.seek(0)
+
+    converted = CONVERTED_PREFIX + digest + '.dxf'
+    marker = CONVERTED_PREFIX + digest + '.json'
+    if storage.blob_exists(converted, "files") :
+        if src is not None :
+            src.close()
+        return converted
+
+    pending = storage.read_blob(marker, "files")
+    pending = json.loads(pending) if pending else None
+    try :
+        if pending is not None and time.time() - pending["started"] < CONVERT_TIMEOUT :
+            if src is not None :
+                src.close()
+            process = Process(cloudConvertApi(), pending["process"]).refresh()
+        else :
+            if src is None :
+                src = downloadSrc(url)
+            # .ai files are pdf compatible
+            with src :
+                process = startConversion(src, filename.rsplit('.', 1)[0] + ".pdf", None if wait else callback)
+            pending = {"process" : process.url, "started" : time.time()}
+            storage.upload_blob(marker, json.dumps(pending), "files", overwrite = True)
+
+        elapsed = time.time() - pending["started"]
+        if wait :
+            process.wait(CONVERT_POLL, backoff = 2, max_interval = CONVERT_POLL_MAX, timeout = max(CONVERT_TIMEOUT - elapsed, 0))
+        elif not process.finished() :
+            if elapsed >= CONVERT_TIMEOUT :
+                raise ConversionTimeout("CloudConvert did not finish %s within %d seconds" % (filename, CONVERT_TIMEOUT))
+            # checked again after half its age, the intervals grow like a backoff
+            raise ConversionPending(min(max(elapsed / 2, CONVERT_POLL), CONVERT_POLL_MAX))
+
+        with downloadConversion(process) as dxf :
+            storage.upload_if_changed(converted, dxf, "files", 'application/dxf')
+    except ConversionPending :
+        raise
+    except Exception :
+        # nothing to resume, the next call starts a new conversion instead of failing on this one
+        storage.delete_blob(marker, "files")
+        raise
+    storage.delete_blob(marker, "files")
+
+    return converted
+
+def isAi(url) :
+    name = url.split("/")[-1]
+    return ".ai" in name or ".AI" in name
 
 # ============ Initializing part ==============
 
-def init(url) :
-    tmpPath = downloadSrc(url)
+def getSource(url) :
+    """ (dxf file name, dxf stream) of the url, .ai files are converted on the way. Nothing is written to disk. """
+    name = url.split("/")[-1]
+
+    if isAi(url) :
+        base = name.replace(".ai", "").replace(".AI", "")
+        return base + ".dxf", downloadBlob(convertAi(url))
+
+    return name, downloadSrc(url)
+
+def openSource(source) :
+    """ Parsed drawing of (dxf file name, binary stream or bytes), parsed once and shared by every stage. """
+    name, src = source
+    if isinstance(src, bytes) :
+        src = io.BytesIO(src)
+    with src :
+        return setDxfFilePath(src, name)
+
+def init(url, tiles = None) :
+    if tiles is None :
+        tiles = PREVIEW_TILES
+
+    # stage graph: the uploads run on I/O threads while metrics and hatch area are computed
+    pipeline = Pipeline()
+    pipeline.stage('download', lambda : getSource(url), io = True)
+    pipeline.stage('parse', openSource, ['download'])
+    pipeline.stage('svg', makeSvg, ['parse'])
+    pipeline.stage('upload', lambda svg : uploadSrc(svg[0], url, encoding = SVG_ENCODING, size = svg[1]), ['svg'], io = True)
+    if tiles :
+        pipeline.stage('tiles', lambda context : dict(pyramid_files(context)), ['parse'])
+        pipeline.stage('upload_tiles', lambda files : uploadTiles(files, url), ['tiles'], io = True)
+    pipeline.stage('metrics', lambda context : context.metrics, ['parse'])
+    pipeline.stage('hatch', getHatchArea, ['parse'])
+    results = pipeline.run()
+
+    print('stages: ' + ', '.join('%s %.0f ms' % (name, 1000 * t) for name, t in pipeline.timings.items())
+        + ' | total %.0f ms' % (1000 * pipeline.elapsed))
+
+    metrics = results['metrics']
+    data_set = getDataSet(results['upload'], metrics.width, metrics.height, metrics.total_length, results['hatch'],
+        results.get('upload_tiles'))
+    json_data = json.dumps(data_set)
+
+    return json_data
 
-    if ".ai" in tmpPath or ".AI" in tmpPath :
-        if ".ai" in tmpPath :
-            pdfpath = tmpPath.replace(".ai", ".pdf")
-        elif ".AI" in tmpPath :
-            pdfpath = tmpPath.replace(".AI", ".pdf")
+# ============ Result cache part ==============
 
-        try :
-            os.rename(tmpPath, pdfpath)
-        except :
-            print("Can't rename file because source file doesn't exist or same name file already exist!")
-        fspath = pdf_to_dxf(pdfpath)
-    else :
-        fspath = tmpPath
+def resultOptions(tiles = None) :
+    """ Settings the init result depends on, besides the source. """
+    return {
+        "tiles" : bool(PREVIEW_TILES if tiles is None else tiles),
+        "compact" : SVG_COMPACT,
+        "encoding" : SVG_ENCODING,
+        "immutable" : SVG_IMMUTABLE,
+        "hatch" : [HATCH_AREA_METHOD, HATCH_RASTER_SIZE, HATCH_AREA_TOLERANCE],
+    }
 
-    setDxfFilePath(fspath)
+def resultKey(url, tiles = None) :
+    """ Cache key of init: [url, source blob version (read without downloading), hash of PIPELINE_VERSION and options] """
+    filename = url.split("/")[-1]
+    return [url, storage.blob_version(filename, "files"), cache.result_key(PIPELINE_VERSION, resultOptions(tiles))]
 
-    svgfspath = save_svg_from_dxf(fspath)
-    uploadedUrl = uploadSrc(svgfspath, url)
-    print(svgfspath)
-    print(uploadedUrl)
+def cacheKey(url, tiles = None) :
+    """ resultKey, None when the source version can't be read. """
+    try :
+        return resultKey(url, tiles)
+    except Exception :
+        print("Can't read the source version, result cache skipped!")
+        return None
+
+def cachedResult(url, tiles = None) :
+    """ (key, cached init json or None). A failed version lookup is a miss without key. """
+    key = cacheKey(url, tiles)
+    if key is None :
+        return None, None
+    return key, cache.get_result(key)
+
+def cachedInit(url, tiles = None, key = None) :
+    """
+    init through the result cache, a changed source blob gets a new key.
+
+    :param key: resultKey of a caller that already missed the cache
+    """
+    if key is None :
+        key, json_data = cachedResult(url, tiles)
+        if json_data is not None :
+            print("result cache hit for %s"%(url))
+            return json_data
+        if key is None :
+            return init(url, tiles)
+
+    # concurrent calls for the same key wait for one computation, in this process and on the host
+    return flights.do(cache.result_key(*key), lambda : computeOnce(url, tiles, key))
+
+def computeOnce(url, tiles, key) :
+    with file_lock(cache.result_key(*key)) :
+        # the worker that held the lock before may have stored it
+        json_data = cache.get_result(key)
+        if json_data is not None :
+            print("result computed by another worker for %s"%(url))
+            return json_data
+
+        json_data = init(url, tiles)
+        cache.put_result(key, json_data)
 
-    W = getWidth(msp)
-    H = getHeight(msp)
+    return json_data
 
-    print("Width = " + str(W) + "  |  Height = " + str(H))
+def processSource(source, tiles = None) :
+    """
+    Compute stage of init: svg, optional tiles, metrics and hatch area. No
+    network, no files: the results are kept in memory.
 
-    totalLength = getTotalLength(msp)
+    :param source: (dxf file name, binary stream or bytes) of getSource
+    """
+    if tiles is None :
+        tiles = PREVIEW_TILES
 
-    print("Total Length = " + str(totalLength))
+    context = openSource(source)
 
-    svghatchpath, scl = save_svg_from_hatch_dxf(fspath)
-    pnghatchpath = svghatchpath.replace('.svg', '.png')
+    svg = makeSvg(context)
 
-    drawing = svg2rlg(svghatchpath)
-    renderPM.drawToFile(drawing, pnghatchpath, fmt = "PNG")
+    tileFiles = None
+    if tiles :
+        # zoomable preview from the same extraction, tiles rendered in parallel
+        tileFiles = dict(pyramid_files(context))
 
-    hatch_area = getArea(pnghatchpath, scl)
-    print(hatch_area)
+    # width, height and length come from the same single modelspace walk
+    metrics = context.metrics
+    W = metrics.width
+    H = metrics.height
+    totalLength = metrics.total_length
+    hatch_area = getHatchArea(context)
 
-    os.remove(svghatchpath)
-    os.remove(pnghatchpath)
+    return {
+        "svg" : svg,
+        "tiles" : tileFiles,
+        "Width" : W,
+        "Height" : H,
+        "Total_Length" : totalLength,
+        "Hatch_area" : hatch_area,
+    }
+
+def publishResult(result, url) :
+    """ Upload stage of init: svg and tiles of processSource, returns the init data set. """
+    uploadedUrl = uploadSrc(result["svg"][0], url, encoding = SVG_ENCODING, size = result["svg"][1])
+    tilesUrl = uploadTiles(result["tiles"], url) if result["tiles"] else None
+
+    return getDataSet(uploadedUrl, result["Width"], result["Height"], result["Total_Length"], result["Hatch_area"], tilesUrl)
+
+def getDataSet(uploadedUrl, W, H, totalLength, hatch_area, tilesUrl = None) :
+    print(uploadedUrl)
+    print("Width = " + str(W) + "  |  Height = " + str(H))
+    print("Total Length = " + str(totalLength))
+    print(hatch_area)
 
     data_set = {
         "Uploaded_Url" : uploadedUrl,
@@ -330,6 +484,32 @@ def init(url) :
         "Hatch_area" : hatch_area,
         "Units" : "Inch"
     }
-    json_data = json.dumps(data_set)
+    if tilesUrl :
+        data_set["Tiles_Url"] = tilesUrl
+
+    return data_set
+
+def initFrames(url, with_metrics = False) :
+    context = openSource(getSource(url))
+
+    # all frames found and filled in one sweep, then one svg per frame, uploaded from memory
+    data_sets = []
+    for frame_name in context.filter_frames() :
+        svg, size = makeSvg(context, frame_name)
+        data_set = {
+            "Frame" : frame_name,
+            "Uploaded_Url" : uploadSrc(svg, url, get_frame_suffix(frame_name), encoding = SVG_ENCODING, size = size)
+        }
+        if with_metrics :
+            metrics = measure(context.filter(frame_name)[0])
+            data_set.update({
+                "Width" : metrics.width,
+                "Height" : metrics.height,
+                "Total_Length" : metrics.total_length,
+                "Hatch_area" : get_geometry_hatch_area(metrics.geometry),
+                "Units" : "Inch"
+            })
+        data_sets.append(data_set)
+    json_data = json.dumps(data_sets)
 
     return json_data
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try :
+    import fcntl
+except ImportError :
+    fcntl = None
+
+FLIGHT_LOCK_DIR = os.path.join(tempfile.gettempdir(), 'conceptu-flights')
+FLIGHT_LOCK_TIMEOUT = 300 # seconds a worker waits for another one before computing anyway
+FLIGHT_LOCK_STRIPES = 3 # hex digits of the key hash naming the lock file, at most 16^3 files
+
+#============ In-process part ==============
+
+class _Call(object) :
+    def __init__(self) :
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight(object) :
+    """
+    Concurrent calls with the same key share one execution: the first
+    caller runs the function, the others wait for it and get its value or
+    its exception.
+    """
+
+    def __init__(self) :
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn) :
+        with self._lock :
+            call = self._calls.get(key)
+            leader = call is None
+            if leader :
+                call = self._calls[key] = _Call()
+            else :
+                call.waiters += 1
+
+        if not leader :
+            call.done.wait()
+            if call.error is not None :
+                raise call.error
+            return call.value
+
+        try :
+            call.value = fn()
+        except Exception as exc :
+            call.error = exc
+            raise
+        finally :
+            with self._lock :
+                del self._calls[key]
+            call.done.set()
+        return call.value
+
+    def in_flight(self) :
+        with self._lock :
+            return {key : call.waiters for key, call in self._calls.items()}
+
+#============ Cross-worker part ==============
+
+@contextmanager
+def file_lock(key, timeout = FLIGHT_LOCK_TIMEOUT) :
+    """
+    Exclusive lock of the key shared by every process of the host, e.g. the
+    gunicorn workers and `run_jobs`. Yields True when held, False after
+    `timeout` seconds or where flock is missing, the caller then goes on
+    unlocked. Keys share a bounded set of lock files, rarely two keys wait
+    on each other.
+    """
+    if fcntl is None :
+        yield False
+        return
+
+    os.makedirs(FLIGHT_LOCK_DIR, exist_ok = True)
+    stripe = hashlib.sha1(key.encode('utf-8')).hexdigest()[:FLIGHT_LOCK_STRIPES]
+    with open(os.path.join(FLIGHT_LOCK_DIR, stripe + '.lock'), 'a') as f :
+        deadline = time.monotonic() + timeout
+        delay = 0.01
+        while True :
+            try :
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                held = True
+                break
+            except BlockingIOError :
+                if time.monotonic() >= deadline :
+                    held = False
+                    break
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+        try :
+            yield held
+        finally :
+            if held :
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+# getdxf computations of this process, see readFile.cachedInit
+flights = SingleFlight()
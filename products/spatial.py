@@ -0,0 +1,181 @@
+from math import sqrt
+
+import numpy as np
+
+#============ Grid index part ==============
+
+class GridIndex(object) :
+    """
+    Uniform grid over item bboxes. Every item is listed in each cell its bbox
+    touches, cell lists are stored as one sorted array with offsets.
+    """
+
+    def __init__(self, bboxes, cell = None) :
+        """
+        :param bboxes: (n, 4) array of xmin, xmax, ymin, ymax
+        :param float cell: cell size, defaults to about one item per cell
+        """
+        self.bboxes = bboxes = np.asarray(bboxes, dtype = np.float64).reshape(-1, 4)
+        n = len(bboxes)
+        if n :
+            self.x0, self.y0 = bboxes[:, 0].min(), bboxes[:, 2].min()
+            width = max(bboxes[:, 1].max() - self.x0, 1e-9)
+            height = max(bboxes[:, 3].max() - self.y0, 1e-9)
+        else :
+            self.x0 = self.y0 = 0.0
+            width = height = 1.0
+        if cell is None :
+            cell = max(sqrt(width * height / max(n, 1)), width / 4096, height / 4096)
+        self.cell = cell
+        self.nx = int(width // cell) + 1
+        self.ny = int(height // cell) + 1
+
+        ix0, ix1, iy0, iy1 = self._cells(bboxes[:, 0], bboxes[:, 1], bboxes[:, 2], bboxes[:, 3])
+        w = ix1 - ix0 + 1
+        counts = w * (iy1 - iy0 + 1)
+        items = np.repeat(np.arange(n), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        keys = (np.repeat(iy0, counts) + k // np.repeat(w, counts)) * self.nx + np.repeat(ix0, counts) + k % np.repeat(w, counts)
+
+        order = np.argsort(keys, kind = 'stable')
+        self.items = items[order]
+        self.offsets = np.zeros(self.nx * self.ny + 1, dtype = np.int64)
+        np.cumsum(np.bincount(keys, minlength = self.nx * self.ny), out = self.offsets[1:])
+
+    def _cells(self, xmin, xmax, ymin, ymax) :
+        ix0 = np.clip(((np.asarray(xmin) - self.x0) // self.cell).astype(np.int64), 0, self.nx - 1)
+        ix1 = np.clip(((np.asarray(xmax) - self.x0) // self.cell).astype(np.int64), 0, self.nx - 1)
+        iy0 = np.clip(((np.asarray(ymin) - self.y0) // self.cell).astype(np.int64), 0, self.ny - 1)
+        iy1 = np.clip(((np.asarray(ymax) - self.y0) // self.cell).astype(np.int64), 0, self.ny - 1)
+        return ix0, ix1, iy0, iy1
+
+    def __len__(self) :
+        return len(self.bboxes)
+
+    def query(self, xmin, xmax, ymin, ymax) :
+        """ Sorted ids of the items whose bbox intersects the rectangle. """
+        if not len(self.bboxes) :
+            return np.zeros(0, dtype = np.int64)
+        ix0, ix1, iy0, iy1 = (int(v) for v in self._cells(xmin, xmax, ymin, ymax))
+        parts = []
+        for iy in range(iy0, iy1 + 1) :
+            row = iy * self.nx
+            parts.append(self.items[self.offsets[row + ix0]:self.offsets[row + ix1 + 1]])
+        ids = np.unique(np.concatenate(parts))
+        b = self.bboxes[ids]
+        hit = (b[:, 0] <= xmax) & (b[:, 1] >= xmin) & (b[:, 2] <= ymax) & (b[:, 3] >= ymin)
+        return ids[hit]
+
+    def query_point(self, x, y, radius = 0.0) :
+        return self.query(x - radius, x + radius, y - radius, y + radius)
+
+    def stab(self, points) :
+        """
+        All (point, item) pairs where the item bbox contains the point, in one
+        vectorized pass over the points.
+
+        :param points: (m, 2) array
+        :returns: (point ids, item ids)
+        """
+        points = np.asarray(points, dtype = np.float64).reshape(-1, 2)
+        if not len(self.bboxes) or not len(points) :
+            empty = np.zeros(0, dtype = np.int64)
+            return empty, empty
+        ix, _, iy, _ = self._cells(points[:, 0], points[:, 0], points[:, 1], points[:, 1])
+        keys = iy * self.nx + ix
+        starts = self.offsets[keys]
+        counts = self.offsets[keys + 1] - starts
+        point_ids = np.repeat(np.arange(len(points)), counts)
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        item_ids = self.items[np.repeat(starts, counts) + k]
+
+        b, p = self.bboxes[item_ids], points[point_ids]
+        hit = (b[:, 0] <= p[:, 0]) & (p[:, 0] <= b[:, 1]) & (b[:, 2] <= p[:, 1]) & (p[:, 1] <= b[:, 3])
+        return point_ids[hit], item_ids[hit]
+
+#============ Frame index part ==============
+
+class FrameIndex(object) :
+    """
+    Named frames of a drawing: a TEXT on the frame layer names the
+    LWPOLYLINE on the same layer that passes within one text height of its
+    insert point. Built once per document, frame lookups and in-frame
+    queries then only touch the grid cells they cover.
+    """
+
+    def __init__(self, geometry) :
+        """ :param geometry: Geometry extracted with the frame layer, its entities are not `filtered` """
+        self.geometry = geometry
+        on_layer = ~geometry.filtered
+        entities = geometry.entities
+
+        # frame names, the last TEXT with a name wins like the former scan
+        self.texts = {}
+        for i in geometry.text_ids[on_layer[geometry.text_ids]] :
+            self.texts[entities[i].dxf.text] = entities[i]
+
+        # frame rectangles: LWPOLYLINE on the frame layer
+        batch = geometry.polylines
+        frames = [k for k in np.nonzero(on_layer[batch.ids])[0] if entities[batch.ids[k]].dxftype() == 'LWPOLYLINE']
+        self.frame_points = [batch.vertices[batch.offsets[k]:batch.offsets[k + 1]] for k in frames]
+        self.frame_index = GridIndex([(p[:, 0].min(), p[:, 0].max(), p[:, 1].min(), p[:, 1].max()) for p in self.frame_points])
+
+        # anchor point of every LINE, CIRCLE, TEXT and ARC off the frame layer
+        arcs = geometry.arcs
+        a0 = np.radians(arcs[:, 3])
+        points = np.concatenate((geometry.lines[:, :2], geometry.circles[:, :2], geometry.texts,
+            np.column_stack((arcs[:, 0] + arcs[:, 2] * np.cos(a0), arcs[:, 1] + arcs[:, 2] * np.sin(a0)))))
+        ids = np.concatenate((geometry.line_ids, geometry.circle_ids, geometry.text_ids, geometry.arc_ids))
+        keep = geometry.filtered[ids]
+        self.anchor_ids = ids[keep]
+        self.anchor_points = points = points[keep]
+        self.anchor_index = GridIndex(np.column_stack((points[:, 0], points[:, 0], points[:, 1], points[:, 1])))
+
+    def frame_rect(self, frame_name) :
+        """ [xmin, xmax, ymin, ymax] of the named frame, None when not found. """
+        text = self.texts.get(frame_name)
+        if text is None :
+            return None
+        x, y = text.dxf.insert[0], text.dxf.insert[1]
+        height = text.dxf.height
+
+        match = None
+        for k in self.frame_index.query_point(x, y, height) :
+            points = self.frame_points[k]
+            if (np.hypot(points[:, 0] - x, points[:, 1] - y) < height).any() :
+                match = points
+        if match is None :
+            return None
+        return [float(match[:, 0].min()), float(match[:, 0].max()), float(match[:, 1].min()), float(match[:, 1].max())]
+
+    def entities_in(self, rect) :
+        """ Entities whose anchor point lies in rect, in modelspace order. """
+        ids = np.sort(self.anchor_ids[self.anchor_index.query(*rect)])
+        return [self.geometry.entities[i] for i in ids]
+
+    def frame_rects(self) :
+        """ {frame name : rect} of every named frame found on the layer. """
+        rects = {}
+        for name in self.texts :
+            rect = self.frame_rect(name)
+            if rect is not None :
+                rects[name] = rect
+        return rects
+
+    def assign(self, rects) :
+        """
+        Entities of every frame in one sweep: each anchor point is stabbed
+        into a grid over the frame rects.
+
+        :param dict rects: {frame name : rect}
+        :returns: {frame name : entities in modelspace order}
+        """
+        names = list(rects)
+        point_ids, frame_ids = GridIndex([rects[name] for name in names]).stab(self.anchor_points)
+        ids = self.anchor_ids[point_ids]
+        order = np.lexsort((ids, frame_ids))
+        ids, frame_ids = ids[order], frame_ids[order]
+        bounds = np.searchsorted(frame_ids, np.arange(len(names) + 1))
+
+        entities = self.geometry.entities
+        return {name : [entities[i] for i in ids[bounds[k]:bounds[k + 1]]] for k, name in enumerate(names)}
@@ -0,0 +1,286 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+import requests
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import ContainerClient, ContentSettings
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+MEMORY = 'memory://' # connection string of the in-process fake storage
+BLOB_CONTAINER = 'files'
+BLOB_POOL_SIZE = 32 # kept-alive connections per blob host
+BLOB_MAX_CONCURRENCY = 4 # parallel ranged GETs or staged blocks per blob
+BLOB_CHUNK_SIZE = 4 * 1024 * 1024 # bytes per ranged GET and per staged block
+BLOB_SINGLE_SIZE = 8 * 1024 * 1024 # blobs up to this size move in one request
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable' # content addressed blobs never change
+
+_session = None
+_containers = {}
+_lock = threading.Lock()
+_latency = {}
+
+#============ Configuration part ==============
+
+def setting(name, default = None) :
+    """ Django setting, then environment variable, then default. """
+    value = getattr(settings, name, None) if settings.configured else None
+    if value is None :
+        value = os.environ.get(name, default)
+    return value
+
+def get_connection_string() :
+    connection_string = setting('AZURE_STORAGE_CONNECTION_STRING')
+    if not connection_string :
+        raise ImproperlyConfigured('AZURE_STORAGE_CONNECTION_STRING is not set, export the storage account connection string '
+            '(or memory:// for the in-process fake)')
+    return connection_string
+
+def get_session() :
+    """ One requests session per process, its connection pool keeps the TLS connections alive. """
+    global _session
+    if _session is None :
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections = 4, pool_maxsize = int(setting('BLOB_POOL_SIZE', BLOB_POOL_SIZE)))
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        _session = session
+    return _session
+
+def transfer_options() :
+    """ Client chunking of large blobs, see BLOB_CHUNK_SIZE and BLOB_SINGLE_SIZE. """
+    chunk = int(setting('BLOB_CHUNK_SIZE', BLOB_CHUNK_SIZE))
+    single = int(setting('BLOB_SINGLE_SIZE', BLOB_SINGLE_SIZE))
+    return {
+        "max_single_get_size" : single,
+        "max_chunk_get_size" : chunk,
+        "max_single_put_size" : single,
+        "max_block_size" : chunk,
+    }
+
+def max_concurrency() :
+    return int(setting('BLOB_MAX_CONCURRENCY', BLOB_MAX_CONCURRENCY))
+
+def get_container(container_name = None) :
+    """
+    Container client built once per process and container, all blob calls
+    share its pipeline and the pooled session. The `memory://` connection
+    string gives the in-process fake, an Azurite connection string works
+    like a real account.
+    """
+    container_name = container_name or setting('AZURE_STORAGE_CONTAINER', BLOB_CONTAINER)
+    connection_string = get_connection_string()
+    key = (connection_string, container_name)
+    with _lock :
+        if key not in _containers :
+            if connection_string == MEMORY :
+                _containers[key] = MemoryContainer(container_name)
+            else :
+                transport = RequestsTransport(session = get_session(), session_owner = False)
+                _containers[key] = ContainerClient.from_connection_string(connection_string, container_name,
+                    transport = transport, **transfer_options())
+        return _containers[key]
+
+def reset() :
+    """ Forget the cached clients, e.g. after the connection string changed. """
+    global _session
+    with _lock :
+        _containers.clear()
+        _session = None
+
+#============ Blob part ==============
+
+def download_blob(blob_name, stream, container_name = None, concurrency = None) :
+    """
+    Blob into the stream. Past the first BLOB_SINGLE_SIZE bytes the rest
+    comes as ranged GETs, `concurrency` of them in parallel; the stream
+    must be seekable then.
+    """
+    with timed('download') :
+        downloader = get_container(container_name).get_blob_client(blob_name).download_blob(
+            max_concurrency = concurrency or max_concurrency())
+        return downloader.readinto(stream)
+
+def upload_blob(blob_name, data, container_name = None, overwrite = False, concurrency = None, **kwargs) :
+    """ Block blob upload, larger than BLOB_SINGLE_SIZE it is staged in blocks, `concurrency` at a time. """
+    with timed('upload') :
+        return get_container(container_name).upload_blob(blob_name, data, overwrite = overwrite,
+            max_concurrency = concurrency or max_concurrency(), **kwargs)
+
+def blob_version(blob_name, container_name = None) :
+    """ Content version of the blob without downloading it: 'md5:<hex>' of its content md5, else 'etag:<etag>'. """
+    with timed('properties') :
+        properties = get_container(container_name).get_blob_client(blob_name).get_blob_properties()
+    md5 = properties.content_settings.content_md5
+    if md5 :
+        return 'md5:' + bytes(md5).hex()
+    return 'etag:' + properties.etag.strip('"')
+
+def blob_exists(blob_name, container_name = None) :
+    with timed('properties') :
+        return get_container(container_name).get_blob_client(blob_name).exists()
+
+def read_blob(blob_name, container_name = None) :
+    """ Bytes of a small blob, None when it does not exist. """
+    stream = io.BytesIO()
+    try :
+        download_blob(blob_name, stream, container_name)
+    except ResourceNotFoundError :
+        return None
+    return stream.getvalue()
+
+def delete_blob(blob_name, container_name = None) :
+    """ Delete the blob, a missing one is fine. """
+    try :
+        get_container(container_name).delete_blob(blob_name)
+    except ResourceNotFoundError :
+        pass
+
+def content_hash(data) :
+    """ Hex MD5 of the bytes, the digest the blob service keeps as content md5. """
+    return hashlib.md5(data).hexdigest()
+
+def upload_if_changed(blob_name, data, container_name = None, content_type = None, cache_control = None, content_encoding = None, **kwargs) :
+    """
+    Upload the bytes unless the blob already holds them: the MD5 is compared
+    with the content md5 stored with the blob, a different or missing one
+    is overwritten. The MD5 is stored with every upload, chunked ones too.
+
+    :returns: True when uploaded, False when the blob was unchanged
+    """
+    if hasattr(data, 'read') :
+        data = data.read()
+    md5 = hashlib.md5(data).digest()
+
+    blob = get_container(container_name).get_blob_client(blob_name)
+    try :
+        with timed('properties') :
+            stored = blob.get_blob_properties().content_settings.content_md5
+        if stored is not None and bytes(stored) == md5 :
+            return False
+    except ResourceNotFoundError :
+        pass
+
+    content_settings = ContentSettings(content_type = content_type, content_encoding = content_encoding,
+        cache_control = cache_control, content_md5 = bytearray(md5))
+    upload_blob(blob_name, data, container_name, overwrite = True, content_settings = content_settings, **kwargs)
+    return True
+
+#============ Latency part ==============
+
+@contextmanager
+def timed(label) :
+    start = time.perf_counter()
+    try :
+        yield
+    finally :
+        elapsed = time.perf_counter() - start
+        with _lock :
+            stats = _latency.setdefault(label, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+
+def latency_stats() :
+    """ {label : {count, mean, max}} in seconds since the process started or the last reset. """
+    with _lock :
+        return {label : {"count" : n, "mean" : total / n, "max" : peak} for label, (n, total, peak) in _latency.items()}
+
+def reset_latency() :
+    with _lock :
+        _latency.clear()
+
+#============ In-process fake part ==============
+
+BlobProperties = namedtuple('BlobProperties', 'name size etag content_settings')
+
+class MemoryDownload(object) :
+    def __init__(self, data) :
+        self.data = data
+        self.size = len(data)
+
+    def readall(self) :
+        return self.data
+
+    def readinto(self, stream) :
+        stream.write(self.data)
+        return self.size
+
+    def chunks(self) :
+        yield self.data
+
+class MemoryBlob(object) :
+    """ The part of BlobClient the app uses, backed by a MemoryContainer. """
+
+    def __init__(self, container, blob_name) :
+        self.container = container
+        self.blob_name = blob_name
+        self.url = 'memory://%s/%s' % (container.container_name, blob_name)
+
+    def exists(self) :
+        return self.blob_name in self.container.blobs
+
+    def download_blob(self, **kwargs) :
+        try :
+            return MemoryDownload(self.container.blobs[self.blob_name][0])
+        except KeyError :
+            raise ResourceNotFoundError('The specified blob does not exist.')
+
+    def upload_blob(self, data, overwrite = False, content_settings = None, **kwargs) :
+        if hasattr(data, 'read') :
+            data = data.read()
+        if isinstance(data, str) :
+            data = data.encode('utf-8')
+        with self.container.lock :
+            if self.blob_name in self.container.blobs and not overwrite :
+                raise ResourceExistsError('The specified blob already exists.')
+            self.container.blobs[self.blob_name] = (bytes(data), content_settings)
+        return {"etag" : hashlib.md5(data).hexdigest()}
+
+    def get_blob_properties(self, **kwargs) :
+        try :
+            data, content_settings = self.container.blobs[self.blob_name]
+        except KeyError :
+            raise ResourceNotFoundError('The specified blob does not exist.')
+        # like the service, the md5 given with the upload is kept, else the one of the data
+        stored = ContentSettings(**{k : v for k, v in vars(content_settings).items() if v is not None}) if content_settings else ContentSettings()
+        if stored.content_md5 is None :
+            stored.content_md5 = bytearray(hashlib.md5(data).digest())
+        return BlobProperties(self.blob_name, len(data), hashlib.md5(data).hexdigest(), stored)
+
+    def delete_blob(self, **kwargs) :
+        with self.container.lock :
+            if self.container.blobs.pop(self.blob_name, None) is None :
+                raise ResourceNotFoundError('The specified blob does not exist.')
+
+class MemoryContainer(object) :
+    """ In-process fake of ContainerClient for tests and benchmarks. """
+
+    def __init__(self, container_name) :
+        self.container_name = container_name
+        self.blobs = {}
+        self.lock = threading.Lock()
+
+    def get_blob_client(self, blob) :
+        return MemoryBlob(self, blob)
+
+    def upload_blob(self, name, data, overwrite = False, **kwargs) :
+        blob = self.get_blob_client(name)
+        blob.upload_blob(data, overwrite = overwrite, **kwargs)
+        return blob
+
+    def download_blob(self, blob, **kwargs) :
+        return self.get_blob_client(blob).download_blob(**kwargs)
+
+    def delete_blob(self, blob, **kwargs) :
+        self.get_blob_client(blob).delete_blob(**kwargs)
+
+    def list_blobs(self, name_starts_with = None, **kwargs) :
+        return [BlobProperties(name, len(data), None, None) for name, (data, _) in sorted(self.blobs.items())
+            if name_starts_with is None or name.startswith(name_starts_with)]
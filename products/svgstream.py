@@ -0,0 +1,360 @@
+import io
+import zlib
+from math import atan2, degrees, hypot, pi, radians, cos, sin
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from .geometry import simplify
+
+try :
+    import brotli
+except ImportError :
+    brotli = None
+
+BUFFER_SIZE = 1 << 16
+STROKE = 'black'
+PRECISION = 10 # compact grid steps per svg pixel
+PATH_COMMANDS = 4096 # compact commands per <path> element
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+SVG_HEAD = ('<?xml version="1.0" encoding="utf-8" ?>\n'
+    '<svg baseProfile="full" height="%s" version="1.1" viewBox="%s %s %s %s" width="%s" '
+    'xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" '
+    'xmlns:xlink="http://www.w3.org/1999/xlink"><defs />')
+
+#============ Curve segments part ==============
+
+def arc_segments(cx, cy, r, start_angle, end_angle) :
+    """
+    Counter clockwise arc from start to end angle in degrees.
+
+    :returns: (start point, [(rx, ry, rotation, large arc, sweep, end point)])
+    """
+    a0, a1 = radians(start_angle), radians(end_angle)
+    large = 1 if (end_angle - start_angle) % 360 > 180 else 0
+    return (cx + r * cos(a0), cy + r * sin(a0)), [(r, r, 0.0, large, 1, (cx + r * cos(a1), cy + r * sin(a1)))]
+
+def ellipse_segments(e) :
+    """ ELLIPSE as elliptical arc segments, full ellipses are split in two halves. """
+    major = e.dxf.major_axis
+    ratio = e.dxf.ratio
+    start, end = e.dxf.start_param, e.dxf.end_param
+    span = (end - start) % (2 * pi)
+    if span < 1e-9 :
+        span = 2 * pi
+    params = [start, start + span / 2, start + span] if span > pi else [start, start + span]
+
+    points = list(e.vertices(params))
+    rx = hypot(major[0], major[1])
+    rotation = degrees(atan2(major[1], major[0]))
+    # param direction is clockwise for a mirrored extrusion
+    sweep = 1 if e.dxf.extrusion[2] >= 0 else 0
+    return points[0], [(rx, rx * ratio, rotation, 0, sweep, p) for p in points[1:]]
+
+def spline_segments(e) :
+    """
+    SPLINE as cubic bezier segments, None when it has no control or fit points.
+
+    :returns: (start point, [(control 1, control 2, end point)])
+    """
+    try :
+        curves = list(e.construction_tool().cubic_bezier_approximation())
+    except ValueError :
+        return None
+    if not curves :
+        return None
+    return curves[0].control_points[0], [curve.control_points[1:] for curve in curves]
+
+#============ Path data part ==============
+
+def _xy(p) :
+    return '%s,%s' % (p[0], p[1])
+
+def arcs_data(start, segments) :
+    return 'M ' + _xy(start) + ''.join(' A %s,%s %s %d,%d %s' % (rx, ry, rot, large, sweep, _xy(p))
+        for rx, ry, rot, large, sweep, p in segments)
+
+def curves_data(start, curves) :
+    return 'M ' + _xy(start) + ''.join(' C %s %s %s' % (_xy(c1), _xy(c2), _xy(p)) for c1, c2, p in curves)
+
+def points_data(points) :
+    return ' '.join('%s,%s' % (p[0], p[1]) for p in points)
+
+#============ Streaming writer part ==============
+
+class SvgStream(object) :
+    """
+    Writes svg elements straight to a file object as they are added. The
+    drawing scale and Y flip are set once on a root group that also carries
+    the stroke attributes, elements inside use drawing coordinates.
+    Only the pending buffer is kept in memory.
+    """
+
+    def __init__(self, out, size, viewbox, scale, buffer_size = BUFFER_SIZE, simplify = None) :
+        """
+        :param out: binary or text file object, a socket file works as well
+        :param int size: svg width and height
+        :param viewbox: (minx, miny, width, height) in svg units
+        :param float scale: svg units per drawing unit
+        :param float simplify: polyline tolerance in svg pixels, None keeps every vertex
+        """
+        self.out = out
+        self.tolerance = simplify / scale if simplify else None
+        self.vertices_in = self.vertices_out = 0
+        self.binary = not isinstance(out, io.TextIOBase)
+        self.buffer_size = buffer_size
+        self._parts = []
+        self._pending = 0
+        self.closed = False
+
+        self.write(SVG_HEAD % ((size, ) + tuple(viewbox) + (size, )))
+        self.begin(scale)
+
+    def begin(self, scale) :
+        self.write('<g transform="scale(%s,%s)" fill="none" stroke="%s" stroke-width="%s">'
+            % (scale, -scale, STROKE, 1.0 / scale))
+
+    def write(self, text) :
+        self._parts.append(text)
+        self._pending += len(text)
+        if self._pending >= self.buffer_size :
+            self.flush()
+
+    def flush(self) :
+        data = ''.join(self._parts)
+        self._parts = []
+        self._pending = 0
+        self.out.write(data.encode('utf-8') if self.binary else data)
+
+    def line(self, x1, y1, x2, y2) :
+        self.write('<line x1="%s" y1="%s" x2="%s" y2="%s" />' % (x1, y1, x2, y2))
+
+    def circle(self, cx, cy, r) :
+        self.write('<circle cx="%s" cy="%s" r="%s" />' % (cx, cy, r))
+
+    def _points(self, points) :
+        """ Polyline vertices as an (n, 2) array, simplified to the pixel tolerance. """
+        points = np.asarray(points, dtype = np.float64).reshape(-1, 2)
+        self.vertices_in += len(points)
+        if self.tolerance :
+            points = simplify(points, self.tolerance)
+        self.vertices_out += len(points)
+        return points
+
+    def polyline(self, points) :
+        self.write('<polyline points="%s" />' % points_data(self._points(points).tolist()))
+
+    def arcs(self, start, segments) :
+        self.write('<path d="%s" />' % arcs_data(start, segments))
+
+    def curves(self, start, curves) :
+        self.write('<path d="%s" />' % curves_data(start, curves))
+
+    def text(self, text, x, y, height) :
+        # flipped back locally so the glyphs stand upright
+        self.write('<text fill="black" font-size="%s" stroke="none" transform="translate(%s,%s) scale(1,-1)">%s</text>'
+            % (height, x, y, escape(text)))
+
+    def end(self) :
+        self.write('</g></svg>')
+
+    def close(self) :
+        if not self.closed :
+            self.end()
+            self.flush()
+            self.closed = True
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, *exc) :
+        self.close()
+
+def _numbers(values) :
+    # integers, the separator before a minus sign is not needed
+    return ' '.join(map(str, values)).replace(' -', '-')
+
+class CompactSvgStream(SvgStream) :
+    """
+    Optimized output: every stroked entity goes into shared <path> elements
+    with relative commands, coordinates are integers on a grid of
+    1 / (scale * precision) drawing units, i.e. `precision` steps per svg
+    pixel. Output only depends on the entities and their order.
+    """
+
+    def __init__(self, out, size, viewbox, scale, precision = PRECISION, max_commands = PATH_COMMANDS, buffer_size = BUFFER_SIZE, simplify = None) :
+        self.precision = precision
+        self.grid = scale * precision
+        self.max_commands = max_commands
+        self._d = []
+        self._pen = None
+        super(CompactSvgStream, self).__init__(out, size, viewbox, scale, buffer_size, simplify)
+
+    def begin(self, scale) :
+        # grid units to svg units, stroke one svg pixel wide
+        self.write('<g transform="scale(%s,%s)" fill="none" stroke="%s" stroke-width="%s">'
+            % (1.0 / self.precision, -1.0 / self.precision, STROKE, self.precision))
+
+    def _q(self, v) :
+        return int(round(v * self.grid))
+
+    def _command(self, command) :
+        self._d.append(command)
+
+    def _done(self) :
+        # paths are only split between entities
+        if len(self._d) >= self.max_commands :
+            self._end_path()
+
+    def _end_path(self) :
+        if self._d :
+            self.write('<path d="%s"/>' % ''.join(self._d))
+            self._d = []
+            self._pen = None
+
+    def _move(self, x, y) :
+        """ Move the pen to grid point (x, y), skipped when the pen is already there. """
+        if self._pen is None :
+            self._command('M' + _numbers((x, y)))
+        elif self._pen != (x, y) :
+            self._command('m' + _numbers((x - self._pen[0], y - self._pen[1])))
+        self._pen = (x, y)
+
+    def _line_to(self, points) :
+        px, py = self._pen
+        deltas = []
+        for x, y in points :
+            if x != px or y != py :
+                deltas.extend((x - px, y - py))
+                px, py = x, y
+        if deltas :
+            self._command('l' + _numbers(deltas))
+        self._pen = (px, py)
+
+    def line(self, x1, y1, x2, y2) :
+        self._move(self._q(x1), self._q(y1))
+        self._line_to([(self._q(x2), self._q(y2))])
+        self._done()
+
+    def circle(self, cx, cy, r) :
+        x, y, r = self._q(cx), self._q(cy), self._q(r)
+        self._move(x + r, y)
+        self._command('a' + _numbers((r, r, 0, 1, 0, -2 * r, 0, r, r, 0, 1, 0, 2 * r, 0)))
+        self._done()
+
+    def polyline(self, points) :
+        points = np.rint(self._points(points) * self.grid).astype(np.int64)
+        if len(points) :
+            self._move(*points[0].tolist())
+            deltas = np.diff(points, axis = 0)
+            deltas = deltas[deltas.any(axis = 1)]
+            if len(deltas) :
+                self._command('l' + _numbers(deltas.ravel().tolist()))
+            self._pen = tuple(points[-1].tolist())
+            self._done()
+
+    def arcs(self, start, segments) :
+        self._move(self._q(start[0]), self._q(start[1]))
+        for rx, ry, rotation, large, sweep, p in segments :
+            x, y = self._q(p[0]), self._q(p[1])
+            self._command('a%s %s %s' % (_numbers((self._q(rx), self._q(ry))), '%.4g' % rotation,
+                _numbers((large, sweep, x - self._pen[0], y - self._pen[1]))))
+            self._pen = (x, y)
+        self._done()
+
+    def curves(self, start, curves) :
+        self._move(self._q(start[0]), self._q(start[1]))
+        for curve in curves :
+            px, py = self._pen
+            values = []
+            for p in curve :
+                values.extend((self._q(p[0]) - px, self._q(p[1]) - py))
+            self._command('c' + _numbers(values))
+            self._pen = (px + values[4], py + values[5])
+        self._done()
+
+    def text(self, text, x, y, height) :
+        self.write('<text fill="black" font-size="%d" stroke="none" transform="translate(%d,%d) scale(1,-1)">%s</text>'
+            % (max(1, self._q(height)), self._q(x), self._q(y), escape(text)))
+
+    def end(self) :
+        self._end_path()
+        super(CompactSvgStream, self).end()
+
+class SvgTee(object) :
+    """ Sends every element to several streams in one pass over the entities, e.g. the output and a size counter. """
+
+    def __init__(self, *streams) :
+        self.streams = streams
+
+    def _forward(name) :
+        def forward(self, *args) :
+            for stream in self.streams :
+                getattr(stream, name)(*args)
+        forward.__name__ = name
+        return forward
+
+    line = _forward('line')
+    circle = _forward('circle')
+    polyline = _forward('polyline')
+    arcs = _forward('arcs')
+    curves = _forward('curves')
+    text = _forward('text')
+    close = _forward('close')
+    del _forward
+
+class ByteCounter(object) :
+    """ Binary sink that only counts what is written to it. """
+
+    def __init__(self) :
+        self.size = 0
+
+    def write(self, data) :
+        self.size += len(data)
+
+class CompressedWriter(object) :
+    """
+    Binary sink compressing on the fly into `out` with a Content-Encoding,
+    'gzip' or 'br' (needs the brotli package). Only the compressor state is
+    kept in memory. The output has no timestamp, the same svg always gives
+    the same bytes. `size` and `compressed_size` count both sides.
+    """
+
+    def __init__(self, out, encoding, level = None) :
+        if encoding == 'gzip' :
+            # wbits 31 : gzip header and trailer, mtime 0
+            compressor = zlib.compressobj(level or GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._compress, self._finish = compressor.compress, compressor.flush
+        elif encoding == 'br' :
+            if brotli is None :
+                raise ValueError('br encoding needs the brotli package')
+            compressor = brotli.Compressor(quality = level or BROTLI_QUALITY)
+            self._compress, self._finish = compressor.process, compressor.finish
+        else :
+            raise ValueError('unknown encoding %s' % encoding)
+        self.out = out
+        self.encoding = encoding
+        self.size = self.compressed_size = 0
+        self.closed = False
+
+    def _put(self, data) :
+        if data :
+            self.compressed_size += len(data)
+            self.out.write(data)
+
+    def write(self, data) :
+        self.size += len(data)
+        self._put(self._compress(data))
+
+    def close(self) :
+        # the stream underneath stays open
+        if not self.closed :
+            self._put(self._finish())
+            self.closed = True
+
+def write_empty_svg(out, size, alerttext = '! nothing to display !') :
+    text = (SVG_HEAD % (size, 0, 0, size, size, size)
+        + '<text font-size="20" x="50" y="50">%s</text></svg>' % escape(alerttext))
+    out.write(text if isinstance(out, io.TextIOBase) else text.encode('utf-8'))
@@ -0,0 +1,488 @@
+import hashlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from math import pi
+from unittest import mock
+
+import ezdxf
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from . import cache, pyramid, readFile, singleflight, storage
+from .batch import process_batch
+from .blobserver import BlobHandler, BlobServer
+from .cache import LruCache
+from .cloudconvert.exceptions import ConversionFailed
+from .fakeconvert import FakeCloudConvert
+from .hatchArea import get_hatch_area
+from .jobs import RUNNERS, JOB_MAX_ATTEMPTS, JOB_TIMEOUT, claim, requeue_lost, run, wait, wake
+from .models import Job
+from .readFile import ConversionPending
+from .singleflight import SingleFlight, file_lock
+
+
+def new_drawing() :
+    doc = ezdxf.new()
+    return doc, doc.modelspace()
+
+
+class HatchAreaTests(SimpleTestCase) :
+    """ Hatch_area: loops are filled, nested loops alternate between fill and hole. """
+
+    def test_bulge_circle(self) :
+        # two half circle bulges make a closed circle of radius 1
+        doc, msp = new_drawing()
+        msp.add_lwpolyline([(-1, 0, 1), (1, 0, 1)], format = 'xyb', dxfattribs = {'closed' : True})
+        self.assertAlmostEqual(get_hatch_area(doc), pi)
+
+    def test_bulge_rounded_square(self) :
+        # square 2 x 2 with one side bulged out to a half circle
+        doc, msp = new_drawing()
+        msp.add_lwpolyline([(0, 0, 0), (2, 0, 1), (2, 2, 0), (0, 2, 0)], format = 'xyb', dxfattribs = {'closed' : True})
+        self.assertAlmostEqual(get_hatch_area(doc), 4 + pi / 2)
+
+    def test_nested_holes(self) :
+        # square 10 x 10, a 6 x 6 hole and a circle island inside the hole
+        doc, msp = new_drawing()
+        msp.add_lwpolyline([(0, 0), (10, 0), (10, 10), (0, 10)], dxfattribs = {'closed' : True})
+        msp.add_lwpolyline([(2, 2), (8, 2), (8, 8), (2, 8)], dxfattribs = {'closed' : True})
+        msp.add_circle((5, 5), 1)
+        self.assertAlmostEqual(get_hatch_area(doc), 100 - 36 + pi)
+
+    def test_duplicated_loops(self) :
+        # the same square drawn twice is filled once, not a square and its hole
+        for copy in ([(0, 0), (10, 0), (10, 10), (0, 10)], [(10, 10), (10, 0), (0, 0), (0, 10)]) :
+            doc, msp = new_drawing()
+            msp.add_lwpolyline([(0, 0), (10, 0), (10, 10), (0, 10)], dxfattribs = {'closed' : True})
+            msp.add_lwpolyline(copy, dxfattribs = {'closed' : True})
+            self.assertAlmostEqual(get_hatch_area(doc), 100)
+
+    def test_chained_lines(self) :
+        # loose lines in any direction are chained into a loop
+        doc, msp = new_drawing()
+        msp.add_line((0, 0), (4, 0))
+        msp.add_line((4, 3), (4, 0))
+        msp.add_line((4, 3), (0, 3))
+        msp.add_line((0, 0), (0, 3))
+        self.assertAlmostEqual(get_hatch_area(doc), 12)
+
+    def test_chained_line_arc(self) :
+        # slot: 4 x 2 rectangle with a half circle on each short side
+        doc, msp = new_drawing()
+        msp.add_line((0, 0), (4, 0))
+        msp.add_arc((4, 1), 1, -90, 90)
+        msp.add_line((4, 2), (0, 2))
+        msp.add_arc((0, 1), 1, 90, 270)
+        self.assertAlmostEqual(get_hatch_area(doc), 8 + pi)
+
+    def test_chained_half_ellipse(self) :
+        # half of an ellipse with axes 2 and 1, closed by its diameter
+        doc, msp = new_drawing()
+        msp.add_ellipse((0, 0), major_axis = (2, 0), ratio = 0.5, start_param = 0, end_param = pi)
+        msp.add_line((-2, 0), (2, 0))
+        self.assertAlmostEqual(get_hatch_area(doc), pi)
+
+    def test_open_chain(self) :
+        # lines that do not close are no area
+        doc, msp = new_drawing()
+        msp.add_line((0, 0), (4, 0))
+        msp.add_line((4, 0), (4, 3))
+        self.assertAlmostEqual(get_hatch_area(doc), 0)
+
+
+class JobQueueTests(TransactionTestCase) :
+    """ Database queue: claims, lost workers and deferred jobs. Committed rows, the workers are threads. """
+
+    def queued(self, **fields) :
+        return Job.objects.create(kind = 'dxf', url = 'https://example.com/files/a.dxf', **fields)
+
+    def test_claim_race(self) :
+        job = self.queued()
+        barrier = threading.Barrier(8)
+        claimed = []
+
+        def worker(k) :
+            barrier.wait()
+            try :
+                got = claim('worker-%d' % k)
+                if got is not None :
+                    claimed.append(got)
+            finally :
+                connection.close()
+
+        threads = [threading.Thread(target = worker, args = (k, )) for k in range(8)]
+        for thread in threads :
+            thread.start()
+        for thread in threads :
+            thread.join()
+
+        self.assertEqual([got.pk for got in claimed], [job.pk])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.worker), (Job.RUNNING, 1, claimed[0].worker))
+
+    def test_requeue_dead_worker(self) :
+        # a worker process of this host that is gone, e.g. killed by gunicorn
+        dead = self.queued(status = Job.RUNNING, worker = '%s:%d:job-worker-0' % (socket.gethostname(), dead_pid()),
+            started = timezone.now(), attempts = 1)
+        alive = self.queued(status = Job.RUNNING, worker = '%s:%d:job-worker-0' % (socket.gethostname(), os.getpid()),
+            started = timezone.now(), attempts = 1)
+        requeue_lost()
+        dead.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((dead.status, dead.worker), (Job.QUEUED, ''))
+        self.assertEqual(alive.status, Job.RUNNING)
+
+    def test_requeue_timed_out(self) :
+        # other hosts can't be checked, their jobs are lost after JOB_TIMEOUT, failed after JOB_MAX_ATTEMPTS
+        old = timezone.now() - timedelta(seconds = JOB_TIMEOUT + 1)
+        retry = self.queued(status = Job.RUNNING, worker = 'other-host:1:job-worker-0', started = old, attempts = 1)
+        spent = self.queued(status = Job.RUNNING, worker = 'other-host:1:job-worker-1', started = old, attempts = JOB_MAX_ATTEMPTS)
+        requeue_lost()
+        retry.refresh_from_db()
+        spent.refresh_from_db()
+        self.assertEqual(retry.status, Job.QUEUED)
+        self.assertEqual((spent.status, spent.error), (Job.FAILED, 'worker lost'))
+
+    def test_deferred_job_wakes_up(self) :
+        def pending(job) :
+            raise ConversionPending(60)
+
+        job = self.queued()
+        with mock.patch.dict(RUNNERS, {'dxf' : pending}) :
+            run(claim('worker-0'))
+        job.refresh_from_db()
+        # back in the queue without using up an attempt, not claimed before wake_at
+        self.assertEqual((job.status, job.worker, job.attempts), (Job.QUEUED, '', 0))
+        self.assertGreater(job.wake_at, timezone.now() + timedelta(seconds = 50))
+        self.assertIsNone(claim('worker-1'))
+
+        Job.objects.filter(pk = job.pk).update(wake_at = timezone.now() - timedelta(seconds = 1))
+        self.assertEqual(claim('worker-1').pk, job.pk)
+        job.refresh_from_db()
+        self.assertIsNone(job.wake_at)
+
+    def test_callback_wakes_deferred_job(self) :
+        job = self.queued(wake_at = timezone.now() + timedelta(seconds = 60))
+        self.assertIsNone(claim('worker-0'))
+        self.assertTrue(wake(job.pk))
+        self.assertEqual(claim('worker-0').pk, job.pk)
+        # only queued jobs are woken
+        self.assertFalse(wake(job.pk))
+
+    def test_wait(self) :
+        job = self.queued()
+        started = time.monotonic()
+        self.assertEqual(wait(job.pk, timeout = 0.2).status, Job.QUEUED)
+        self.assertLess(time.monotonic() - started, 2)
+
+        with mock.patch.dict(RUNNERS, {'dxf' : lambda job : '{"Width": 1}'}) :
+            run(claim('worker-0'))
+        done = wait(job.pk, timeout = 5)
+        self.assertEqual((done.status, done.result), (Job.DONE, '{"Width": 1}'))
+
+
+def dead_pid() :
+    # pid of a process that already exited
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def dxf_bytes(doc) :
+    out = io.StringIO()
+    doc.write(out)
+    return out.getvalue().encode('utf-8')
+
+
+@override_settings(AZURE_STORAGE_CONNECTION_STRING = 'memory://')
+class BatchTests(SimpleTestCase) :
+
+    def setUp(self) :
+        storage.reset()
+
+    @mock.patch.object(pyramid, 'RASTER_WORKERS', 2)
+    def test_tiled_batch(self) :
+        # the sources are computed in pool workers, their tiles must not go to the pool inherited from the parent
+        doc, msp = new_drawing()
+        for i in range(20) :
+            msp.add_line((i * 100, 0), (i * 100, 2000))
+            msp.add_circle((i * 100, 1000), 30)
+        urls = []
+        for name in ('a.dxf', 'b.dxf') :
+            storage.upload_blob(name, dxf_bytes(doc), 'files')
+            urls.append('https://example.com/files/' + name)
+
+        results = []
+        thread = threading.Thread(target = lambda : results.extend(process_batch(urls, tiles = True, workers = 2)), daemon = True)
+        thread.start()
+        thread.join(60)
+
+        self.assertFalse(thread.is_alive(), 'tiled batch hangs')
+        self.assertEqual(sorted(r["Source_Url"] for r in results), urls)
+        for result in results :
+            self.assertNotIn("Error", result)
+            self.assertTrue(result["Tiles_Url"])
+
+
+@override_settings(AZURE_STORAGE_CONNECTION_STRING = 'memory://')
+class StorageTests(SimpleTestCase) :
+
+    def setUp(self) :
+        storage.reset()
+
+    def test_upload_if_changed(self) :
+        self.assertTrue(storage.upload_if_changed('a.json', b'{"Width": 1}'))
+        self.assertFalse(storage.upload_if_changed('a.json', b'{"Width": 1}'))
+        self.assertTrue(storage.upload_if_changed('a.json', b'{"Width": 2}'))
+        self.assertEqual(storage.read_blob('a.json'), b'{"Width": 2}')
+
+
+class BlobServerTests(SimpleTestCase) :
+    """ Ranged GETs and staged blocks against the local stand-in of the blob service. """
+
+    def setUp(self) :
+        self.server = BlobServer(latency = 0.05).start()
+        self.addCleanup(self.server.stop)
+        overrides = override_settings(AZURE_STORAGE_CONNECTION_STRING = self.server.connection_string,
+            BLOB_CHUNK_SIZE = 64 * 1024, BLOB_SINGLE_SIZE = 64 * 1024)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.addCleanup(storage.reset)
+        storage.reset()
+        self.data = os.urandom(10 * 64 * 1024 + 123)
+
+    def recorded(self, method) :
+        """ Patch a handler method to record the requests and the most of them in flight at once. """
+        calls = []
+        flight = {'now' : 0, 'most' : 0}
+        lock = threading.Lock()
+        original = getattr(BlobHandler, method)
+
+        def recording(handler) :
+            with lock :
+                calls.append((handler.path, handler.headers.get('x-ms-range')))
+                flight['now'] += 1
+                flight['most'] = max(flight['most'], flight['now'])
+            try :
+                return original(handler)
+            finally :
+                with lock :
+                    flight['now'] -= 1
+
+        patcher = mock.patch.object(BlobHandler, method, recording)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return calls, flight
+
+    def test_chunked_upload(self) :
+        calls, flight = self.recorded('do_PUT')
+        storage.upload_blob('big.bin', self.data, concurrency = 4)
+        blocks = [path for path, _ in calls if 'blockid=' in path]
+        self.assertEqual(len(blocks), 11)
+        self.assertGreater(flight['most'], 1)
+        self.assertEqual(self.server.blobs[(storage.BLOB_CONTAINER, 'big.bin')].data, self.data)
+
+    def test_ranged_download(self) :
+        storage.upload_blob('big.bin', self.data)
+        calls, flight = self.recorded('do_GET')
+        stream = io.BytesIO()
+        self.assertEqual(storage.download_blob('big.bin', stream, concurrency = 4), len(self.data))
+        self.assertEqual(stream.getvalue(), self.data)
+        self.assertEqual(len(calls), 11)
+        self.assertTrue(all(rng for _, rng in calls))
+        self.assertGreater(flight['most'], 1)
+
+    def test_chunked_upload_if_changed(self) :
+        # the md5 of a blob staged in blocks is kept too, the same bytes are not sent again
+        self.assertTrue(storage.upload_if_changed('big.bin', self.data))
+        self.assertFalse(storage.upload_if_changed('big.bin', self.data))
+        self.assertTrue(storage.upload_if_changed('big.bin', self.data[::-1]))
+        self.assertEqual(storage.read_blob('big.bin'), self.data[::-1])
+
+
+@override_settings(AZURE_STORAGE_CONNECTION_STRING = 'memory://')
+class ResultCacheTests(TestCase) :
+
+    def setUp(self) :
+        storage.reset()
+        cache.results.clear()
+        doc, msp = new_drawing()
+        msp.add_lwpolyline([(0, 0), (10, 0), (10, 10), (0, 10)], dxfattribs = {'closed' : True})
+        storage.upload_blob('a.dxf', dxf_bytes(doc), 'files')
+        self.url = 'https://example.com/files/a.dxf'
+
+    def test_failed_upload_not_cached(self) :
+        upload = storage.upload_if_changed
+
+        def failing(blob_name, *args, **kwargs) :
+            if blob_name.endswith('.svg') :
+                raise OSError('connection reset')
+            return upload(blob_name, *args, **kwargs)
+
+        key = readFile.resultKey(self.url, False)
+        with mock.patch.object(storage, 'upload_if_changed', failing) :
+            with self.assertRaises(OSError) :
+                readFile.cachedInit(self.url, False)
+        self.assertIsNone(cache.get_result(key))
+
+        data = json.loads(readFile.cachedInit(self.url, False))
+        self.assertTrue(storage.blob_exists(data["Uploaded_Url"].split("/")[-1], 'files'))
+        self.assertEqual(cache.get_result(key), json.dumps(data))
+
+
+class SingleFlightTests(SimpleTestCase) :
+
+    def test_leader_error_shared(self) :
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def compute() :
+            calls.append(1)
+            release.wait(10)
+            raise ValueError('bad drawing')
+
+        errors = []
+
+        def caller() :
+            try :
+                flight.do('a', compute)
+            except ValueError as exc :
+                errors.append(exc)
+
+        threads = [threading.Thread(target = caller) for _ in range(4)]
+        threads[0].start()
+        while not calls :
+            time.sleep(0.01)
+        for thread in threads[1:] :
+            thread.start()
+        # the followers wait on the leader before it fails
+        while flight.in_flight().get('a') != 3 :
+            time.sleep(0.01)
+        release.set()
+        for thread in threads :
+            thread.join(10)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(errors), 4)
+        self.assertTrue(all(exc is errors[0] for exc in errors))
+        self.assertEqual(flight.in_flight(), {})
+        # the failed call is forgotten, the next one runs again
+        self.assertEqual(flight.do('a', lambda : 'ok'), 'ok')
+
+    def test_file_lock(self) :
+        lock_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(lock_dir.cleanup)
+        with mock.patch.object(singleflight, 'FLIGHT_LOCK_DIR', lock_dir.name) :
+            with file_lock('a') as held :
+                self.assertTrue(held)
+                # flock is per open file, a second open of the lock file waits like another worker would
+                started = time.monotonic()
+                with file_lock('a', timeout = 0.2) as other :
+                    self.assertFalse(other)
+                self.assertGreaterEqual(time.monotonic() - started, 0.2)
+            with file_lock('a', timeout = 0.2) as held :
+                self.assertTrue(held)
+
+
+class LruCacheTests(SimpleTestCase) :
+
+    def test_evicts_least_recently_used(self) :
+        lru = LruCache(max_entries = 2, max_bytes = 100, max_age = None)
+        lru.put('a', 'x')
+        lru.put('b', 'x')
+        self.assertEqual(lru.get('a'), 'x')
+        lru.put('c', 'x')
+        # b was the least recently used, a was read after it
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual((lru.get('a'), lru.get('c')), ('x', 'x'))
+        self.assertEqual(lru.stats()["evictions"], 1)
+
+    def test_evicts_by_size(self) :
+        lru = LruCache(max_entries = 10, max_bytes = 10, max_age = None)
+        lru.put('a', '1234')
+        lru.put('b', '1234')
+        lru.put('c', '1234')
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(lru.stats()["bytes"], 8)
+        # larger than the whole cache is never kept
+        lru.put('d', '12345678901')
+        self.assertIsNone(lru.get('d'))
+        self.assertEqual(len(lru), 2)
+
+    def test_expires_by_age(self) :
+        lru = LruCache(max_entries = 10, max_bytes = 100, max_age = 0.1)
+        lru.put('a', 'x')
+        self.assertEqual(lru.get('a'), 'x')
+        time.sleep(0.2)
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual((lru.stats()["expirations"], len(lru)), (1, 0))
+
+
+@mock.patch.object(readFile, 'CONVERT_POLL', 0.05)
+class ConvertAiTests(SimpleTestCase) :
+    """ convertAi through the conversion cache, against the local stand-in of CloudConvert. """
+
+    def setUp(self) :
+        doc, msp = new_drawing()
+        msp.add_line((0, 0), (10, 0))
+        self.dxf = dxf_bytes(doc)
+        self.fake = FakeCloudConvert(self.dxf, delay = 0.3).start()
+        self.addCleanup(self.fake.stop)
+        overrides = override_settings(AZURE_STORAGE_CONNECTION_STRING = 'memory://', CLOUDCONVERT_API_KEY = 'test',
+            CLOUDCONVERT_ENDPOINT = self.fake.endpoint)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        storage.reset()
+
+        source = b'%PDF-1.5 drawing'
+        storage.upload_blob('a.ai', source, 'files')
+        self.url = 'https://example.com/files/a.ai'
+        self.converted = 'converted/%s.dxf' % hashlib.md5(source).hexdigest()
+        self.marker = 'converted/%s.json' % hashlib.md5(source).hexdigest()
+
+    def test_pending_resumes(self) :
+        with self.assertRaises(ConversionPending) :
+            readFile.convertAi(self.url, wait = False)
+        self.assertTrue(storage.blob_exists(self.marker, 'files'))
+
+        # polled again while it runs: the same process, the file is not sent twice
+        deadline = time.monotonic() + 10
+        while True :
+            try :
+                converted = readFile.convertAi(self.url, wait = False)
+                break
+            except ConversionPending :
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.05)
+        self.assertEqual(converted, self.converted)
+        self.assertEqual(len(self.fake.uploads), 1)
+        self.assertEqual(storage.read_blob(converted, 'files'), self.dxf)
+        self.assertFalse(storage.blob_exists(self.marker, 'files'))
+
+    def test_cached_conversion(self) :
+        self.assertEqual(readFile.convertAi(self.url), self.converted)
+        self.assertEqual(readFile.convertAi(self.url), self.converted)
+        self.assertEqual(readFile.convertAi(self.url, wait = False), self.converted)
+        self.assertEqual(len(self.fake.uploads), 1)
+
+    def test_failure_drops_marker(self) :
+        self.fake.fail = True
+        with self.assertRaises(ConversionFailed) :
+            readFile.convertAi(self.url)
+        self.assertFalse(storage.blob_exists(self.marker, 'files'))
+        self.assertFalse(storage.blob_exists(self.converted, 'files'))
+
+        # the next call starts a new conversion instead of resuming the failed one
+        self.fake.fail = False
+        self.assertEqual(readFile.convertAi(self.url), self.converted)
+        self.assertEqual(len(self.fake.uploads), 2)
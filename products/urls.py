@@ -5,4 +5,9 @@ from . import views
 urlpatterns = [
     path('', views.home, name = 'home'),
     path('getdxf', views.getdxf, name = 'getdxf'),
+    path('getframes', views.getframes, name = 'getframes'),
+    path('batch', views.batch, name = 'batch'),
+    path('jobs', views.jobs, name = 'jobs'),
+    path('jobs/<uuid:id>', views.job, name = 'job'),
+    path('cloudconvert/callback/<uuid:id>', views.cloudconvert_callback, name = 'cloudconvert_callback'),
 ]
\ No newline at end of file
@@ -1,20 +1,101 @@
 # -*- coding: utf-8 -*-
+import json
+
 from django.views.generic import ListView, DetailView 
 from django.contrib.messages.views import SuccessMessageMixin
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.urls import reverse_lazy
 
 from django.shortcuts import render
 from django.http import JsonResponse
-from .dxfapi import getJsonData
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.utils.cache import get_conditional_response
+from django.conf import settings
+from .dxfapi import getFramesJsonData
+from .readFile import cacheKey
+from .cache import get_result, result_etag
+from .jobs import submit, submit_once, wait, wake, job_data, RUNNERS
+from .batch import ndjson_batch, BATCH_MAX_URLS
+from .models import Job
 
 def home(request):
 
     return render(request, 'products/index.html', {'foo': 'bar', })
 
+def cacheable(response, etag):
+    if etag:
+        response['ETag'] = etag
+        response['Cache-Control'] = getattr(settings, 'GETDXF_CACHE_CONTROL', 'public, max-age=0, must-revalidate')
+    return response
+
 def getdxf(request):
     id = request.GET.get('url')
-    res = getJsonData(id)
+    tiles = request.GET.get('tiles') in ('1', 'true') or None
+    # source blob version, pipeline version and options make the ETag, known without computing
+    key = cacheKey(id, tiles)
+    etag = result_etag(key) if key else None
+    if etag:
+        not_modified = get_conditional_response(request, etag = etag)
+        if not_modified is not None:
+            return cacheable(not_modified, etag)
+    # a drawing already computed in this version is answered without download or parsing
+    cached = get_result(key) if key else None
+    if cached is not None:
+        return cacheable(HttpResponse(cached, content_type="application/json"), etag)
+    # runs as a queued job, the request only waits for it; identical requests share the job
+    job = wait(submit_once('dxf', id, tiles = tiles, key = key).pk)
+    if job.status == Job.DONE:
+        return cacheable(HttpResponse(job.result, content_type="application/json"), etag)
+    return JsonResponse(job_data(job), status = 500 if job.status == Job.FAILED else 202)
+
+def getframes(request):
+    id = request.GET.get('url')
+    with_metrics = request.GET.get('metrics') in ('1', 'true')
+    res = getFramesJsonData(id, with_metrics)
     return HttpResponse(res, content_type="application/json")
-    
\ No newline at end of file
+    
+
+@csrf_exempt
+@require_POST
+def jobs(request):
+    id = request.POST.get('url') or request.GET.get('url')
+    kind = request.POST.get('kind') or request.GET.get('kind') or 'dxf'
+    if not id or kind not in RUNNERS:
+        return JsonResponse({"error": "url and a kind of %s required" % ', '.join(RUNNERS)}, status = 400)
+    flags = dict(request.GET.items(), **request.POST.dict())
+    if kind == 'dxf':
+        job = submit(kind, id, tiles = flags.get('tiles') in ('1', 'true') or None)
+    else:
+        job = submit(kind, id, metrics = flags.get('metrics') in ('1', 'true'))
+    return JsonResponse(job_data(job), status = 202)
+
+@csrf_exempt
+def cloudconvert_callback(request, id):
+    # CloudConvert finished the conversion a deferred job waits for
+    return JsonResponse({"woken": wake(id)})
+
+def job(request, id):
+    try:
+        job = Job.objects.get(pk = id)
+    except Job.DoesNotExist:
+        return JsonResponse({"error": "no such job"}, status = 404)
+    return JsonResponse(job_data(job))
+
+@csrf_exempt
+@require_POST
+def batch(request):
+    # JSON body {"urls": [...], "tiles": false} or repeated url fields
+    if request.content_type == 'application/json':
+        try:
+            body = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({"error": "invalid JSON body"}, status = 400)
+        urls, tiles = body.get('urls') or [], body.get('tiles')
+    else:
+        urls = request.POST.getlist('url') or request.GET.getlist('url')
+        tiles = (request.POST.get('tiles') or request.GET.get('tiles')) in ('1', 'true') or None
+    if not urls or not isinstance(urls, list) or len(urls) > BATCH_MAX_URLS:
+        return JsonResponse({"error": "1 to %d urls required" % BATCH_MAX_URLS}, status = 400)
+    return StreamingHttpResponse(ndjson_batch(urls, tiles), content_type = "application/x-ndjson")